@@ -0,0 +1,134 @@
+""" module for spreading inventory polls over several twickets accounts """
+
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterator, List, Mapping, Optional, Tuple
+
+from scheduler import PollScheduler
+from tokenmanager import TokenManager
+
+ROUND_ROBIN = "round_robin"
+LEAST_RECENTLY_BLOCKED = "least_recently_blocked"
+STRATEGIES = (ROUND_ROBIN, LEAST_RECENTLY_BLOCKED)
+
+
+def parse_accounts(environ: Mapping[str, str] = os.environ) -> List[Tuple[str, Optional[str], Optional[str]]]:
+    """
+    (name, email, password) of every configured account. The first is TWICKETS_EMAIL and
+    TWICKETS_PASSWORD, then TWICKETS_EMAIL_2 and TWICKETS_PASSWORD_2 and so on up to the
+    first number without both set.
+    """
+    accounts = [("1", environ.get("TWICKETS_EMAIL"), environ.get("TWICKETS_PASSWORD"))]
+    number = 2
+    while environ.get(f"TWICKETS_EMAIL_{number}") and environ.get(f"TWICKETS_PASSWORD_{number}"):
+        accounts.append((str(number), environ[f"TWICKETS_EMAIL_{number}"], environ[f"TWICKETS_PASSWORD_{number}"]))
+        number += 1
+    return accounts
+
+
+def account_token_file(path: str, name: str) -> str:
+    """Token file of an extra account, next to the primary's, e.g. session_token_2.json."""
+    root, ext = os.path.splitext(path)
+    return f"{root}_{name}{ext}"
+
+
+@dataclass(eq=False)
+class Account:
+    """One login with its own session token and, once polling starts, its own PollScheduler rate budget."""
+    name: str
+    email: Optional[str]
+    tokens: TokenManager
+    scheduler: Optional[PollScheduler] = None
+    polls: int = 0
+    blocks: int = 0
+    last_used: float = float("-inf")
+    last_blocked: float = float("-inf")
+
+    def require_scheduler(self) -> PollScheduler:
+        """The account's scheduler, which TwicketsClient.new_scheduler sets before polling starts."""
+        if self.scheduler is None:
+            raise RuntimeError(f"Account {self.name} has no scheduler, call TwicketsClient.new_scheduler before polling")
+        return self.scheduler
+
+    def backoff_remaining(self) -> float:
+        """Seconds until this account may poll again after a block, 0 when it is free."""
+        return self.scheduler.backoff_remaining() if self.scheduler is not None else 0.0
+
+
+class AccountPool:
+    """
+    Picks the account for each inventory poll. Accounts backing off a block are passed
+    over while any other is free. Among the free ones round_robin takes turns, and
+    least_recently_blocked prefers the account whose last block is oldest, then the one
+    idle longest. When every account is backing off, the one whose pause ends first is
+    picked and its scheduler makes the caller wait.
+    """
+
+    def __init__(self, accounts: List[Account], strategy: str = ROUND_ROBIN, clock: Callable[[], float] = time.time):
+        if not accounts:
+            raise ValueError("At least one account is required")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Account strategy must be one of {STRATEGIES}, not {strategy}")
+        self.accounts = accounts
+        self.strategy = strategy
+        self.clock = clock
+        self._turn = 0
+
+    def __iter__(self) -> Iterator[Account]:
+        return iter(self.accounts)
+
+    def __len__(self) -> int:
+        return len(self.accounts)
+
+    @property
+    def primary(self) -> Account:
+        """The TWICKETS_EMAIL account, whose scheduler also paces the polls."""
+        return self.accounts[0]
+
+    def available(self) -> List[Account]:
+        """Accounts not backing off a block."""
+        return [account for account in self.accounts if account.backoff_remaining() <= 0]
+
+    def backoff_remaining(self) -> float:
+        """Seconds until any account may poll again, 0 while one is free."""
+        return min(account.backoff_remaining() for account in self.accounts)
+
+    def acquire(self) -> Account:
+        """The account to send the next poll with."""
+        candidates = self.available()
+        if not candidates:
+            account = min(self.accounts, key=Account.backoff_remaining)
+        elif self.strategy == LEAST_RECENTLY_BLOCKED:
+            account = min(candidates, key=lambda candidate: (candidate.last_blocked, candidate.last_used))
+        else:
+            # the next free account at or after the turn, so a blocked one is skipped rather than retried
+            order = self.accounts[self._turn:] + self.accounts[:self._turn]
+            account = next(candidate for candidate in order if candidate in candidates)
+            self._turn = (self.accounts.index(account) + 1) % len(self.accounts)
+        account.polls += 1
+        account.last_used = self.clock()
+        return account
+
+    def record_blocked(self, account: Account, status: Optional[int] = None, retry_after: Optional[float] = None) -> float:
+        """Back off one account after a rejected request, returning its pause. It logs in again when next used."""
+        account.blocks += 1
+        account.last_blocked = self.clock()
+        delay = account.require_scheduler().record_blocked(status, retry_after)
+        account.tokens.invalidate()
+        logging.info("Account %s blocked, %s of %s accounts still free", account.name, len(self.available()), len(self))
+        return delay
+
+    def exhausted(self, max_retries: int) -> bool:
+        """True once every account has been blocked more than max_retries times in a row."""
+        return all(account.scheduler is not None and account.scheduler.blocks > max_retries for account in self.accounts)
+
+    def start(self):
+        """Keep every account's token refreshed in the background."""
+        for account in self.accounts:
+            account.tokens.start()
+
+    def stop(self):
+        for account in self.accounts:
+            account.tokens.stop()
@@ -0,0 +1,66 @@
+""" module for spotting inventory responses that have not changed since the last poll """
+
+import hashlib
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+from transport import TransportResponse
+
+# the envelope carries the server time, which changes on every response even when the listings do not
+CLOCK_FIELD = re.compile(rb'"clock"\s*:\s*"[^"]*"')
+
+
+@dataclass
+class UnchangedListings:
+    """Cheap result returned instead of a TicketAlertResponse when nothing changed."""
+    event_id: str
+    not_modified: bool = False  # True if the server answered 304, False if the body hash matched
+
+
+def listing_digest(body: bytes) -> bytes:
+    """Hash of a raw inventory body, ignoring the clock field."""
+    return hashlib.blake2b(CLOCK_FIELD.sub(b"", body, count=1), digest_size=16).digest()
+
+
+class ListingChangeDetector:
+    """
+    Remembers the last inventory response for one event. Sends ETag/Last-Modified
+    validators back when the upstream supplied them, and otherwise compares a hash of
+    the raw body so parsing can be skipped for byte-identical listing sets.
+    """
+
+    def __init__(self):
+        self.digest: Optional[bytes] = None
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.unchanged = 0
+        self.changed = 0
+
+    def conditional_headers(self) -> dict:
+        """Validators to add to the next request for this event."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def is_unchanged(self, response: TransportResponse) -> bool:
+        """Check a 200 or 304 response against the previous one and remember it."""
+        if response.status == 304:
+            self.unchanged += 1
+            return True
+        self.etag = response.headers.get("etag") or self.etag
+        self.last_modified = response.headers.get("last-modified") or self.last_modified
+        digest = listing_digest(response.body)
+        if digest == self.digest:
+            self.unchanged += 1
+            return True
+        self.digest = digest
+        self.changed += 1
+        return False
+
+    def reset(self):
+        """Forget the last response so the next one is always parsed."""
+        self.digest = self.etag = self.last_modified = None
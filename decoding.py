@@ -0,0 +1,57 @@
+""" module for decoding inventory bodies straight from the response bytes """
+
+import json
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from ticketalertresponse import TicketAlertResponse
+
+Decode = Callable[[bytes], Any]
+
+
+def _orjson() -> Decode:
+    import orjson  # pylint: disable=import-outside-toplevel
+    return orjson.loads
+
+
+def _msgspec() -> Decode:
+    import msgspec  # pylint: disable=import-outside-toplevel
+    return msgspec.json.Decoder().decode
+
+
+def _stdlib() -> Decode:
+    # json.loads detects the encoding of bytes itself, so there is no separate decode() copy to make
+    return json.loads
+
+
+# fastest first, json is always available
+DECODERS: Dict[str, Callable[[], Decode]] = {"orjson": _orjson, "msgspec": _msgspec, "json": _stdlib}
+
+
+def load_decoder(name: Optional[str] = None) -> Tuple[str, Decode]:
+    """
+    The TWICKETS_JSON_DECODER backend, or the fastest installed one when name is empty
+    or "auto". A named backend that is not installed falls back to the stdlib decoder.
+    """
+    if name and name != "auto":
+        if name not in DECODERS:
+            raise ValueError(f"Unknown JSON decoder {name}, expected one of {', '.join(DECODERS)}")
+        try:
+            return name, DECODERS[name]()
+        except ImportError:
+            logging.warning("JSON decoder %s is not installed, using json", name)
+            return "json", _stdlib()
+    for candidate, factory in DECODERS.items():
+        try:
+            return candidate, factory()
+        except ImportError:
+            continue
+    return "json", _stdlib()
+
+
+def decode_inventory(body: bytes, decode: Decode = json.loads, lazy: bool = True) -> TicketAlertResponse:
+    """
+    Parse an inventory body into a TicketAlertResponse. With lazy=True each listing
+    only validates the fields matching reads, so the decoded tree is walked once.
+    """
+    return TicketAlertResponse.from_dict(decode(body), lazy=lazy)
@@ -0,0 +1,104 @@
+""" module for turning successive inventory responses into listed, delisted and price change events """
+
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from ticketalertresponse import AnyResponseDatum, TicketAlertResponse
+
+LISTED = "listed"
+DELISTED = "delisted"
+PRICE_DROPPED = "price_dropped"
+QUANTITY_CHANGED = "quantity_changed"
+KINDS = (LISTED, DELISTED, PRICE_DROPPED, QUANTITY_CHANGED)
+
+
+@dataclass(slots=True)
+class ListingEvent:
+    """One change to a listing between two polls of an event. Prices are per ticket, in pence."""
+    kind: str
+    event_id: str
+    listing_id: str
+    listing: Optional[AnyResponseDatum]  # None once delisted
+    previous_price: Optional[float] = None
+    price: Optional[float] = None
+    previous_quantity: Optional[int] = None
+    quantity: Optional[int] = None
+
+    @property
+    def url_id(self) -> str:
+        """Extracts the part after '@' in the listing id if present."""
+        return self.listing_id.split('@')[1] if '@' in self.listing_id else ''
+
+
+Subscriber = Callable[[ListingEvent], None]
+
+
+def _snapshot(item: AnyResponseDatum) -> Tuple[int, ...]:
+    return item.ticket_prices("net_selling_price")
+
+
+def _unit_price(prices: Tuple[int, ...]) -> float:
+    return sum(prices) / len(prices) if prices else 0.0
+
+
+class ListingDiffer:
+    """
+    Keeps the per ticket prices of every listing in the last response of each event,
+    keyed by listing id, and compares the next response against them in one pass.
+    Each resulting event goes to the subscribers of its kind. The first response of
+    an event only sets the baseline, new listings in it are left to process_ticket_alert.
+    """
+
+    def __init__(self):
+        self._snapshots: Dict[str, Dict[str, Tuple[int, ...]]] = {}
+        self._subscribers: List[Tuple[FrozenSet[str], Subscriber]] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, subscriber: Subscriber, kinds: Optional[Iterable[str]] = None):
+        """Call subscriber with every event of the given kinds, all kinds by default."""
+        kinds = frozenset(kinds or KINDS)
+        unknown = kinds - set(KINDS)
+        if unknown:
+            raise ValueError(f"Unknown listing event kinds {sorted(unknown)}")
+        self._subscribers.append((kinds, subscriber))
+
+    def diff(self, event_id: str, response: TicketAlertResponse) -> List[ListingEvent]:
+        """Compare response with the event's previous one, publishing and returning the changes."""
+        current = {item.id: (item, _snapshot(item)) for item in response.response_data}
+        with self._lock:
+            previous = self._snapshots.get(event_id)
+            self._snapshots[event_id] = {listing_id: prices for listing_id, (_, prices) in current.items()}
+        if previous is None:
+            return []
+        events = []
+        for listing_id, (item, prices) in current.items():
+            old = previous.pop(listing_id, None)
+            if old is None:
+                events.append(ListingEvent(LISTED, event_id, listing_id, item,
+                                           price=_unit_price(prices), quantity=len(prices)))
+            elif old != prices:
+                old_price, new_price = _unit_price(old), _unit_price(prices)
+                if new_price < old_price:
+                    events.append(ListingEvent(PRICE_DROPPED, event_id, listing_id, item,
+                                               old_price, new_price, len(old), len(prices)))
+                if len(old) != len(prices):
+                    events.append(ListingEvent(QUANTITY_CHANGED, event_id, listing_id, item,
+                                               old_price, new_price, len(old), len(prices)))
+        # whatever is left in previous was not in this response
+        for listing_id, old in previous.items():
+            events.append(ListingEvent(DELISTED, event_id, listing_id, None,
+                                       previous_price=_unit_price(old), previous_quantity=len(old)))
+        self.publish(events)
+        return events
+
+    def publish(self, events: Iterable[ListingEvent]):
+        """Hand each event to the subscribers of its kind, a failing subscriber does not stop the rest."""
+        for event in events:
+            for kinds, subscriber in self._subscribers:
+                if event.kind in kinds:
+                    try:
+                        subscriber(event)
+                    except Exception:
+                        logging.exception("Listing event subscriber failed on %s %s", event.kind, event.listing_id)
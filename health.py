@@ -0,0 +1,113 @@
+""" module for kubernetes liveness and readiness probes and the stuck request watchdog """
+
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional, Tuple
+
+from transport import ConnectionPool
+
+
+class HealthState:
+    """
+    Liveness is the age of the last successful poll, so a loop stuck in a blocking call
+    fails its probe and gets restarted. Deliberate pauses, such as the backoff after a
+    403, count as progress so the pod is not restarted into the same shutout. Readiness
+    is true once a poll has succeeded, and false again while backing off.
+    """
+
+    def __init__(self, max_age: float = 300, startup_grace: float = 120, clock: Callable[[], float] = time.monotonic):
+        self.max_age = max_age
+        self.clock = clock
+        self.started = clock()
+        self.startup_grace = startup_grace
+        self.last_success: Optional[float] = None
+        self.paused_until = 0.0
+        self.ready = False
+
+    def record_success(self):
+        """A poll got a usable answer."""
+        self.last_success = self.clock()
+        self.ready = True
+
+    def pause(self, seconds: float):
+        """The bot is about to sleep on purpose, e.g. while blocked."""
+        self.paused_until = max(self.paused_until, self.clock() + seconds)
+        self.ready = False
+
+    def liveness(self) -> Tuple[bool, dict]:
+        now = self.clock()
+        last_progress = max(self.last_success or self.started + self.startup_grace, self.paused_until)
+        age = max(0.0, now - last_progress)
+        return age <= self.max_age, {
+            "last_success_age": None if self.last_success is None else round(now - self.last_success, 3),
+            "paused_for": round(max(0.0, self.paused_until - now), 3),
+        }
+
+    def readiness(self) -> Tuple[bool, dict]:
+        return self.ready, {"ready": self.ready}
+
+
+class Watchdog:
+    """Background thread aborting pooled requests that run past request_timeout."""
+
+    def __init__(self, transport: ConnectionPool, request_timeout: float, interval: float = 1.0):
+        self.transport = transport
+        self.request_timeout = request_timeout
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="request-watchdog", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            aborted = self.transport.abort_stuck(self.request_timeout)
+            if aborted:
+                logging.warning("Watchdog aborted %s request(s) running longer than %ss", aborted, self.request_timeout)
+
+    def stop(self):
+        self._stop.set()
+
+
+def start_health_server(state: HealthState, port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve /healthz (liveness) and /readyz (readiness) from a background thread."""
+
+    class HealthHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            pass
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            path = self.path.split("?")[0]
+            if path == "/healthz":
+                ok, detail = state.liveness()
+            elif path == "/readyz":
+                ok, detail = state.readiness()
+            else:
+                self.send_error(404)
+                return
+            body = json.dumps(detail | {"ok": ok}).encode()
+            self.send_response(200 if ok else 503)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), HealthHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="health-server", daemon=True).start()
+    logging.info("Serving health probes on port %s", server.server_address[1])
+    return server
+
+
+def start_health_server_from_env(state: HealthState) -> Optional[ThreadingHTTPServer]:
+    """Start the probe endpoints if TWICKETS_HEALTH_PORT is set."""
+    port = os.getenv("TWICKETS_HEALTH_PORT")
+    return start_health_server(state, int(port)) if port else None
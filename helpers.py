@@ -3,27 +3,43 @@
 from time import sleep
 import os
 import logging
-import requests
 import json
+import signal
+import threading
 from pathlib import Path
-from deepdiff import DeepDiff
 
+# requests and deepdiff are imported where they are used, so the bot starts without paying for them
 logging.captureWarnings(True)
-logging.basicConfig(level=logging.DEBUG)
 
 class NotTwoHundredStatusError(Exception):
     """Twickets sometimes throws errors due to cloudflare rate limiting, want to capture this as an exception"""
-    def __init__(self, message):
+    def __init__(self, message, status=None, retry_after=None):
         super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+class TerminatedError(Exception):
+    """Raised in the main thread on SIGTERM, so the bot flushes its notified ids before the pod is killed"""
+
+def raise_on_sigterm() -> bool:
+    """Turn SIGTERM into TerminatedError, only possible from the main thread."""
+    if threading.current_thread() is not threading.main_thread():
+        return False
+    def terminate(signum, frame):
+        raise TerminatedError("Received SIGTERM")
+    signal.signal(signal.SIGTERM, terminate)
+    return True
 
 class ProwlNoticationsClient:
     
     def __init__(self):
         self.prowl_api_key = os.getenv("PROWL_API_KEY")
+        self.prowl_url = os.getenv("PROWL_API_URL", "https://api.prowlapp.com/publicapi/add")
 
     def send_notification(self, message):
         """ send a prowl notification """
-        prowl_url = "https://api.prowlapp.com/publicapi/add"
+        import requests  # pylint: disable=import-outside-toplevel
+        prowl_url = self.prowl_url
         data = {
             "apikey": self.prowl_api_key,
             "application": "TwicketsBot",
@@ -35,6 +51,7 @@ class ProwlNoticationsClient:
 
 def compare_json_files(path1: str, path2: str):
     """Compares two JSON files and returns True if they match, otherwise False."""
+    from deepdiff import DeepDiff  # pylint: disable=import-outside-toplevel  # dev only, see requirements-dev.txt
     print("Comparing files")
     file1, file2 = Path(path1), Path(path2)
 
@@ -0,0 +1,122 @@
+""" module for keeping every listing seen, with its prices and when it was listed, for later analysis """
+
+import json
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from ticketalertresponse import TicketAlertResponse
+
+
+class ListingHistory:
+    """
+    Each distinct listing the bot has polled, keyed by its id, in a SQLite file. A
+    listing's fields and per ticket prices are written once, when it is first seen.
+    After that each poll only moves last_seen forward. Unchanged polls call touch(),
+    which extends every listing in the event's last recorded set without parsing
+    anything, so last_seen - first_seen is how long the listing stayed up to within
+    one poll interval.
+    """
+
+    def __init__(self, path: str, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._known: Dict[str, set] = {}  # event id -> ids in the last recorded response
+        self._last_recorded: Dict[str, float] = {}
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS listings (
+                id TEXT PRIMARY KEY,
+                event_id TEXT NOT NULL,
+                area TEXT,
+                section TEXT,
+                tickets INTEGER NOT NULL,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS prices (
+                listing_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                label TEXT NOT NULL,
+                currency_code TEXT,
+                face_value INTEGER,
+                net_selling_price INTEGER,
+                PRIMARY KEY (listing_id, position)
+            );
+            CREATE INDEX IF NOT EXISTS listings_event ON listings (event_id, last_seen);
+            CREATE INDEX IF NOT EXISTS prices_label ON prices (label);
+        """)
+
+    def record(self, event_id: str, response: TicketAlertResponse, seen_at: Optional[float] = None) -> int:
+        """Store the listings of a changed response. Returns how many had not been seen before."""
+        seen_at = self.clock() if seen_at is None else seen_at
+        ids = {item.id for item in response.response_data}
+        with self._lock:
+            known = self._known.get(event_id, set())
+            previous = self._last_recorded.get(event_id)
+            fresh = [item for item in response.response_data if item.id not in known]
+            self._db.execute("BEGIN")
+            try:
+                if previous is not None:
+                    # extend the last recorded set in one statement, then put back the few that went
+                    self._db.execute("UPDATE listings SET last_seen = ? WHERE event_id = ? AND last_seen = ?",
+                                     (seen_at, event_id, previous))
+                    self._db.executemany("UPDATE listings SET last_seen = ? WHERE id = ?",
+                                         ((previous, id) for id in known - ids))
+                inserted = 0
+                for item in fresh:
+                    cursor = self._db.execute(
+                        "INSERT INTO listings (id, event_id, area, section, tickets, first_seen, last_seen, data) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(id) DO NOTHING",
+                        (item.id, event_id, item.area, item.section, item.number_of_tickets, seen_at, seen_at,
+                         json.dumps(item.to_dict(), separators=(",", ":"))))
+                    if cursor.rowcount == 1:
+                        inserted += 1
+                        self._db.executemany(
+                            "INSERT OR IGNORE INTO prices VALUES (?, ?, ?, ?, ?, ?)",
+                            [(item.id, position, price.label, price.currency_code, price.face_value,
+                              price.net_selling_price) for position, price in enumerate(item.pricing.prices)])
+                    else:
+                        # seen before this process started
+                        self._db.execute("UPDATE listings SET last_seen = ? WHERE id = ?", (seen_at, item.id))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._known[event_id] = ids
+            self._last_recorded[event_id] = seen_at
+        return inserted
+
+    def touch(self, event_id: str, seen_at: Optional[float] = None):
+        """The event's listings are unchanged since the last record, so they are all still up."""
+        seen_at = self.clock() if seen_at is None else seen_at
+        with self._lock:
+            previous = self._last_recorded.get(event_id)
+            if previous is None:
+                return
+            self._db.execute("UPDATE listings SET last_seen = ? WHERE event_id = ? AND last_seen = ?",
+                             (seen_at, event_id, previous))
+            self._last_recorded[event_id] = seen_at
+
+    def listing_times(self, label: Optional[str] = None) -> Iterator[Tuple[float, float]]:
+        """(first_seen, last_seen) of every listing, or those with a ticket of label."""
+        if label is None:
+            return self._db.execute("SELECT first_seen, last_seen FROM listings")
+        return self._db.execute(
+            "SELECT first_seen, last_seen FROM listings WHERE id IN (SELECT listing_id FROM prices WHERE label = ?)",
+            (label,))
+
+    def ticket_prices(self, field: str = "net_selling_price") -> Iterator[Tuple[str, int]]:
+        """(label, price) of every ticket ever listed, field being net_selling_price or face_value."""
+        if field not in ("net_selling_price", "face_value"):
+            raise ValueError(f"Unknown price field {field}")
+        return self._db.execute(f"SELECT label, {field} FROM prices WHERE {field} IS NOT NULL")
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+
+    def close(self):
+        self._db.close()
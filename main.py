@@ -3,21 +3,38 @@
 from time import sleep
 from datetime import datetime, timedelta
 import socket
+import functools
 import os
+import threading
 import logging
 import http.client
 import time
-import random
 import json
 import sys
-from typing import Optional
-from helpers import NotTwoHundredStatusError, ProwlNoticationsClient
+from typing import Dict, List, Optional, Union
+from urllib.parse import urlparse
+from accounts import Account, AccountPool, ROUND_ROBIN, account_token_file, parse_accounts
+from changedetection import ListingChangeDetector, UnchangedListings
+from decoding import decode_inventory, load_decoder
+from diffing import LISTED, PRICE_DROPPED, ListingDiffer, ListingEvent
+from health import HealthState, Watchdog, start_health_server_from_env
+from helpers import NotTwoHundredStatusError, ProwlNoticationsClient, TerminatedError, raise_on_sigterm
+from history import ListingHistory
+from matching import load_matcher_from_env, set_matcher
+import metrics
+from notifications import Notification, NotificationDispatcher
+from notifiedstore import NotifiedIdBackend, NotifiedIdStore, claim_id, open_notified_store, release_id
+from replay import ResponseRecorder
+from scheduler import PollScheduler, parse_retry_after
+from snapshots import SnapshotRing, install_dump_handler
 from telegram import TelegramBotClient
 from ticketalertresponse import TicketAlertResponse
+from tokenmanager import TokenManager
+from tracing import AlertTracer, PollTimings
+from transport import ACCEPT_ENCODING, ConnectionPool
 
 #logging.captureWarnings(True)
 logging.basicConfig(level=logging.WARNING)
-print(f"Logging level set to: {logging.getLogger().getEffectiveLevel()}")
 
 class TwicketsClient:
     """Base class for handling Twickets API logic."""
@@ -36,6 +53,16 @@ class TwicketsClient:
     MAX_TIME=30
     MAX_RETRIES = 5  # Number of retry attempts
     BASE_DELAY = 60   # Base delay in seconds (exponential backoff)
+    BLOCKED_BASE_DELAY = 180  # first pause after a 403, doubling per consecutive block
+    BLOCKED_MAX_DELAY = 1800  # longest pause after a 403
+    MAX_CONNECTIONS = 2  # keep-alive connections held open between polls
+    # only decode the listing fields needed for matching. Parsing takes about half the time of the
+    # compact eager models, but the response holds about 4x the memory until the poll is done with it,
+    # see scripts/bench_listing_memory.py. TWICKETS_LAZY_PARSING=false picks the eager models
+    LAZY_PARSING = True
+    REQUEST_TIMEOUT = 20  # socket timeout for each connect and read
+    LIVENESS_MAX_AGE = 300  # seconds without a successful poll before /healthz fails
+    SNAPSHOTS = 100  # recent raw inventory responses kept for dump_snapshots
 
     def __init__(self):
         self.api_key = os.getenv("TWICKETS_API_KEY")
@@ -43,13 +70,48 @@ class TwicketsClient:
         self.password = os.getenv("TWICKETS_PASSWORD")
         self.event_id = os.getenv("TWICKETS_EVENT_ID")
         self.event_name = os.getenv("TWICKETS_EVENT_NAME")
-        
-        self.token = None
-        self.conn = http.client.HTTPSConnection(self.BASE_URL)
+        # TWICKETS_BASE_URL points the client at another server, e.g. scripts/fake_twickets_server.py
+        self.base_url = urlparse(os.getenv("TWICKETS_BASE_URL") or f"https://{self.BASE_URL}")
+        if self.base_url.scheme not in ("http", "https") or not self.base_url.hostname:
+            raise ValueError(f"TWICKETS_BASE_URL must be an http or https url, not {self.base_url.geturl()}")
+
+        token_file = os.getenv("TWICKETS_TOKEN_FILE", self.TOKEN_FILE)
+        token_ttl = float(os.getenv("TWICKETS_TOKEN_TTL_MINUTES", self.TOKEN_TTL_MINUTES)) * 60
+        self.tokens = TokenManager(self._login, token_file, token_ttl)
+        # TWICKETS_EMAIL_2/TWICKETS_PASSWORD_2 and up add accounts, each with its own session and rate budget
+        accounts = [Account("1", self.email, self.tokens)]
+        for name, email, password in parse_accounts()[1:]:
+            tokens = TokenManager(functools.partial(self._login, email, password), account_token_file(token_file, name), token_ttl)
+            accounts.append(Account(name, email, tokens))
+        self.accounts = AccountPool(accounts, os.getenv("TWICKETS_ACCOUNT_STRATEGY", ROUND_ROBIN))
+        self.transport = ConnectionPool(self._new_connection, self.MAX_CONNECTIONS)
+        self.change_detectors: Dict[str, ListingChangeDetector] = {}
+        # TWICKETS_JSON_DECODER picks orjson, msgspec or json, by default the fastest installed
+        self.decoder_name, self.decode = load_decoder(os.getenv("TWICKETS_JSON_DECODER"))
+        self.lazy_parsing = os.getenv("TWICKETS_LAZY_PARSING", str(self.LAZY_PARSING)).lower() in ("1", "true", "yes")
+        # TWICKETS_RECORD_DIR keeps changed inventory bodies for scripts/bench_pipeline.py to replay
+        record_dir = os.getenv("TWICKETS_RECORD_DIR")
+        self.recorder = ResponseRecorder(record_dir) if record_dir else None
+        # TWICKETS_HISTORY_DB keeps every listing seen for scripts/history_report.py
+        history_db = os.getenv("TWICKETS_HISTORY_DB")
+        self.history = ListingHistory(history_db) if history_db else None
+        # TWICKETS_SNAPSHOTS raw responses are kept compressed in memory and dumped on SIGUSR1, 0 turns it off
+        snapshots = int(os.getenv("TWICKETS_SNAPSHOTS", self.SNAPSHOTS))
+        self.snapshots = SnapshotRing(snapshots) if snapshots > 0 else None
+        self.snapshot_dir = os.getenv("TWICKETS_SNAPSHOT_DIR", "scratch")
+        # TWICKETS_VECTORISED_MATCHING matches whole responses over numpy columns, worth it on very large events.
+        # numpy is only in requirements-dev.txt, so an image that sets it needs numpy installed as well
+        self.match_listings = None
+        if os.getenv("TWICKETS_VECTORISED_MATCHING", "").lower() in ("1", "true", "yes"):
+            try:
+                from vectorised import required_listings  # pylint: disable=import-outside-toplevel
+                self.match_listings = required_listings
+            except ImportError:
+                logging.warning("TWICKETS_VECTORISED_MATCHING needs numpy, matching listing by listing")
 
         self.headers = {
         'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:101.0) Gecko/20100101 Firefox/101.0',
-            'Accept-Encoding': 'gzip, deflate',
+            'Accept-Encoding': ACCEPT_ENCODING,  # the transport decompresses bodies before parsing
             'Accept': '*/*',
             'Connection': 'keep-alive',
             'Content-Type': 'application/json',
@@ -57,49 +119,166 @@ class TwicketsClient:
         }
         self.prowl = ProwlNoticationsClient()
         self.teleclient = TelegramBotClient()
+        self.notifier = NotificationDispatcher(self._notification_channels())
+        # TWICKETS_TRACE_FILE collects a time-to-alert trace per alerted listing
+        trace_file = os.getenv("TWICKETS_TRACE_FILE")
+        self.tracer = AlertTracer(self.notifier.channels, trace_file) if trace_file else None
+        if self.tracer is not None:
+            self.notifier.on_delivery = self.tracer.delivered
+        self.last_polls: Dict[str, float] = {}
+        self.notified_ids: Union[NotifiedIdBackend, set] = set()
+        self._claim_lock = threading.Lock()
+        self.differ = ListingDiffer()
+        self.differ.subscribe(lambda event: metrics.LISTING_CHANGES.inc(event=event.event_id, kind=event.kind))
+        # TWICKETS_ALERT_PRICE_DROPS also alerts when a matching listing gets cheaper
+        if os.getenv("TWICKETS_ALERT_PRICE_DROPS", "").lower() in ("1", "true", "yes"):
+            self.differ.subscribe(self.alert_price_drop, [PRICE_DROPPED])
+        self.health = HealthState(float(os.getenv("TWICKETS_LIVENESS_MAX_AGE", self.LIVENESS_MAX_AGE)))
+        # a read that trickles bytes never hits the socket timeout, so abort anything running twice as long
+        self.watchdog = Watchdog(self.transport, 2 * self.REQUEST_TIMEOUT)
+        # compile the match rules once, the listing models delegate to them
+        set_matcher(load_matcher_from_env())
+        self.register_metrics()
 
-    NOTIFIED_IDS_FILE = "notified_ids.json"
+    NOTIFIED_IDS_FILE = "notified_ids.json"  # legacy whole-file list, migrated on first load
+    NOTIFIED_IDS_TTL_DAYS = 60
+    TOKEN_FILE = "session_token.json"  # lets a restarted pod reuse its session instead of logging in
+    TOKEN_TTL_MINUTES = 60
 
-    def load_notified_ids(self):
-        """Load notified IDs from a file."""
-        if os.path.exists(self.NOTIFIED_IDS_FILE):
-            try:
-                with open(self.NOTIFIED_IDS_FILE, "r") as f:
-                    return set(json.load(f))
-            except json.JSONDecodeError:
-                return set()
-        return set()
-
-    def save_notified_ids(self,notified_ids):
-        """Save notified IDs to a file."""
-        with open(self.NOTIFIED_IDS_FILE, "w") as f:
-            json.dump(list(notified_ids), f)
-
-    def _ensure_connection(self):
-        """Ensure the connection is open, reconnect if necessary."""
+    def _notification_channels(self) -> dict:
+        """Channels ticket alerts fan out to, Telegram only when it is configured."""
+        channels = {"prowl": lambda title, message: self.prowl.send_notification(message)}
+        if self.teleclient.TELEGRAM_BOT_TOKEN and self.teleclient.TELEGRAM_CHAT_ID:
+            channels["telegram"] = self.teleclient.send_notification
+        return channels
+
+    def register_metrics(self):
+        """Expose the notifier and transport counters this client keeps at scrape time."""
+        metrics.REGISTRY.register(metrics.CallbackMetric(
+            "twickets_notifications_total", "Notification deliveries by channel and outcome",
+            lambda: [({"channel": name, "outcome": outcome}, getattr(stats, outcome))
+                     for name, stats in self.notifier.stats.items() for outcome in ("sent", "failed", "retries")],
+            kind="counter"))
+        metrics.REGISTRY.register(metrics.CallbackMetric(
+            "twickets_connection_reuse_ratio", "Share of requests sent on an already used keep-alive connection",
+            lambda: [({}, self.transport.metrics.reuse_rate)]))
+        metrics.REGISTRY.register(metrics.CallbackMetric(
+            "twickets_connection_handshakes_total", "New connections opened to the Twickets host",
+            lambda: [({}, self.transport.metrics.handshakes)], kind="counter"))
+        metrics.REGISTRY.register(metrics.CallbackMetric(
+            "twickets_response_bytes_total", "Response body bytes received on the wire and after decompression",
+            lambda: [({"stage": "wire"}, self.transport.metrics.wire_bytes),
+                     ({"stage": "decoded"}, self.transport.metrics.body_bytes)], kind="counter"))
+        if self.snapshots is not None:
+            metrics.REGISTRY.register(metrics.CallbackMetric(
+                "twickets_snapshot_bytes", "Memory held by the recent response snapshots, raw and compressed",
+                lambda: [({"stage": "raw"}, self.snapshots.raw_bytes),
+                         ({"stage": "compressed"}, self.snapshots.compressed_bytes)]))
+        metrics.REGISTRY.register(metrics.CallbackMetric(
+            "twickets_account_polls_total", "Inventory polls sent with each account",
+            lambda: [({"account": account.name}, account.polls) for account in self.accounts], kind="counter"))
+        metrics.REGISTRY.register(metrics.CallbackMetric(
+            "twickets_account_blocks_total", "Blocked responses to each account",
+            lambda: [({"account": account.name}, account.blocks) for account in self.accounts], kind="counter"))
+
+    def load_notified_ids(self) -> NotifiedIdBackend:
+        """
+        Open the dedup backend chosen by TWICKETS_DEDUP_BACKEND. The default "file" backend
+        is an append-only log next to NOTIFIED_IDS_FILE, "sqlite" a database at
+        TWICKETS_DEDUP_PATH on a shared volume, and "redis" the server at TWICKETS_DEDUP_URL.
+        """
+        ttl_days = float(os.getenv("TWICKETS_NOTIFIED_TTL_DAYS", self.NOTIFIED_IDS_TTL_DAYS))
+        backend = os.getenv("TWICKETS_DEDUP_BACKEND", "file")
+        default_path = os.path.splitext(self.NOTIFIED_IDS_FILE)[0] + (".jsonl" if backend == "file" else ".sqlite")
+        store = open_notified_store(backend, os.getenv("TWICKETS_DEDUP_PATH", default_path),
+                                    ttl_days * 24 * 3600, os.getenv("TWICKETS_DEDUP_URL"))
+        if isinstance(store, NotifiedIdStore):
+            store.import_legacy(self.NOTIFIED_IDS_FILE)
+        # listing event subscribers such as alert_price_drop dedup against the same store
+        self.notified_ids = store
+        return store
+
+    def save_notified_ids(self, notified_ids):
+        """Make sure every notified ID is stored, ids are written as they are added."""
+        if isinstance(notified_ids, NotifiedIdBackend):
+            notified_ids.flush()
+
+    def new_scheduler(self, streams: int = 1) -> PollScheduler:
+        """
+        Scheduler pacing polls of this session, shared by `streams` polled events. It is the
+        primary account's, every other account gets a rate budget of its own.
+        """
+        for account in self.accounts:
+            account.scheduler = PollScheduler.from_env(self.MIN_TIME, self.MAX_TIME, streams,
+                                                       base_backoff=self.BLOCKED_BASE_DELAY, max_backoff=self.BLOCKED_MAX_DELAY)
+            # new listings arrive in clusters, so poll the event faster for a while after one
+            self.differ.subscribe(functools.partial(self._record_activity, account.scheduler), [LISTED])
+        metrics.REGISTRY.register(metrics.CallbackMetric(
+            "twickets_backoff_seconds", "Seconds left in the current blocked backoff, per account",
+            lambda: [({"account": account.name}, account.require_scheduler().backoff_remaining()) for account in self.accounts]))
+        metrics.REGISTRY.register(metrics.CallbackMetric(
+            "twickets_request_rate", "Learned safe request rate per second, per account",
+            lambda: [({"account": account.name}, account.require_scheduler().rate) for account in self.accounts]))
+        metrics.REGISTRY.register(metrics.CallbackMetric(
+            "twickets_burst_credit", "Extra requests burst mode may still spend, per account",
+            lambda: [({"account": account.name}, account.require_scheduler().burst_credit) for account in self.accounts]))
+        return self.accounts.primary.require_scheduler()
+
+    @staticmethod
+    def _record_activity(scheduler: PollScheduler, event: ListingEvent):
+        scheduler.record_activity(event.event_id)
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        """Create a fresh (unconnected) connection to the Twickets host."""
+        if self.base_url.scheme == "http":
+            return http.client.HTTPConnection(self.base_url.hostname, self.base_url.port,
+                                              timeout=self.REQUEST_TIMEOUT)
+        return http.client.HTTPSConnection(self.base_url.hostname, self.base_url.port, timeout=self.REQUEST_TIMEOUT)
+
+    def _ensure_connection(self) -> bool:
+        """Ensure a pooled connection is open, only reconnecting if none is alive."""
         retries = 0
-        while retries < self.MAX_RETRIES:
+        while True:
             try:
-                logging.debug(f"Attempting connection to {self.conn.host}")
-                self.conn.connect()
-                logging.debug("Connection successful")
-                return
+                self.transport.ensure_connection()
+                return True
             except socket.gaierror as ge:
-                logging.warning(f"DNS resolution failed: {ge}. Retrying in {self.BASE_DELAY * (2 ** retries)}s...")
+                logging.warning(f"DNS resolution failed: {ge}")
             except (http.client.HTTPException, OSError):
                 logging.warning("Connection error")
-                #TODO wrap self.conn.close in method
-                self.conn.close()
-                self.conn = http.client.HTTPSConnection(self.BASE_URL)
-                self.conn.connect()
+                self.transport.close()
             retries += 1
+            if retries >= self.MAX_RETRIES:
+                break
+            logging.warning(f"Retrying connection in {self.BASE_DELAY * (2 ** retries)}s...")
             time.sleep(self.BASE_DELAY * (2 ** retries))
         logging.error("Max retries reached. Could not establish a connection.")
+        return False
 
-    def check_env_variables(self):
+    def close(self):
+        """Deliver any queued notifications, stop token refreshes and the watchdog, and close connections and files."""
+        self.accounts.stop()
+        self.watchdog.stop()
+        self.notifier.stop()
+        self.transport.close()
+        if self.history is not None:
+            self.history.close()
+
+    def dump_snapshots(self, directory: Optional[str] = None) -> List[str]:
+        """Write the recent raw responses to directory, by default TWICKETS_SNAPSHOT_DIR, for the replay and check scripts."""
+        if self.snapshots is None:
+            return []
+        try:
+            return self.snapshots.dump(directory or self.snapshot_dir)
+        except OSError as e:
+            logging.warning("Could not dump snapshots: %s", e)
+            return []
+
+    def check_env_variables(self, required_keys: Optional[list] = None):
         """ check required keys all present """
+        required_keys = required_keys or self.REQUIRED_ENV_VARIABLES
         missing_env_variables = [
-            key for key in self.REQUIRED_ENV_VARIABLES if not os.getenv(key)]
+            key for key in required_keys if not os.getenv(key)]
         if missing_env_variables:
             for key in missing_env_variables:
                 logging.error("Environment variable %s is not set", key)
@@ -115,78 +294,171 @@ class TwicketsClient:
         return None
 
     def authenticate(self):
-        """Log in to the Twickets website."""
+        """Log in to the Twickets website with a new session, returning the token."""
+        return self.tokens.refresh()
+
+    def _login(self, email: Optional[str] = None, password: Optional[str] = None) -> Optional[dict]:
+        """Post the login, by default of the primary account, returning the validated response for the token manager."""
         self._ensure_connection()
         url = f"/services/auth/login?api_key={self.api_key}"
         data = json.dumps({
-            "login": self.email,
-            "password": self.password,
+            "login": email or self.email,
+            "password": password or self.password,
             "accountType": "U",
         })
         logging.debug("about to connect")
-        self.conn.request("POST", url, body=data, headers=self.headers)
-        response = self.conn.getresponse()
+        response = self.transport.request("POST", url, body=data, headers=self.headers)
         if response.status == 200:
-            result = json.loads(response.read().decode())
-            token = self.validate_auth_response(result)
+            result = self.decode(response.body)
+            if self.validate_auth_response(result) is None:
+                logging.warning("Unexpected authentication response")
+                return None
             logging.debug("Authenticated successfully")
-            return token
+            return result
         logging.warning(f"Authentication error status {response.status}")
         return None
 
-    def check_event_availability(self) -> Optional[TicketAlertResponse]:
-        """ Check ticket availability """
-        logging.debug("Connection socket is none: %s",(self.conn.sock is None))
-        self._ensure_connection()
-        url = f"/services/g2/inventory/listings/{self.event_id}?api_key={self.api_key}"
-        if self.conn.sock is None:
+    def check_event_availability(self, event_id: Optional[str] = None,
+                                 account: Optional[Account] = None) -> Optional[Union[TicketAlertResponse, UnchangedListings]]:
+        """
+        Check ticket availability, defaulting to the configured TWICKETS_EVENT_ID and the primary account.
+        Returns UnchangedListings without parsing if the listings match the previous poll.
+        """
+        event_id = event_id or self.event_id
+        tokens = (account or self.accounts.primary).tokens
+        if not self._ensure_connection():
             # No valid connection, so we return None.
             return None
+        url = f"/services/g2/inventory/listings/{event_id}?api_key={self.api_key}"
+        detector = self.change_detectors.setdefault(event_id, ListingChangeDetector())
+        start = time.perf_counter()
+        timings = PollTimings(time.time(), previous_poll=self.last_polls.get(event_id))
         try:
-            logging.debug(f"Get response event: {self.event_id}")
-            self.conn.request("GET", url, headers=self.headers)
-            response = self.conn.getresponse()
+            logging.debug(f"Get response event: {event_id}")
+            headers = self.headers | tokens.headers() | detector.conditional_headers()
+            response = self.transport.request("GET", url, headers=headers)
+            if response.status == 401:
+                # the session was revoked early, log in again and retry once rather than backing off
+                logging.info("Session token rejected, logging in again")
+                tokens.invalidate()
+                headers = self.headers | tokens.headers() | detector.conditional_headers()
+                response = self.transport.request("GET", url, headers=headers)
+            timings.received = time.time()
+            logging.debug("Transport %s", self.transport.metrics.summary())
+            if response.status in (200, 304) and detector.is_unchanged(response):
+                logging.debug("Listings for %s unchanged", event_id)
+                metrics.POLLS.inc(event=event_id, result="unchanged")
+                metrics.POLL_SECONDS.observe(time.perf_counter() - start)
+                self.last_polls[event_id] = timings.requested
+                if self.snapshots is not None:
+                    self.snapshots.add(event_id, response.body, detector.digest, timings.received)
+                if self.history is not None:
+                    self.history.touch(event_id, timings.requested)
+                return UnchangedListings(event_id, response.status == 304)
             if response.status == 200:
-                result = json.loads(response.read().decode())
-                # Convert the response into a TicketAlertResponse object
-                ticket_alert_response = TicketAlertResponse.from_dict(result)
+                if self.recorder is not None:
+                    self.recorder.record(event_id, response.body)
+                if self.snapshots is not None:
+                    self.snapshots.add(event_id, response.body, detector.digest, timings.received)
+                parse_start = time.perf_counter()
+                try:
+                    # decode straight from the body bytes into a TicketAlertResponse object
+                    ticket_alert_response = decode_inventory(response.body, self.decode, self.lazy_parsing)
+                except Exception:
+                    # make sure a body we failed to parse is not later skipped as unchanged
+                    detector.reset()
+                    metrics.POLLS.inc(event=event_id, result="error")
+                    raise
+                if self.match_listings is not None:
+                    ticket_alert_response.matches = self.match_listings(ticket_alert_response)
+                timings.parsed = time.time()
+                ticket_alert_response.timings = timings
+                if self.history is not None:
+                    self.history.record(event_id, ticket_alert_response, timings.requested)
+                self.differ.diff(event_id, ticket_alert_response)
+                self.last_polls[event_id] = timings.requested
+                metrics.PARSE_SECONDS.observe(time.perf_counter() - parse_start)
+                metrics.LISTINGS.observe(len(ticket_alert_response.response_data))
+                metrics.POLLS.inc(event=event_id, result="changed")
+                metrics.POLL_SECONDS.observe(time.perf_counter() - start)
                 logging.info(f"Response code {ticket_alert_response.response_code}, clock {ticket_alert_response.clock}, has valid tickets {ticket_alert_response.has_valid_tickets}")
                 return ticket_alert_response
-            raise NotTwoHundredStatusError(f"Check availability status: {response.status}")
+            if response.status == 401:
+                # rejected straight after logging in, start from a fresh login on the next request
+                tokens.invalidate()
+            metrics.BLOCKED.inc(status=str(response.status))
+            metrics.POLLS.inc(event=event_id, result="blocked")
+            raise NotTwoHundredStatusError(f"Check availability status: {response.status}", response.status,
+                                           parse_retry_after(response.headers.get("retry-after")))
         except http.client.ResponseNotReady:
             logging.warning("http.client.ResponseNotReady exception")
             pass
             return None
         except http.client.HTTPException as e:
-            self.conn.close()
+            metrics.POLLS.inc(event=event_id, result="error")
+            self.transport.close()
             raise e
         
 
-    def process_ticket_alert(self, ticket_alert_response: TicketAlertResponse, notified_ids) -> bool:
+    def process_ticket_alert(self, ticket_alert_response: TicketAlertResponse, notified_ids, event_name: Optional[str] = None) -> bool:
         """Process and notify about tickets from a TicketAlertResponse."""
+        event_name = event_name or self.event_name
         new_notification_sent = False  # Track if any new notification is sent
 
-        for response_datum in ticket_alert_response.response_data:
-            if response_datum.is_required_ticket == True:
+        # matched in bulk when the vectorised path already set ticket_alert_response.matches
+        required = list(ticket_alert_response.required_tickets())
+        ignored = len(ticket_alert_response.response_data) - len(required)
+        if ignored:
+            logging.info(f"Ignoring {ignored} listings that match no rule")
+        for response_datum in required:
+            metrics.MATCHES.inc(event_name=str(event_name))
 
-                id = response_datum.url_id  # Extract url_id directly
-        
-                if id not in notified_ids:
-                    url = f"https://{self.BASE_URL}/app/block/{id},1"
-                    found_str = f"found {self.event_name} tickets {url}"
-                    self.prowl.send_notification(found_str)
-                    logging.info(found_str)
-                    self.teleclient.send_notification("Ticket Alert", found_str)
-                    notified_ids.add(id)
-                    self.save_notified_ids(notified_ids)
-                    new_notification_sent = True  # Set to True since a new notification was sent
-                else:
-                    logging.debug(f"Ignoring repeat notification {id}")
+            id = response_datum.url_id  # Extract url_id directly
+
+            # claim first so another replica sharing the dedup store cannot alert as well
+            with self._claim_lock:
+                claimed = id not in notified_ids and claim_id(notified_ids, id)
+            if claimed:
+                url = f"https://{self.BASE_URL}/app/block/{id},1"
+                found_str = f"found {event_name} tickets {url}"
+                logging.info(found_str)
+                if self.tracer is not None:
+                    self.tracer.matched(id, event_name, ticket_alert_response.timings)
+                    self.tracer.enqueued(id)
+                self.notifier.submit(Notification("Ticket Alert", found_str, id,
+                                                  undeliverable=functools.partial(self._release_claim, notified_ids, id)))
+                new_notification_sent = True  # Set to True since a new notification was sent
             else:
-                logging.info(f"Ignoring listing for {response_datum.pricing.prices[0].label}")
+                logging.debug(f"Ignoring repeat notification {id}")
 
         return new_notification_sent
 
+    def alert_price_drop(self, event: ListingEvent):
+        """Listing event subscriber alerting once per new lower price of a listing that matches the rules."""
+        if event.listing is None or event.price is None or event.previous_price is None:
+            return
+        if not event.listing.is_required_ticket:
+            return
+        key = f"{event.url_id}@{event.price:.0f}"
+        with self._claim_lock:
+            if not claim_id(self.notified_ids, key):
+                return
+        url = f"https://{self.BASE_URL}/app/block/{event.url_id},1"
+        message = (f"price dropped from {event.previous_price / 100:.2f} to {event.price / 100:.2f} "
+                   f"per ticket {url}")
+        logging.info(message)
+        self.notifier.submit(Notification("Price Drop", message, event.url_id,
+                                          undeliverable=functools.partial(self._release_claim, self.notified_ids, key)))
+
+    def _release_claim(self, notified_ids, key: str):
+        """Forget a claim whose alert no channel delivered, so the next poll alerts again."""
+        logging.warning(f"No channel delivered the alert for {key}, releasing it for the next poll")
+        with self._claim_lock:
+            release_id(notified_ids, key)
+        # an unchanged response would skip the listing, and the alert does not know its event, so parse every event once
+        for detector in list(self.change_detectors.values()):
+            detector.reset()
+
 
     def run(self):
         """ run da ting """
@@ -195,78 +467,79 @@ class TwicketsClient:
             logging.debug("Checking env variables")
             count = 1
             notified_ids = self.load_notified_ids()
+            raise_on_sigterm()
+            metrics.start_metrics_server_from_env()
+            start_health_server_from_env(self.health)
+            install_dump_handler(self.dump_snapshots)
             self.check_env_variables()
             logging.debug("Authenticating")
-            token = self.authenticate()
+            token = self.tokens.get()
             if token is None:
                 raise RuntimeError("Authentication failed for some reason")
+            self.tokens.start()
+            self.watchdog.start()
             START_MESSAGE = "starting ticket check"
             logging.debug(START_MESSAGE)  
-            attempts = 0
+            scheduler = self.new_scheduler()
             blocked_requests = 0
             while True:
                 now = datetime.now()
-                tomorrow = now + timedelta(days=1)
-                time_delay = round(random.uniform(self.MIN_TIME,self.MAX_TIME))
-                auth_time_delay = round(random.uniform(180,360)) # need a bigger delay if you get a 403    
-                
                 try:
-                    logging.debug("Check cycle %s at %s with %s seconds delay",count,now.strftime("%d/%m %H:%M:%S"),time_delay)
+                    sleep(scheduler.reserve())
+                    logging.debug("Check cycle %s at %s", count, now.strftime("%d/%m %H:%M:%S"))
                     ticket_alert = self.check_event_availability()
-                    #reset everything if ticket alert returned
-                    backoff = 0
-                    attempts = 0
+                    scheduler.record_success()
+                    self.health.record_success()
                     count +=1
-                    new_notification_sent = False
-                    if isinstance(ticket_alert, TicketAlertResponse):
+                    if isinstance(ticket_alert, UnchangedListings):
+                        logging.debug("No change in listings")
+                    elif isinstance(ticket_alert, TicketAlertResponse):
                         if ticket_alert.has_valid_tickets == True:
-                            new_notification_sent = self.process_ticket_alert(ticket_alert, notified_ids)
-                            #might as well wait a bit longer if there is an active alert
-                            if new_notification_sent == True:
-                                SLEEP_INTERVAL = auth_time_delay
-                                logging.info(f"Pausing for {SLEEP_INTERVAL} as notification sent")
+                            self.process_ticket_alert(ticket_alert, notified_ids)
                     else:
                         raise TypeError(f"Unexpected type for ticket alert: {type(ticket_alert)} ")
-                    SLEEP_INTERVAL = time_delay + (backoff)
-                    sleep(SLEEP_INTERVAL)
+                    sleep(scheduler.next_interval(self.event_id))
                 except NotTwoHundredStatusError as error_msg:
                     blocked_requests += 1
                     logging.info("Check cycle %s, blocked requests: %s",count,blocked_requests)
-                    logging.info(f"{error_msg} %s. Attempt {attempts}",now.strftime("%H:%M:%S"))
+                    delay = scheduler.record_blocked(error_msg.status, error_msg.retry_after)
+                    # sleeping through the backoff is progress, not a hang
+                    self.health.pause(delay)
+                    new_time = now + timedelta(seconds=delay)
+                    logging.info(f"{error_msg} %s. Attempt {scheduler.blocks}",now.strftime("%H:%M:%S"))
                     ticket_alert = None
-                    if attempts > self.MAX_RETRIES:
+                    if scheduler.blocks > self.MAX_RETRIES:
                         #give up
                         self.save_notified_ids(notified_ids)
-                        exit_error_message = "Exiting after five failed login attempts"
+                        exit_error_message = f"Exiting after {scheduler.blocks} blocked attempts"
                         self.prowl.send_notification(exit_error_message)
                         logging.error(exit_error_message)
-                        self.conn.close()
+                        self.close()
                         #If running as a k8s deployment the pod will just respawn on exit and you will still be in a 403 shutout timeframe, so sleep before exit
-                        SLEEP_INTERVAL = auth_time_delay * (2 ** attempts)
-                        new_time = now + timedelta(seconds=SLEEP_INTERVAL)
                         logging.error("Exiting due to repeated 403 errors at %s", new_time.strftime("%H:%M:%S"))
-                        sleep(SLEEP_INTERVAL)
+                        sleep(delay)
                         sys.exit(exit_error_message)
-                    SLEEP_INTERVAL = auth_time_delay * (2 ** attempts)
-                    new_time = now + timedelta(seconds=SLEEP_INTERVAL)
                     logging.warning("Pausing due to 403 error. Resuming at %s", new_time.strftime("%H:%M:%S"))
-                    self.conn.close()
-                    sleep(SLEEP_INTERVAL)
-                    attempts+=1
+                    self.transport.close()
+                    sleep(delay)
                     token = self.authenticate()
                     if token is None:
                         raise RuntimeError("Authentication failed for some reason")
         except KeyboardInterrupt:
             QUIT_MESSAGE = "User interrupted connection with ctrl-C on cycle %s"
             logging.info(QUIT_MESSAGE, count)
-            self.conn.close()
+            self.close()
+            self.save_notified_ids(notified_ids)
+        except TerminatedError:
+            logging.info("Stopping on SIGTERM at cycle %s", count)
+            self.close()
             self.save_notified_ids(notified_ids)
         except Exception as e:
             self.save_notified_ids(notified_ids)
             logging.error("Cycle %s Caught exception of type %s",count, type(e).__name__)
             logging.error(f"Cycle {count} {e} ")
             exception_error_msg = f"Cycle {count} Caught exception {e}"
-            self.conn.close()
+            self.close()
             self.prowl.send_notification(exception_error_msg)
     
 
@@ -0,0 +1,150 @@
+""" module for deciding which listings are worth an alert, from rules loaded at startup """
+
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Callable, FrozenSet, List, Optional
+
+DEFAULT_LABELS = frozenset({"Adult Weekend Ticket", "Weekend Campervan Pass"})
+PRICE_FIELDS = ("net_selling_price", "face_value")
+
+Predicate = Callable[[Any], bool]
+
+
+def _frozen(value: Any) -> FrozenSet[str]:
+    if value is None:
+        return frozenset()
+    if isinstance(value, str):
+        return frozenset({value})
+    return frozenset(value)
+
+
+@dataclass(frozen=True)
+class TicketRule:
+    """
+    One set of match criteria. Empty sets and None limits mean "any", and the quantity
+    defaults to exactly one ticket. Prices are in pence and apply to every ticket in the listing.
+    """
+    name: str = "rule"
+    labels: FrozenSet[str] = frozenset()
+    min_quantity: int = 1
+    max_quantity: Optional[int] = 1
+    max_price: Optional[int] = None
+    price_field: str = "net_selling_price"
+    areas: FrozenSet[str] = frozenset()
+    sections: FrozenSet[str] = frozenset()
+    delivery_methods: FrozenSet[str] = frozenset()
+
+    @staticmethod
+    def from_dict(obj: Any) -> 'TicketRule':
+        """Build a rule from config, e.g. {"labels": ["Weekend Campervan Pass"], "max_quantity": 2}."""
+        assert isinstance(obj, dict)
+        unknown = set(obj) - set(TicketRule.__dataclass_fields__)
+        if unknown:
+            raise ValueError(f"Unknown match rule keys: {sorted(unknown)}")
+        rule = TicketRule(
+            name=str(obj.get("name", "rule")),
+            labels=_frozen(obj.get("labels")),
+            min_quantity=int(obj.get("min_quantity", 1)),
+            max_quantity=obj.get("max_quantity", 1),
+            max_price=obj.get("max_price"),
+            price_field=obj.get("price_field", "net_selling_price"),
+            areas=_frozen(obj.get("areas")),
+            sections=_frozen(obj.get("sections")),
+            delivery_methods=_frozen(obj.get("delivery_methods")),
+        )
+        if rule.price_field not in PRICE_FIELDS:
+            raise ValueError(f"price_field must be one of {PRICE_FIELDS}, not {rule.price_field}")
+        return rule
+
+    def compile(self) -> Predicate:
+        """Turn the rule into one predicate that only runs the checks this rule configures."""
+        checks: List[Predicate] = []
+        min_quantity, max_quantity = self.min_quantity, self.max_quantity
+        if max_quantity is not None and min_quantity == max_quantity:
+            checks.append(lambda item: item.number_of_tickets == min_quantity)
+        else:
+            checks.append(lambda item: item.number_of_tickets >= min_quantity)
+            if max_quantity is not None:
+                checks.append(lambda item: item.number_of_tickets <= max_quantity)
+        if self.labels:
+            labels = self.labels
+            checks.append(lambda item: labels.issuperset(item.labels))
+        if self.areas:
+            areas = self.areas
+            checks.append(lambda item: item.area in areas)
+        if self.sections:
+            sections = self.sections
+            checks.append(lambda item: item.section in sections)
+        if self.delivery_methods:
+            delivery_methods = self.delivery_methods
+            checks.append(lambda item: not delivery_methods.isdisjoint(item.delivery_method_types))
+        if self.max_price is not None:
+            max_price, price_field = self.max_price, self.price_field
+            checks.append(lambda item: max(item.ticket_prices(price_field), default=0) <= max_price)
+        # cheapest checks were appended first, so all() stops early on the common misses
+        return lambda item: all(check(item) for check in checks)
+
+
+DEFAULT_RULE = TicketRule(name="default", labels=DEFAULT_LABELS)
+
+
+class TicketMatcher:
+    """Matches a listing if any of its rules do."""
+
+    def __init__(self, rules: List[TicketRule]):
+        if not rules:
+            raise ValueError("At least one match rule is required")
+        self.rules = rules
+        self._predicates = [rule.compile() for rule in rules]
+        self._labels = None if any(not rule.labels for rule in rules) else frozenset().union(*(rule.labels for rule in rules))
+
+    def matches(self, item: Any) -> bool:
+        """True if the listing satisfies at least one rule."""
+        return any(predicate(item) for predicate in self._predicates)
+
+    def accepts_label(self, label: str) -> bool:
+        """True if some rule allows tickets with this label."""
+        return self._labels is None or label in self._labels
+
+    @staticmethod
+    def from_config(config: Any) -> 'TicketMatcher':
+        """Build from a list of rule dicts, or {"rules": [...]}."""
+        if isinstance(config, dict):
+            config = config.get("rules")
+        assert isinstance(config, list)
+        return TicketMatcher([TicketRule.from_dict(rule) for rule in config])
+
+
+def load_matcher_from_env() -> TicketMatcher:
+    """
+    Rules come from TWICKETS_MATCH_RULES (JSON) or TWICKETS_MATCH_RULES_FILE (a JSON file,
+    e.g. a mounted ConfigMap). Without either the original single weekend ticket rule applies.
+    """
+    rules_json = os.getenv("TWICKETS_MATCH_RULES")
+    rules_file = os.getenv("TWICKETS_MATCH_RULES_FILE")
+    if rules_json:
+        config = json.loads(rules_json)
+    elif rules_file:
+        with open(rules_file, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    else:
+        return TicketMatcher([DEFAULT_RULE])
+    matcher = TicketMatcher.from_config(config)
+    logging.info("Loaded %s match rules: %s", len(matcher.rules), ", ".join(rule.name for rule in matcher.rules))
+    return matcher
+
+
+_active_matcher = TicketMatcher([DEFAULT_RULE])
+
+
+def get_matcher() -> TicketMatcher:
+    """The matcher the listing models delegate to."""
+    return _active_matcher
+
+
+def set_matcher(matcher: TicketMatcher):
+    """Swap the matcher used by is_required_ticket and has_valid_tickets."""
+    global _active_matcher  # pylint: disable=global-statement
+    _active_matcher = matcher
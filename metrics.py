@@ -0,0 +1,215 @@
+""" module for exposing bot metrics in the prometheus text format """
+
+import logging
+import math
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, TypeVar
+
+LabelValues = Tuple[str, ...]
+Sample = Tuple[Dict[str, str], float]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + "}"
+
+
+class Metric:
+    """A named metric with an optional fixed set of label names."""
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, not {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _labels(self, key: LabelValues) -> Dict[str, str]:
+        return dict(zip(self.label_names, key))
+
+    def samples(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """A value that only goes up."""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, self._labels(key), value) for key, value in items]
+
+
+class Gauge(Counter):
+    """A value that can go up and down."""
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """Counts of observations falling under each bucket bound, with their sum."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float], labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self.buckets))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def count(self, **labels: str) -> int:
+        return sum(self._counts.get(self._key(labels), ()))
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, counts in self._counts.items():
+                labels = self._labels(key)
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    samples.append((f"{self.name}_bucket", labels | {"le": _format_value(bound)}, cumulative))
+                samples.append((f"{self.name}_sum", labels, self._sums[key]))
+                samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class CallbackMetric(Metric):
+    """A gauge or counter read at scrape time from whatever collect() returns, e.g. existing stats objects."""
+
+    def __init__(self, name: str, documentation: str, collect: Callable[[], Iterable[Sample]], kind: str = "gauge"):
+        super().__init__(name, documentation)
+        self.collect = collect
+        self.kind = kind
+
+    def samples(self):
+        try:
+            return [(self.name, labels, value) for labels, value in self.collect()]
+        except Exception as e:
+            logging.warning("Could not collect %s: %s", self.name, e)
+            return []
+
+
+M = TypeVar("M", bound=Metric)
+
+
+class Registry:
+    """The metrics a scrape renders, by name. Registering a name again replaces the old metric."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: M) -> M:
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+POLLS = REGISTRY.register(Counter(
+    "twickets_polls_total", "Inventory polls by event and result", ("event", "result")))
+POLL_SECONDS = REGISTRY.register(Histogram(
+    "twickets_poll_seconds", "Time to fetch and parse one inventory response",
+    (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)))
+PARSE_SECONDS = REGISTRY.register(Histogram(
+    "twickets_parse_seconds", "Time to decode and parse one inventory body",
+    (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)))
+LISTINGS = REGISTRY.register(Histogram(
+    "twickets_listings_per_response", "Listings in each parsed inventory response", (0, 10, 100, 1000, 10000)))
+MATCHES = REGISTRY.register(Counter(
+    "twickets_matches_total", "Listings that matched a rule, new or already notified", ("event_name",)))
+BLOCKED = REGISTRY.register(Counter(
+    "twickets_blocked_total", "Non 200 inventory responses by status", ("status",)))
+LISTING_CHANGES = REGISTRY.register(Counter(
+    "twickets_listing_changes_total", "Listing events from diffing successive responses", ("event", "kind")))
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0", registry: Registry = REGISTRY) -> ThreadingHTTPServer:
+    """Serve registry.render() at /metrics from a background thread."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            pass
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logging.info("Serving metrics on port %s", server.server_address[1])
+    return server
+
+
+def start_metrics_server_from_env() -> Optional[ThreadingHTTPServer]:
+    """Start the endpoint if TWICKETS_METRICS_PORT is set."""
+    port = os.getenv("TWICKETS_METRICS_PORT")
+    return start_metrics_server(int(port)) if port else None
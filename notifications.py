@@ -0,0 +1,178 @@
+""" module for sending notifications from a background worker, off the polling loop """
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+SendFunction = Callable[[str, str], None]
+DeliveryHook = Callable[[Optional[str], str, bool], None]
+
+
+@dataclass
+class Notification:
+    """
+    One alert waiting to be delivered. key is the listing url_id, if there is one, and
+    undeliverable is called when every channel gave up on it.
+    """
+    title: str
+    message: str
+    key: Optional[str] = None
+    created: float = field(default_factory=time.monotonic)
+    undeliverable: Optional[Callable[[], None]] = field(default=None, repr=False, compare=False)
+
+
+@dataclass
+class ChannelStats:
+    """Delivery counters for one channel."""
+    sent: int = 0
+    failed: int = 0
+    retries: int = 0
+
+
+class NotificationDispatcher:
+    """
+    Queues notifications and delivers them on a background thread. Notifications that
+    arrive within linger seconds of each other are coalesced into one message per
+    channel, every channel is sent to concurrently, and failed sends are retried with
+    exponential backoff. submit() never blocks the caller. on_delivery, if set, is
+    called with each notification's key, the channel and whether it was delivered, and a
+    notification no channel delivered has its undeliverable callback run.
+    """
+    _STOP = object()
+
+    def __init__(self, channels: Dict[str, SendFunction], linger: float = 0.5, max_batch: int = 20,
+                 max_attempts: int = 4, base_delay: float = 1.0):
+        self.channels = channels
+        self.linger = linger
+        self.max_batch = max_batch
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.stats = {name: ChannelStats() for name in channels}
+        self.on_delivery: Optional[DeliveryHook] = None
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._executor = self._new_executor()
+        self._executor_stopped = False
+
+    def _new_executor(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(max_workers=max(1, len(self.channels)), thread_name_prefix="notify")
+
+    def start(self):
+        """Start the worker thread, if it is not already running."""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                if self._executor_stopped:
+                    self._executor = self._new_executor()
+                    self._executor_stopped = False
+                self._thread = threading.Thread(target=self._worker, name="notification-dispatcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, notification: Notification):
+        """Queue a notification for delivery and return straight away."""
+        self.start()
+        self._queue.put(notification)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything queued so far has been delivered or given up on."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stop(self, timeout: Optional[float] = 30):
+        """Deliver what is queued, then stop the worker and the channel threads."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join(timeout)
+        with self._start_lock:
+            self._executor.shutdown(wait=False)
+            self._executor_stopped = True
+
+    def _collect_batch(self, first: Notification) -> tuple:
+        batch = [first]
+        stop = False
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is self._STOP:
+                self._queue.task_done()
+                stop = True
+                break
+            batch.append(item)
+        return batch, stop
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                self._queue.task_done()
+                return
+            batch, stop = self._collect_batch(item)
+            try:
+                self._deliver(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    @staticmethod
+    def coalesce(batch: List[Notification]) -> tuple:
+        """Title and message for one combined notification."""
+        if len(batch) == 1:
+            return batch[0].title, batch[0].message
+        return f"{batch[0].title} ({len(batch)})", "\n".join(item.message for item in batch)
+
+    def _deliver(self, batch: List[Notification]):
+        title, message = self.coalesce(batch)
+        futures = [
+            self._executor.submit(self._send_and_report, batch, name, send, title, message)
+            for name, send in self.channels.items()
+        ]
+        if any([future.result() for future in futures]):
+            return
+        for item in batch:
+            if item.undeliverable is not None:
+                try:
+                    item.undeliverable()
+                except Exception:
+                    logging.exception("Handling undeliverable notification %s failed", item.key)
+
+    def _send_and_report(self, batch: List[Notification], name: str, send: SendFunction, title: str,
+                         message: str) -> bool:
+        ok = self._send_with_retry(name, send, title, message)
+        if self.on_delivery is not None:
+            for item in batch:
+                self.on_delivery(item.key, name, ok)
+        return ok
+
+    def _send_with_retry(self, name: str, send: SendFunction, title: str, message: str) -> bool:
+        stats = self.stats[name]
+        for attempt in range(self.max_attempts):
+            try:
+                send(title, message)
+                stats.sent += 1
+                return True
+            except Exception as e:
+                if attempt + 1 == self.max_attempts:
+                    break
+                stats.retries += 1
+                delay = self.base_delay * (2 ** attempt)
+                logging.warning("%s notification failed (%s), retrying in %ss", name, e, delay)
+                time.sleep(delay)
+        stats.failed += 1
+        logging.error("Giving up on %s notification after %s attempts: %s", name, self.max_attempts, title)
+        return False
@@ -0,0 +1,392 @@
+""" module for remembering which listings have already been notified """
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional
+from urllib.parse import urlparse
+
+
+class NotifiedIdBackend:
+    """
+    Interface shared by the dedup backends. claim() is the atomic check-and-add that
+    lets several replicas agree on which one sends an alert.
+    """
+
+    def __contains__(self, listing_id: object) -> bool:
+        raise NotImplementedError
+
+    def claim(self, listing_id: str) -> bool:
+        """Record the id, returning False if it was already recorded."""
+        raise NotImplementedError
+
+    def add(self, listing_id: str):
+        """Record an id."""
+        self.claim(listing_id)
+
+    def release(self, listing_id: str):
+        """Forget a claimed id, so a later poll can alert on it again."""
+        raise NotImplementedError
+
+    def flush(self):
+        """Push pending writes to durable storage."""
+
+    def close(self):
+        """Release the backend's file or connection."""
+
+
+class NotifiedIdStore(NotifiedIdBackend):
+    """
+    Set-like store of notified listing ids backed by an append-only JSON lines log.
+    Adding an id appends and flushes one line, so it survives the process dying, while
+    the fsyncs that make it survive the machine dying are batched. Ids older than ttl seconds are
+    forgotten, and the log is rewritten with only the live ids once it has grown to
+    twice the size it had after the last rewrite.
+    """
+    COMPACT_MIN_LINES = 1000
+
+    def __init__(self, path: str, ttl: Optional[float] = 60 * 24 * 3600, fsync_every: int = 16,
+                 fsync_interval: float = 5.0, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.ttl = ttl
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.clock = clock
+        self._ids: Dict[str, float] = {}
+        self._lines = 0
+        self._compacted_lines = 0
+        self._unsynced = 0
+        self._last_sync = clock()
+        self._load()
+        self._compacted_lines = len(self._ids)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _expired(self, added_at: float, now: float) -> bool:
+        return self.ttl is not None and now - added_at > self.ttl
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        now = self.clock()
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    listing_id, added_at = entry["id"], float(entry["at"])
+                except (ValueError, KeyError, TypeError):
+                    # a partly written last line after a crash, skip it
+                    logging.warning("Skipping unreadable line in %s", self.path)
+                    continue
+                self._lines += 1
+                if entry.get("released"):
+                    self._ids.pop(listing_id, None)
+                elif not self._expired(added_at, now):
+                    self._ids[listing_id] = added_at
+
+    def import_legacy(self, legacy_path: str):
+        """Bring in ids from the old notified_ids.json list, then move that file aside."""
+        if not os.path.exists(legacy_path):
+            return
+        try:
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                legacy_ids = json.load(f)
+        except json.JSONDecodeError:
+            legacy_ids = []
+        for listing_id in legacy_ids:
+            self.add(listing_id)
+        self.flush()
+        os.replace(legacy_path, legacy_path + ".migrated")
+        logging.info("Imported %s notified ids from %s", len(legacy_ids), legacy_path)
+
+    def __contains__(self, listing_id: object) -> bool:
+        if not isinstance(listing_id, str):
+            return False
+        added_at = self._ids.get(listing_id)
+        if added_at is None:
+            return False
+        if self._expired(added_at, self.clock()):
+            del self._ids[listing_id]
+            return False
+        return True
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._ids))
+
+    def claim(self, listing_id: str) -> bool:
+        """Record the id, returning False if this process already had it."""
+        if listing_id in self:
+            return False
+        self.add(listing_id)
+        return True
+
+    def add(self, listing_id: str):
+        """Record an id with one appended line."""
+        if listing_id in self:
+            return
+        now = self.clock()
+        self._ids[listing_id] = now
+        self._file.write(json.dumps({"id": listing_id, "at": now}) + "\n")
+        self._file.flush()
+        self._lines += 1
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every or now - self._last_sync >= self.fsync_interval:
+            self.flush()
+        if self._lines >= max(self.COMPACT_MIN_LINES, 2 * self._compacted_lines):
+            self.compact()
+
+    def release(self, listing_id: str):
+        """Forget an id with an appended release line, which the next compaction drops."""
+        if self._ids.pop(listing_id, None) is None:
+            return
+        self._file.write(json.dumps({"id": listing_id, "at": self.clock(), "released": True}) + "\n")
+        self._lines += 1
+        self.flush()
+
+    def flush(self):
+        """Push appended lines to disk."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = self.clock()
+
+    def expire(self):
+        """Forget every id older than the ttl."""
+        now = self.clock()
+        for listing_id, added_at in list(self._ids.items()):
+            if self._expired(added_at, now):
+                del self._ids[listing_id]
+
+    def compact(self):
+        """Rewrite the log with only the live ids."""
+        self.expire()
+        self._file.close()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for listing_id, added_at in self._ids.items():
+                f.write(json.dumps({"id": listing_id, "at": added_at}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._lines = self._compacted_lines = len(self._ids)
+        self._unsynced = 0
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        """Flush and close the log."""
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+
+class SqliteNotifiedIdStore(NotifiedIdBackend):
+    """
+    Notified ids in a SQLite file, e.g. on a volume shared by several pods. Every
+    claim is a single upsert inside an immediate transaction, so two writers can never
+    both claim the same id. Rollback journalling is used because WAL needs shared
+    memory, which network volumes do not provide.
+    """
+    EXPIRE_EVERY = 500
+
+    def __init__(self, path: str, ttl: Optional[float] = 60 * 24 * 3600, busy_timeout: float = 10.0,
+                 clock: Callable[[], float] = time.time):
+        self.path = path
+        self.ttl = ttl
+        self.clock = clock
+        self._claims = 0
+        self._db = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=DELETE")
+        self._db.execute("CREATE TABLE IF NOT EXISTS notified (id TEXT PRIMARY KEY, at REAL NOT NULL)")
+        self.expire()
+
+    def _cutoff(self) -> float:
+        return float("-inf") if self.ttl is None else self.clock() - self.ttl
+
+    def __contains__(self, listing_id: object) -> bool:
+        row = self._db.execute("SELECT 1 FROM notified WHERE id = ? AND at >= ?", (listing_id, self._cutoff())).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM notified WHERE at >= ?", (self._cutoff(),)).fetchone()[0]
+
+    def __iter__(self) -> Iterator[str]:
+        rows = self._db.execute("SELECT id FROM notified WHERE at >= ?", (self._cutoff(),)).fetchall()
+        return iter([row[0] for row in rows])
+
+    def claim(self, listing_id: str) -> bool:
+        """Insert the id, or take over an expired row. False if a live row already existed."""
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = self._db.execute(
+                "INSERT INTO notified (id, at) VALUES (?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET at = excluded.at WHERE notified.at < ?",
+                (listing_id, self.clock(), self._cutoff()))
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+        self._claims += 1
+        if self._claims % self.EXPIRE_EVERY == 0:
+            self.expire()
+        return cursor.rowcount == 1
+
+    def release(self, listing_id: str):
+        self._db.execute("DELETE FROM notified WHERE id = ?", (listing_id,))
+
+    def expire(self):
+        """Delete rows older than the ttl."""
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM notified WHERE at < ?", (self._cutoff(),))
+
+    def close(self):
+        self._db.close()
+
+
+class RedisNotifiedIdStore(NotifiedIdBackend):
+    """
+    Notified ids as keys in Redis, shared by every replica. claim() is SET NX EX, so
+    Redis both settles races between pods and expires old ids. Speaks just enough of
+    the RESP protocol to avoid a client library dependency.
+    """
+    PREFIX = "twickets:notified:"
+
+    def __init__(self, url: str, ttl: Optional[float] = 60 * 24 * 3600, timeout: float = 5.0):
+        parsed = urlparse(url)
+        if parsed.scheme != "redis":
+            raise ValueError(f"Expected a redis:// url, not {url}")
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.ttl = ttl
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._reader: Optional[BinaryIO] = None
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._reader = self._sock.makefile("rb")
+        if self.password:
+            self._send("AUTH", self.password)
+        if self.db:
+            self._send("SELECT", str(self.db))
+
+    def _send(self, *args: str):
+        if self._sock is None:
+            raise ConnectionError("Not connected to Redis")
+        payload = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg.encode()
+            payload.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._sock.sendall(b"".join(payload))
+        return self._read_reply()
+
+    def _read_reply(self):
+        if self._reader is None:
+            raise ConnectionError("Not connected to Redis")
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Redis closed the connection")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RuntimeError(f"Redis error: {rest.decode()}")
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            return self._reader.read(length + 2)[:-2].decode()
+        if kind == b"*":
+            length = int(rest)
+            return None if length < 0 else [self._read_reply() for _ in range(length)]
+        raise ConnectionError(f"Unexpected Redis reply {line!r}")
+
+    def command(self, *args: str):
+        """Run one command, reconnecting once if the connection went away."""
+        for attempt in range(2):
+            try:
+                if self._sock is None:
+                    self._connect()
+                return self._send(*args)
+            except (OSError, ConnectionError):
+                self.close()
+                if attempt:
+                    raise
+        return None
+
+    def __contains__(self, listing_id: object) -> bool:
+        return self.command("EXISTS", self.PREFIX + str(listing_id)) == 1
+
+    def claim(self, listing_id: str) -> bool:
+        key = self.PREFIX + listing_id
+        # a value only this claim writes, see below
+        value = f"{time.time()}:{uuid.uuid4().hex}"
+        args = ["SET", key, value, "NX"]
+        if self.ttl is not None:
+            args += ["EX", str(int(self.ttl))]
+        if self.command(*args) == "OK":
+            return True
+        # command() resends after a dropped reply, and then our own first SET makes the retry fail
+        return self.command("GET", key) == value
+
+    def release(self, listing_id: str):
+        self.command("DEL", self.PREFIX + listing_id)
+
+    def _keys(self) -> List[str]:
+        keys, cursor = [], "0"
+        while True:
+            cursor, batch = self.command("SCAN", cursor, "MATCH", self.PREFIX + "*", "COUNT", "500")
+            keys.extend(batch)
+            if cursor == "0":
+                return keys
+
+    def __len__(self) -> int:
+        return len(self._keys())
+
+    def __iter__(self) -> Iterator[str]:
+        return iter([key[len(self.PREFIX):] for key in self._keys()])
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+        self._sock = self._reader = None
+
+
+def claim_id(notified_ids, listing_id: str) -> bool:
+    """claim() for a backend, or check-and-add for a plain set."""
+    if isinstance(notified_ids, NotifiedIdBackend):
+        return notified_ids.claim(listing_id)
+    if listing_id in notified_ids:
+        return False
+    notified_ids.add(listing_id)
+    return True
+
+
+def release_id(notified_ids, listing_id: str):
+    """release() for a backend, or discard for a plain set."""
+    if isinstance(notified_ids, NotifiedIdBackend):
+        notified_ids.release(listing_id)
+    else:
+        notified_ids.discard(listing_id)
+
+
+def open_notified_store(backend: str, path: str, ttl: Optional[float], url: Optional[str] = None) -> NotifiedIdBackend:
+    """Open the dedup backend named by TWICKETS_DEDUP_BACKEND: file, sqlite or redis."""
+    if backend == "file":
+        return NotifiedIdStore(path, ttl=ttl)
+    if backend == "sqlite":
+        return SqliteNotifiedIdStore(path, ttl=ttl)
+    if backend == "redis":
+        if not url:
+            raise ValueError("TWICKETS_DEDUP_URL must be set for the redis backend")
+        return RedisNotifiedIdStore(url, ttl=ttl)
+    raise ValueError(f"Unknown dedup backend {backend}")
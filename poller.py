@@ -0,0 +1,257 @@
+""" module for polling several twickets events from a single process """
+
+import asyncio
+import http.client
+import logging
+import os
+import signal
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Union
+
+from accounts import Account
+from changedetection import UnchangedListings
+from health import start_health_server_from_env
+from helpers import NotTwoHundredStatusError
+from main import TwicketsClient
+import metrics
+from notifiedstore import NotifiedIdBackend
+from snapshots import dump_in_background
+from ticketalertresponse import TicketAlertResponse
+
+
+@dataclass
+class EventState:
+    """Per-event polling state and counters."""
+    event_id: str
+    event_name: str
+    polls: int = 0
+    errors: int = 0
+    notifications: int = 0
+    unchanged: int = 0
+    total_lateness: float = 0.0
+    max_lateness: float = 0.0
+
+    def record_lateness(self, lateness: float):
+        """Track how far behind schedule a poll started."""
+        self.total_lateness += lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+
+
+def parse_events(value: Optional[str]) -> List[EventState]:
+    """
+    Parse TWICKETS_EVENTS, a semicolon separated list of event_id=event name pairs,
+    e.g. "1884916606832742400=GM Main Event;1884917808408563712=GM Camping and Parking".
+    """
+    events = []
+    for entry in (value or "").split(";"):
+        entry = entry.strip()
+        if not entry:
+            continue
+        event_id, _, event_name = entry.partition("=")
+        events.append(EventState(event_id.strip(), event_name.strip() or event_id.strip()))
+    return events
+
+
+def events_from_env() -> List[EventState]:
+    """Events to watch, falling back to the single TWICKETS_EVENT_ID deployment."""
+    events = parse_events(os.getenv("TWICKETS_EVENTS"))
+    event_id = os.getenv("TWICKETS_EVENT_ID")
+    if not events and event_id:
+        events.append(EventState(event_id, os.getenv("TWICKETS_EVENT_NAME") or event_id))
+    return events
+
+
+class MultiEventPoller:
+    """
+    Polls many events concurrently from one asyncio loop. Each event keeps its own
+    jittered MIN_TIME..MAX_TIME schedule, shortened in proportion to the client's
+    accounts that are not backing off. Each poll goes out on the account the client's
+    AccountPool picks, within that account's session and PollScheduler rate budget,
+    and all of them share at most MAX_CONNECTIONS pooled connections.
+    """
+    REQUIRED_ENV_VARIABLES = [
+        key for key in TwicketsClient.REQUIRED_ENV_VARIABLES
+        if key not in ("TWICKETS_EVENT_ID", "TWICKETS_EVENT_NAME")
+    ]
+    def __init__(self, client: TwicketsClient, events: List[EventState]):
+        if not events:
+            raise ValueError("No events configured, set TWICKETS_EVENTS or TWICKETS_EVENT_ID")
+        self.client = client
+        self.events = events
+        self.notified_ids: Union[NotifiedIdBackend, set] = set()
+        self.scheduler = client.new_scheduler(len(events))
+        self._lock = asyncio.Lock()
+        self._request_slots = asyncio.Semaphore(client.MAX_CONNECTIONS)
+
+    @property
+    def attempts(self) -> int:
+        """Consecutive blocked requests of the primary account."""
+        return self.scheduler.blocks
+
+    def next_delay(self, event_id: Optional[str] = None) -> float:
+        """Jittered delay between two polls of the same event, shorter while it is bursting or more accounts are free."""
+        return self.scheduler.next_interval(event_id) / max(1, len(self.client.accounts.available()))
+
+    async def _call(self, func, *args):
+        """Run a blocking client call on a worker thread, one at a time."""
+        async with self._lock:
+            return await asyncio.to_thread(func, *args)
+
+    async def _fetch(self, event_id: str, account: Account):
+        """
+        Fetch listings on a worker thread, as many at once as the pool has connections.
+        The account's scheduler holds the request back while it is over its rate or backing off.
+        """
+        await asyncio.sleep(account.require_scheduler().reserve())
+        async with self._request_slots:
+            return await asyncio.to_thread(self.client.check_event_availability, event_id, account)
+
+    async def _handle_blocked(self, error: NotTwoHundredStatusError, account: Account):
+        """
+        Back off the account that got a non 200 response. The other accounts carry on, and
+        the blocked one logs in again with a new session the next time it is picked.
+        """
+        accounts = self.client.accounts
+        if account.backoff_remaining() > 0:
+            # another event already started this account's backoff
+            return
+        delay = accounts.record_blocked(account, error.status, error.retry_after)
+        if accounts.backoff_remaining() > 0:
+            # every account is paused, which is progress rather than a hang
+            self.client.health.pause(accounts.backoff_remaining())
+        resume_at = datetime.now() + timedelta(seconds=delay)
+        async with self._lock:
+            self.client.transport.close()
+        if accounts.exhausted(self.client.MAX_RETRIES):
+            # If running as a k8s deployment the pod will just respawn on exit and still be
+            # inside the 403 shutout timeframe, so sleep before giving up
+            logging.error("Exiting due to repeated 403 errors at %s", resume_at.strftime("%H:%M:%S"))
+            await asyncio.sleep(delay)
+            raise error
+        logging.warning("%s. Pausing account %s until %s", error, account.name, resume_at.strftime("%H:%M:%S"))
+
+    async def poll_event(self, state: EventState) -> Optional[TicketAlertResponse]:
+        """Poll one event once with the next account and notify about any new required tickets."""
+        account = self.client.accounts.acquire()
+        try:
+            ticket_alert = await self._fetch(state.event_id, account)
+        except NotTwoHundredStatusError as error:
+            state.errors += 1
+            await self._handle_blocked(error, account)
+            return None
+        state.polls += 1
+        if isinstance(ticket_alert, UnchangedListings):
+            state.unchanged += 1
+            account.require_scheduler().record_success()
+            self.client.health.record_success()
+            return None
+        if not isinstance(ticket_alert, TicketAlertResponse):
+            state.errors += 1
+            logging.warning("No listings returned for %s", state.event_name)
+            return None
+        account.require_scheduler().record_success()
+        self.client.health.record_success()
+        if ticket_alert.has_valid_tickets:
+            sent = await self._call(self.client.process_ticket_alert, ticket_alert, self.notified_ids, state.event_name)
+            if sent:
+                state.notifications += 1
+        return ticket_alert
+
+    async def _event_loop(self, state: EventState):
+        # spread the first polls evenly so events do not all fire together, the first one straight away
+        due = time.monotonic() + self.client.MIN_TIME * self.events.index(state) / len(self.events)
+        while True:
+            await asyncio.sleep(max(0.0, due - time.monotonic()))
+            state.record_lateness(max(0.0, time.monotonic() - due))
+            try:
+                await self.poll_event(state)
+            except (http.client.HTTPException, OSError) as error:
+                state.errors += 1
+                logging.warning("Poll of %s failed: %s", state.event_name, error)
+            except NotTwoHundredStatusError:
+                # every account is out of retries
+                raise
+            except Exception:
+                # e.g. a payload that would not parse, which should not stop this or any other event
+                state.errors += 1
+                logging.exception("Poll of %s failed", state.event_name)
+            due = time.monotonic() + self.next_delay(state.event_id)
+
+    async def run(self, duration: Optional[float] = None):
+        """Authenticate every account once, or reuse their stored tokens, and poll every event until cancelled or duration elapses."""
+        self.notified_ids = self.client.load_notified_ids()
+        for account in self.client.accounts:
+            token = await asyncio.to_thread(account.tokens.get)
+            if token is None:
+                raise RuntimeError(f"Authentication failed for account {account.name}")
+        self.client.accounts.start()
+        self.client.watchdog.start()
+        logging.debug("Polling %s events", len(self.events))
+        tasks = [asyncio.create_task(self._event_loop(state)) for state in self.events]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=duration, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.client.save_notified_ids(self.notified_ids)
+            self.client.close()
+
+
+async def run_until_terminated(poller: MultiEventPoller, duration: Optional[float] = None) -> bool:
+    """
+    Run the poller, cancelling it on SIGTERM so run() flushes the notified ids, and dumping
+    the response snapshots on SIGUSR1. True if it was terminated.
+    """
+    loop = asyncio.get_running_loop()
+    task = asyncio.ensure_future(poller.run(duration))
+    handlers: Dict[int, Callable[[], object]] = {signal.SIGTERM: task.cancel}
+    if hasattr(signal, "SIGUSR1"):
+        handlers[signal.SIGUSR1] = lambda: dump_in_background(poller.client.dump_snapshots)
+    installed = []
+    for signum, handler in handlers.items():
+        try:
+            loop.add_signal_handler(signum, handler)
+            installed.append(signum)
+        except (NotImplementedError, RuntimeError):
+            # no signal handlers on this platform or off the main thread
+            pass
+    try:
+        await task
+        return False
+    except asyncio.CancelledError:
+        logging.info("Stopped polling on SIGTERM")
+        return True
+    finally:
+        for signum in installed:
+            loop.remove_signal_handler(signum)
+
+
+def main():
+    """ run da ting for every configured event """
+    client = TwicketsClient()
+    try:
+        poller = MultiEventPoller(client, events_from_env())
+        metrics.start_metrics_server_from_env()
+        start_health_server_from_env(client.health)
+        client.check_env_variables(MultiEventPoller.REQUIRED_ENV_VARIABLES)
+        asyncio.run(run_until_terminated(poller))
+    except KeyboardInterrupt:
+        logging.info("User interrupted polling with ctrl-C")
+    except NotTwoHundredStatusError as e:
+        exit_error_message = f"Exiting after {client.MAX_RETRIES + 1} consecutive blocked attempts"
+        client.prowl.send_notification(exit_error_message)
+        logging.error("%s: %s", exit_error_message, e)
+        sys.exit(exit_error_message)
+    except Exception as e:
+        logging.error("Caught exception of type %s", type(e).__name__)
+        client.prowl.send_notification(f"Caught exception {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+""" module for recording raw inventory responses and replaying them through the poll pipeline """
+
+import json
+import logging
+import os
+import re
+import time
+from typing import List, Optional, Tuple
+
+RECORDING_NAME = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class ResponseRecorder:
+    """
+    Writes raw inventory bodies to directory as <event_id>-<unix ms>.json, the format
+    scripts/check_ticket_alert_response.py and scripts/bench_pipeline.py read. Only
+    changed bodies reach the recorder, and it stops after max_files recordings.
+    """
+
+    def __init__(self, directory: str, max_files: int = 1000):
+        self.directory = directory
+        self.max_files = max_files
+        self.recorded = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def record(self, event_id: str, body: bytes) -> Optional[str]:
+        """Save one body, returning its path, or None once max_files is reached."""
+        if self.recorded >= self.max_files:
+            return None
+        name = RECORDING_NAME.sub("_", f"{event_id}-{int(time.time() * 1000)}-{self.recorded}") + ".json"
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, "wb") as f:
+                f.write(body)
+        except OSError as e:
+            logging.warning("Could not record response to %s: %s", path, e)
+            return None
+        self.recorded += 1
+        return path
+
+
+def load_corpus(directory: str) -> List[Tuple[str, bytes]]:
+    """Every recorded body in a directory as (file name, bytes), in name order."""
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".json"):
+            with open(os.path.join(directory, name), "rb") as f:
+                corpus.append((name, f.read()))
+    return corpus
+
+
+def write_corpus(directory: str, bodies: List[Tuple[str, dict]]):
+    """Save synthetic responses in the recorded format, e.g. for a reproducible benchmark corpus."""
+    os.makedirs(directory, exist_ok=True)
+    for name, payload in bodies:
+        with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+            json.dump(payload, f)
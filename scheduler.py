@@ -0,0 +1,220 @@
+""" module for pacing inventory polls to stay under the twickets rate limits """
+
+import logging
+import os
+import random
+import time
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+RATE_LIMITED_STATUSES = (403, 429)
+# numeric PollScheduler.from_env settings: variable, keyword argument and the factor to seconds
+ENV_SETTINGS = (
+    ("TWICKETS_ON_SALE_LEAD_MINUTES", "on_sale_lead", 60),
+    ("TWICKETS_ON_SALE_WINDOW_MINUTES", "on_sale_window", 60),
+    ("TWICKETS_MAX_BACKOFF", "max_backoff", 1),
+    ("TWICKETS_BURST_FACTOR", "burst_factor", 1),
+    ("TWICKETS_BURST_SECONDS", "burst_duration", 1),
+    ("TWICKETS_BURST_BUDGET", "burst_budget", 1),
+)
+
+
+def parse_on_sale_at(value: Optional[str]) -> Optional[float]:
+    """Epoch seconds for TWICKETS_ON_SALE_AT, an ISO time such as 2026-11-05T10:00:00+00:00."""
+    if not value:
+        return None
+    return datetime.fromisoformat(value).timestamp()
+
+
+def parse_burst_windows(value: Optional[str]) -> List[Tuple[float, float]]:
+    """
+    (start, end) epoch seconds for TWICKETS_BURST_WINDOWS, ISO start times each with a
+    length in minutes, e.g. 2026-11-05T10:00:00+00:00/60;2026-11-12T18:00:00+00:00/30.
+    """
+    windows = []
+    for part in (value or "").split(";"):
+        if not part.strip():
+            continue
+        start, _, minutes = part.strip().rpartition("/")
+        if not start.strip():
+            raise ValueError(f"Burst window {part!r} should be <ISO start time>/<minutes>")
+        begins = datetime.fromisoformat(start.strip()).timestamp()
+        windows.append((begins, begins + float(minutes) * 60))
+    return windows
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from a Retry-After header, which is either a number or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class PollScheduler:
+    """
+    Paces polls for one authenticated session. Each poll stream waits a jittered
+    min_interval..max_interval between polls, and every request also takes a token
+    from a bucket shared by the whole session. The bucket's refill rate is learned
+    AIMD style: each successful poll adds `increase` requests per second and each
+    403/429 multiplies the rate by `decrease`, so the session settles just below the
+    rate that gets it blocked. Blocks also pause the session for a jittered backoff
+    that doubles per consecutive block up to max_backoff. Within lead seconds before
+    and window seconds after on_sale_at the interval shrinks by on_sale_factor.
+
+    Burst mode tightens the interval of one stream to burst_factor when a new listing
+    appears on it, because listings tend to arrive in clusters. The interval then decays
+    linearly back to normal over burst_duration seconds. Every stream bursts during the
+    burst_windows. Each burst poll spends 1 - factor requests of credit, against a
+    budget of burst_budget extra requests per hour. Once the credit runs out, polling
+    returns to the normal pace until the budget refills, so bursts cannot raise the
+    long run request rate by more than the budget.
+    """
+
+    def __init__(self, min_interval: float, max_interval: float, streams: int = 1,
+                 base_backoff: float = 180, max_backoff: float = 1800, decrease: float = 0.5,
+                 on_sale_at: Optional[float] = None, on_sale_lead: float = 600, on_sale_window: float = 3600,
+                 on_sale_factor: float = 0.25, burst_factor: float = 0.25, burst_duration: float = 300,
+                 burst_budget: float = 120, burst_windows: Iterable[Tuple[float, float]] = (),
+                 clock: Callable[[], float] = time.time, rng: Optional[random.Random] = None):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.decrease = decrease
+        self.on_sale_at = on_sale_at
+        self.on_sale_lead = on_sale_lead
+        self.on_sale_window = on_sale_window
+        self.on_sale_factor = on_sale_factor
+        self.burst_factor = burst_factor
+        self.burst_duration = burst_duration
+        self.burst_budget = burst_budget
+        self.burst_windows = list(burst_windows)
+        self.burst_credit = float(burst_budget)
+        self._bursts: Dict[Optional[str], float] = {}  # stream -> when its activity burst started
+        self.clock = clock
+        self.rng = rng or random.Random()
+        # the fastest the streams would ever ask for, so the bucket only binds after a block
+        self.max_rate = 2 * streams / (min_interval * min(1.0, on_sale_factor, burst_factor))
+        self.min_rate = min(self.max_rate, 1 / max_backoff)
+        self.increase = self.max_rate / 100
+        self.capacity = max(1, streams)
+        self.rate = self.max_rate
+        self.tokens = float(self.capacity)
+        self.blocks = 0
+        self.blocked_until = 0.0
+        self._updated = clock()
+        self._credit_updated = self._updated
+
+    def on_sale(self) -> bool:
+        """True near the configured on-sale time."""
+        if self.on_sale_at is None:
+            return False
+        offset = self.clock() - self.on_sale_at
+        return -self.on_sale_lead <= offset <= self.on_sale_window
+
+    def record_activity(self, stream: Optional[str] = None):
+        """A new listing appeared on stream, start or restart its burst."""
+        self._bursts[stream] = self.clock()
+
+    def burst_multiplier(self, stream: Optional[str] = None) -> float:
+        """How much a burst would shrink stream's next interval before budgeting, 1 when not bursting."""
+        now = self.clock()
+        if any(start <= now <= end for start, end in self.burst_windows):
+            return self.burst_factor
+        started = self._bursts.get(stream)
+        if started is None:
+            return 1.0
+        elapsed = now - started
+        if elapsed >= self.burst_duration:
+            del self._bursts[stream]
+            return 1.0
+        return self.burst_factor + (1 - self.burst_factor) * elapsed / self.burst_duration
+
+    def _spend_burst_credit(self, factor: float) -> float:
+        now = self.clock()
+        self.burst_credit = min(self.burst_budget,
+                                self.burst_credit + (now - self._credit_updated) * self.burst_budget / 3600)
+        self._credit_updated = now
+        # a poll at factor times the interval costs 1 - factor requests more than a normal one
+        factor = max(factor, 1 - self.burst_credit)
+        self.burst_credit -= 1 - factor
+        return factor
+
+    def next_interval(self, stream: Optional[str] = None) -> float:
+        """Jittered delay before a stream polls again."""
+        interval = self.rng.uniform(self.min_interval, self.max_interval)
+        if self.on_sale():
+            return interval * self.on_sale_factor
+        factor = self.burst_multiplier(stream)
+        if factor < 1:
+            factor = self._spend_burst_credit(factor)
+        return interval * factor
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """
+        Take a token for one request and return how many seconds to wait before sending
+        it. Tokens may go negative, which queues later callers behind earlier ones.
+        """
+        now = self.clock()
+        self._refill(now)
+        self.tokens -= 1
+        wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def backoff_remaining(self) -> float:
+        """Seconds until the current block pause ends, 0 when not paused."""
+        return max(0.0, self.blocked_until - self.clock())
+
+    def record_success(self):
+        """Additive increase after a request the server accepted."""
+        self.blocks = 0
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def record_blocked(self, status: Optional[int] = None, retry_after: Optional[float] = None) -> float:
+        """
+        Multiplicative decrease after a rejected request. Returns how long the session
+        should pause, never less than the server's Retry-After.
+        """
+        now = self.clock()
+        self._refill(now)
+        self.blocks += 1
+        if status is None or status in RATE_LIMITED_STATUSES:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+        backoff = min(self.max_backoff, self.base_backoff * (2 ** (self.blocks - 1)))
+        delay = max(retry_after or 0.0, backoff * self.rng.uniform(0.75, 1.25))
+        self.blocked_until = now + delay
+        self.tokens = min(self.tokens, 0.0)
+        logging.info("Request rate cut to %.4f/s after %s consecutive block(s)", self.rate, self.blocks)
+        return delay
+
+    @staticmethod
+    def from_env(min_interval: float, max_interval: float, streams: int = 1, **kwargs) -> 'PollScheduler':
+        """
+        Scheduler configured from TWICKETS_ON_SALE_AT, TWICKETS_ON_SALE_LEAD_MINUTES,
+        TWICKETS_ON_SALE_WINDOW_MINUTES, TWICKETS_MAX_BACKOFF, TWICKETS_BURST_FACTOR,
+        TWICKETS_BURST_SECONDS, TWICKETS_BURST_BUDGET and TWICKETS_BURST_WINDOWS, which
+        override kwargs.
+        """
+        for name, option, scale in ENV_SETTINGS:
+            value = os.getenv(name)
+            if value:
+                kwargs[option] = float(value) * scale
+        on_sale_at = os.getenv("TWICKETS_ON_SALE_AT")
+        if on_sale_at:
+            kwargs["on_sale_at"] = parse_on_sale_at(on_sale_at)
+        burst_windows = os.getenv("TWICKETS_BURST_WINDOWS")
+        if burst_windows:
+            kwargs["burst_windows"] = parse_burst_windows(burst_windows)
+        return PollScheduler(min_interval, max_interval, streams, **kwargs)
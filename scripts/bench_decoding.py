@@ -0,0 +1,69 @@
+""" compare per poll CPU time of the JSON decoder backends against the original str decode path """
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_pipeline import synthetic_corpus
+from decoding import DECODERS, decode_inventory
+from replay import load_corpus
+from ticketalertresponse import TicketAlertResponse
+
+
+def original_path(body: bytes):
+    """What check_event_availability did before: a str copy, json.loads, then an eager from_dict."""
+    return TicketAlertResponse.from_dict(json.loads(body.decode()))
+
+
+def installed_backends() -> Dict[str, Callable[[bytes], TicketAlertResponse]]:
+    """The original path plus decode_inventory with every installed backend."""
+    cases = {"original": original_path}
+    for name, factory in DECODERS.items():
+        try:
+            decode = factory()
+        except ImportError:
+            continue
+        cases[name] = lambda body, decode=decode: decode_inventory(body, decode)
+    return cases
+
+
+def cpu_per_poll(parse: Callable[[bytes], object], body: bytes, iterations: int) -> float:
+    """Mean process CPU seconds to parse body once."""
+    parse(body)
+    start = time.process_time()
+    for _ in range(iterations):
+        parse(body)
+    return (time.process_time() - start) / iterations
+
+
+def main(corpus_dir: Optional[str], iterations: Optional[int]) -> List[dict]:
+    if corpus_dir:
+        bodies = [(name, body) for name, body in load_corpus(corpus_dir)]
+    else:
+        bodies = [(name.removesuffix(".json"), json.dumps(payload).encode()) for name, payload in synthetic_corpus()]
+    backends = installed_backends()
+    rows = []
+    print(f"{'case':>10} {'backend':>10} {'cpu us/poll':>12} {'saved':>7}")
+    for case, body in bodies:
+        count = iterations or max(5, min(2000, int(5_000_000 / max(len(body), 1))))
+        baseline = None
+        for backend, parse in backends.items():
+            seconds = cpu_per_poll(parse, body, count)
+            baseline = baseline or seconds
+            saved = 1 - seconds / baseline
+            rows.append({"case": case, "backend": backend, "cpu_us": seconds * 1e6, "saved": saved})
+            print(f"{case:>10} {backend:>10} {seconds * 1e6:12.1f} {saved:7.1%}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per poll CPU time of each installed JSON decoder backend.")
+    parser.add_argument("--corpus", help="Directory of recorded responses, e.g. from TWICKETS_RECORD_DIR")
+    parser.add_argument("--iterations", type=int)
+    args = parser.parse_args()
+    main(args.corpus, args.iterations)
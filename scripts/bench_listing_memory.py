@@ -0,0 +1,63 @@
+""" measure bytes per listing held, and parse time, for the eager and the lazy listing models """
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_twickets_server import make_inventory_response, make_listings
+from ticketalertresponse import TicketAlertResponse
+
+
+def measure(build: Callable[[], object], count: int) -> float:
+    """Bytes per listing still allocated after build() returns its result."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return (after - before) / count
+
+
+def seconds_per_listing(build: Callable[[], object], count: int, iterations: int = 5) -> float:
+    """Best of iterations wall time for build(), per listing."""
+    best = float("inf")
+    for _ in range(iterations):
+        start = time.perf_counter()
+        build()
+        best = min(best, time.perf_counter() - start)
+    return best / count
+
+
+def main(count: int) -> List[Dict[str, object]]:
+    body = json.dumps(make_inventory_response(make_listings("1884916606832742400", count, seed=1))).encode()
+    # parse from the body each time so only what the result keeps alive is counted
+    paths = {
+        "raw json dicts": lambda: json.loads(body),
+        "eager models": lambda: TicketAlertResponse.from_dict(json.loads(body)),
+        # what TwicketsClient does with LAZY_PARSING, the default
+        "lazy models": lambda: TicketAlertResponse.from_dict(json.loads(body), lazy=True),
+    }
+    rows = []
+    print(f"listings={count}")
+    print(f"{'path':>16} {'bytes/listing':>14} {'parse us/listing':>17}")
+    for name, build in paths.items():
+        row = {"path": name, "bytes": measure(build, count), "parse_us": seconds_per_listing(build, count) * 1e6}
+        rows.append(row)
+        print(f"{name:>16} {row['bytes']:14.0f} {row['parse_us']:17.2f}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory held and parse time per listing, eager and lazy.")
+    parser.add_argument("--listings", type=int, default=10000)
+    args = parser.parse_args()
+    main(args.listings)
@@ -0,0 +1,74 @@
+""" compare matching a large response listing by listing against the vectorised numpy path """
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_twickets_server import make_inventory_response, make_listings
+from matching import TicketMatcher
+from ticketalertresponse import TicketAlertResponse
+from vectorised import required_listings
+
+SIZES = (("1k", 1000), ("10k", 10000))
+RULE_SETS = {
+    "default": [{"labels": ["Adult Weekend Ticket", "Weekend Campervan Pass"]}],
+    "detailed": [
+        {"name": "campervan", "labels": ["Weekend Campervan Pass"], "max_quantity": 2, "max_price": 25000},
+        {"name": "pair", "labels": ["Adult Weekend Ticket"], "min_quantity": 2, "max_quantity": None,
+         "areas": ["Area 1", "Area 2"], "delivery_methods": ["ETICKET"]},
+    ],
+}
+
+
+def per_object(response: TicketAlertResponse, matcher: TicketMatcher) -> list:
+    """What a poll does today, has_valid_tickets then process_ticket_alert walking the listings again."""
+    if not any(matcher.matches(item) for item in response.response_data):
+        return []
+    return [item for item in response.response_data if matcher.matches(item)]
+
+
+def vectorised(response: TicketAlertResponse, matcher: TicketMatcher) -> list:
+    return required_listings(response, matcher)
+
+
+def seconds_per_call(match: Callable[[TicketAlertResponse, TicketMatcher], list], response: TicketAlertResponse,
+                     matcher: TicketMatcher, iterations: int) -> float:
+    match(response, matcher)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        match(response, matcher)
+    return (time.perf_counter() - start) / iterations
+
+
+def main(iterations: int) -> List[Dict[str, object]]:
+    rows = []
+    print(f"{'size':>5} {'rules':>9} {'parse':>6} {'matches':>8} {'per object ms':>14} {'vectorised ms':>14} {'speedup':>8}")
+    for size, count in SIZES:
+        payload = make_inventory_response(make_listings("1884916606832742400", count, seed=1))
+        for rules_name, rules in RULE_SETS.items():
+            matcher = TicketMatcher.from_config(rules)
+            for lazy in (True, False):
+                response = TicketAlertResponse.from_dict(json.loads(json.dumps(payload)), lazy=lazy)
+                expected = per_object(response, matcher)
+                if vectorised(response, matcher) != expected:
+                    raise AssertionError(f"vectorised matches differ for {size} {rules_name}")
+                slow = seconds_per_call(per_object, response, matcher, iterations)
+                fast = seconds_per_call(vectorised, response, matcher, iterations)
+                row = {"size": size, "rules": rules_name, "lazy": lazy, "matches": len(expected),
+                       "per_object_ms": slow * 1000, "vectorised_ms": fast * 1000, "speedup": slow / fast}
+                rows.append(row)
+                print(f"{size:>5} {rules_name:>9} {'lazy' if lazy else 'eager':>6} {len(expected):8d} "
+                      f"{slow * 1000:14.2f} {fast * 1000:14.2f} {slow / fast:7.1f}x")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per listing matching against vectorised.py at 1k and 10k listings.")
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+    main(args.iterations)
@@ -0,0 +1,138 @@
+""" replay inventory responses through parsing, matching and alert processing and report throughput """
+
+import argparse
+import gc
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from decoding import decode_inventory
+from fake_twickets_server import make_inventory_response, make_listing, make_listings
+from main import TwicketsClient
+from replay import load_corpus, write_corpus
+from tracing import percentile
+
+EVENT_ID = "1884916606832742400"
+SIZES = (("empty", 0), ("10", 10), ("1k", 1000), ("10k", 10000))
+
+
+class StubNotifier:
+    """Stands in for the NotificationDispatcher, counting what would have been sent."""
+
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, notification):
+        self.submitted += 1
+
+    def stop(self, timeout=None):
+        pass
+
+
+def synthetic_corpus() -> List[Tuple[str, dict]]:
+    """Responses of each benchmark size, with a few matching listings in the non-empty ones."""
+    corpus = []
+    for name, count in SIZES:
+        listings = make_listings(EVENT_ID, count, seed=1)
+        for index in range(0, count, 100):
+            listings[index] = make_listing(EVENT_ID, index, "Weekend Campervan Pass")
+        corpus.append((f"{name}.json", make_inventory_response(listings)))
+    return corpus
+
+
+def run_pipeline(client: TwicketsClient, body: bytes, lazy: bool) -> int:
+    """Decode, parse, match and process one body as check_event_availability and run would."""
+    response = decode_inventory(body, client.decode, lazy)
+    if response.has_valid_tickets:
+        client.process_ticket_alert(response, set(), "Bench Event")
+    return len(response.response_data)
+
+
+def bench_case(client: TwicketsClient, bodies: List[bytes], iterations: int, lazy: bool) -> Dict[str, float]:
+    """Timings and peak memory for replaying bodies iterations times."""
+    timings = []
+    for _ in range(iterations):
+        for body in bodies:
+            start = time.perf_counter()
+            run_pipeline(client, body, lazy)
+            timings.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    for body in bodies:
+        run_pipeline(client, body, lazy)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "parses_per_sec": len(timings) / sum(timings),
+        "p50_ms": percentile(timings, 0.5) * 1000,
+        "p99_ms": percentile(timings, 0.99) * 1000,
+        "peak_kib": peak / 1024,
+    }
+
+
+def default_iterations(bodies: List[bytes]) -> int:
+    """Enough repetitions for stable percentiles without the 10k case taking minutes."""
+    size = statistics.mean(len(body) for body in bodies)
+    return max(5, min(500, int(2_000_000 / max(size, 1))))
+
+
+def regressions(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Cases whose p50 or p99 latency grew by more than tolerance over the baseline."""
+    found = []
+    for case, stats in results.items():
+        if case not in baseline:
+            continue
+        for key in ("p50_ms", "p99_ms"):
+            if stats[key] > baseline[case][key] * (1 + tolerance):
+                found.append(f"{case} {key} {baseline[case][key]:.3f} -> {stats[key]:.3f}")
+    return found
+
+
+def main(corpus_dir: Optional[str], iterations: Optional[int], lazy: bool, save_baseline: Optional[str],
+         compare: Optional[str], tolerance: float) -> int:
+    if corpus_dir:
+        cases = {os.path.basename(os.path.normpath(corpus_dir)): [body for _, body in load_corpus(corpus_dir)]}
+    else:
+        cases = {name.removesuffix(".json"): [json.dumps(payload).encode()] for name, payload in synthetic_corpus()}
+    client = TwicketsClient()
+    client.notifier = StubNotifier()
+    results = {}
+    print(f"{'case':>10} {'parses/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'peak KiB':>10}")
+    for case, bodies in cases.items():
+        stats = bench_case(client, bodies, iterations or default_iterations(bodies), lazy)
+        results[case] = stats
+        print(f"{case:>10} {stats['parses_per_sec']:10.1f} {stats['p50_ms']:9.3f} {stats['p99_ms']:9.3f} {stats['peak_kib']:10.1f}")
+    if save_baseline:
+        with open(save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if compare:
+        with open(compare, "r", encoding="utf-8") as f:
+            found = regressions(results, json.load(f), tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.ERROR)
+    parser = argparse.ArgumentParser(description="Benchmark the poll pipeline over recorded or synthetic responses.")
+    parser.add_argument("--corpus", help="Directory of recorded responses, e.g. from TWICKETS_RECORD_DIR")
+    parser.add_argument("--write-corpus", help="Save the synthetic empty/10/1k/10k corpus to this directory and exit")
+    parser.add_argument("--iterations", type=int)
+    parser.add_argument("--eager", action="store_true", help="Parse every listing field instead of lazily")
+    parser.add_argument("--save-baseline", help="Write the results as JSON for a later --compare")
+    parser.add_argument("--compare", help="Baseline JSON to compare against, exits 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed latency growth over the baseline")
+    args = parser.parse_args()
+    if args.write_corpus:
+        write_corpus(args.write_corpus, synthetic_corpus())
+        sys.exit(0)
+    sys.exit(main(args.corpus, args.iterations, not args.eager, args.save_baseline, args.compare, args.tolerance))
@@ -0,0 +1,80 @@
+""" measure multi-event poller throughput and fairness against the fake twickets server """
+
+import argparse
+import asyncio
+import http.client
+import logging
+import os
+import statistics
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_twickets_server import FakeTwicketsState, start_server
+from accounts import account_token_file
+from main import TwicketsClient
+from poller import EventState, MultiEventPoller
+
+
+class LocalTwicketsClient(TwicketsClient):
+    """TwicketsClient pointed at a plain http fake server."""
+
+    def __init__(self, host: str, port: int, min_time: float, max_time: float):
+        self.local_host = host
+        self.local_port = port
+        super().__init__()
+        self.MIN_TIME = min_time
+        self.MAX_TIME = max_time
+        state_dir = tempfile.mkdtemp(prefix="twicketsbot-")
+        self.NOTIFIED_IDS_FILE = os.path.join(state_dir, "notified_ids.json")
+        self.tokens.path = os.path.join(state_dir, "session_token.json")
+        for account in list(self.accounts)[1:]:
+            account.tokens.path = account_token_file(self.tokens.path, account.name)
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        return http.client.HTTPConnection(self.local_host, self.local_port, timeout=self.REQUEST_TIMEOUT)
+
+    def process_ticket_alert(self, ticket_alert_response, notified_ids, event_name=None) -> bool:
+        # count matches without sending real notifications
+        return any(item.is_required_ticket for item in ticket_alert_response.response_data)
+
+
+def jain_index(values):
+    """Jain's fairness index, 1.0 when every event got the same number of polls."""
+    total = sum(values)
+    squares = sum(v * v for v in values)
+    return (total * total) / (len(values) * squares) if squares else 0.0
+
+
+def main(events: int, listings: int, duration: float, min_time: float, max_time: float):
+    server, _ = start_server(state=FakeTwicketsState(listings, seed=1))
+    host, port = server.server_address[:2]
+    client = LocalTwicketsClient(host, port, min_time, max_time)
+    states = [EventState(str(1884916606832742400 + i), f"Event {i}") for i in range(events)]
+    poller = MultiEventPoller(client, states)
+    asyncio.run(poller.run(duration))
+    server.shutdown()
+
+    polls = [state.polls for state in states]
+    lateness = [state.total_lateness / state.polls for state in states if state.polls]
+    print(f"events={events} listings/event={listings} duration={duration}s")
+    print(f"total polls={sum(polls)} ({sum(polls) / duration:.1f}/s), server requests={sum(server.state.requests.values())}")
+    print(f"polls per event min={min(polls)} max={max(polls)} mean={statistics.mean(polls):.1f}")
+    print(f"fairness (Jain)={jain_index(polls):.3f}")
+    if lateness:
+        print(f"mean lateness={statistics.mean(lateness) * 1000:.1f}ms max={max(s.max_lateness for s in states) * 1000:.1f}ms")
+    print(f"errors={sum(state.errors for state in states)} unchanged={sum(state.unchanged for state in states)}")
+    print(f"transport {client.transport.metrics.summary()}")
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.ERROR)
+    parser = argparse.ArgumentParser(description="Benchmark the multi-event poller against a local fake server.")
+    parser.add_argument("--events", type=int, default=25)
+    parser.add_argument("--listings", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--min-time", type=float, default=0.5)
+    parser.add_argument("--max-time", type=float, default=1.0)
+    args = parser.parse_args()
+    main(args.events, args.listings, args.duration, args.min_time, args.max_time)
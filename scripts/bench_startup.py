@@ -0,0 +1,92 @@
+""" measure how long the bot takes to import and to send its first poll after a cold start """
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_twickets_server import FakeTwicketsState, start_server
+
+IMPORT_TIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)")
+
+
+def import_profile(module: str = "poller") -> Tuple[float, List[Tuple[str, float]]]:
+    """Seconds to import module in a fresh interpreter, and the slowest top level imports under it."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    total, children, pending = 0.0, [], []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME.match(line)
+        if not match:
+            continue
+        cumulative, depth, name = int(match.group(2)) / 1e6, len(match.group(3)), match.group(4)
+        # children are printed before their parent, so collect them until the next top level import
+        if depth == 3:
+            pending.append((name, cumulative))
+        elif depth == 1:
+            if name == module:
+                total, children = cumulative, pending
+            pending = []
+    return total, sorted(children, key=lambda item: -item[1])
+
+
+def time_to_first_poll(timeout: float = 30.0) -> float:
+    """Seconds from launching poller.py to the fake server receiving its first inventory request."""
+    state = FakeTwicketsState(listings_per_event=10, seed=1)
+    server, _ = start_server(state=state)
+    # the poller is killed mid poll, which the server would otherwise report as a broken pipe
+    server.handle_error = lambda request, client_address: None
+    workdir = tempfile.mkdtemp(prefix="twicketsbot-startup-")
+    env = os.environ | {
+        "TWICKETS_BASE_URL": f"http://{server.server_address[0]}:{server.server_address[1]}",
+        "TWICKETS_EVENTS": "1884916606832742400=GM Main Event;1884917808408563712=GM Camping and Parking",
+        "TWICKETS_API_KEY": "bench", "TWICKETS_EMAIL": "bench", "TWICKETS_PASSWORD": "bench",
+        "TWICKETS_CLIENT_ID": "bench", "PROWL_API_KEY": "bench",
+        "TWICKETS_TOKEN_FILE": os.path.join(workdir, "session_token.json"),
+        "TWICKETS_DEDUP_PATH": os.path.join(workdir, "notified_ids.jsonl"),
+    }
+    start = time.monotonic()
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "poller.py")], cwd=workdir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while not state.request_log:
+            if time.monotonic() - start > timeout or process.poll() is not None:
+                raise RuntimeError("poller.py did not poll the fake server")
+            time.sleep(0.001)
+        # both sides read the same system wide monotonic clock
+        return state.request_log[0][0] - start
+    finally:
+        process.kill()
+        process.wait()
+        server.shutdown()
+        server.server_close()
+
+
+def main(runs: int) -> Dict[str, float]:
+    imports = [import_profile() for _ in range(runs)]
+    first_polls = [time_to_first_poll() for _ in range(runs)]
+    print("slowest imports under poller (last run):")
+    for name, seconds in imports[-1][1][:8]:
+        print(f"{name:>24} {seconds * 1000:8.1f} ms")
+    result = {
+        "import_ms": statistics.median(total for total, _ in imports) * 1000,
+        "first_poll_ms": statistics.median(first_polls) * 1000,
+    }
+    print(f"{'import poller':>24} {result['import_ms']:8.1f} ms (median of {runs})")
+    print(f"{'time to first poll':>24} {result['first_poll_ms']:8.1f} ms (median of {runs})")
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold start import time and time to first poll of poller.py.")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    main(args.runs)
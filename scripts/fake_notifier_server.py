@@ -0,0 +1,131 @@
+""" local stand-in for the prowl and telegram apis, for measuring notification latency and ordering """
+
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+from urllib.parse import parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PROWL_PATH = "/publicapi/add"
+TELEGRAM_PATH = re.compile(r"^/bot[^/]*/sendMessage$")
+
+
+class FakeNotifierState:
+    """Messages received per channel, with arrival times."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.failures = {"prowl": 0, "telegram": 0}
+        self.received: List[tuple] = []
+        self.lock = threading.Lock()
+
+    def take_failure(self, channel: str) -> bool:
+        """Consume one of the queued failures for a channel, if any are left."""
+        with self.lock:
+            if self.failures[channel] > 0:
+                self.failures[channel] -= 1
+                return True
+            return False
+
+    def messages(self, channel: str) -> List[str]:
+        """Text received on a channel, in arrival order."""
+        with self.lock:
+            return [text for _, name, text in self.received if name == channel]
+
+
+class FakeNotifierHandler(BaseHTTPRequestHandler):
+    """Accepts prowl form posts and telegram sendMessage json posts."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def _reply(self, status: int):
+        body = json.dumps({"ok": status == 200}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Record the message after the configured latency, or fail if a failure is queued."""
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path == PROWL_PATH:
+            channel, text = "prowl", parse_qs(body.decode()).get("description", [""])[0]
+        elif TELEGRAM_PATH.match(self.path):
+            channel, text = "telegram", json.loads(body).get("text", "")
+        else:
+            self._reply(404)
+            return
+        state = self.server.state
+        if state.latency:
+            time.sleep(state.latency)
+        if state.take_failure(channel):
+            self._reply(500)
+            return
+        with state.lock:
+            state.received.append((time.monotonic(), channel, text))
+        self._reply(200)
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0, state: Optional[FakeNotifierState] = None):
+    """Start the fake notifier on a background thread, returning the server and thread."""
+    server = ThreadingHTTPServer((host, port), FakeNotifierHandler)
+    server.daemon_threads = True
+    server.state = state or FakeNotifierState()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, thread
+
+
+def point_clients_at(server):
+    """Set the env variables the prowl and telegram clients read their urls from."""
+    base = f"http://{server.server_address[0]}:{server.server_address[1]}"
+    os.environ["PROWL_API_URL"] = base + PROWL_PATH
+    os.environ["TELEGRAM_API_URL"] = base
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "fake-token")
+    os.environ.setdefault("TELEGRAM_CHAT_ID", "1")
+
+
+def main(burst: int, latency: float):
+    from helpers import ProwlNoticationsClient
+    from notifications import Notification, NotificationDispatcher
+    from telegram import TelegramBotClient
+
+    server, _ = start_server(state=FakeNotifierState(latency))
+    point_clients_at(server)
+    prowl, telegram = ProwlNoticationsClient(), TelegramBotClient()
+    dispatcher = NotificationDispatcher({
+        "prowl": lambda title, message: prowl.send_notification(message),
+        "telegram": telegram.send_notification,
+    })
+    start = time.monotonic()
+    for index in range(burst):
+        dispatcher.submit(Notification("Ticket Alert", f"ticket {index}", str(index)))
+    submitted = time.monotonic() - start
+    dispatcher.flush()
+    for channel in ("prowl", "telegram"):
+        arrivals = [(at - start, text) for at, name, text in server.state.received if name == channel]
+        print(f"{channel}: {len(arrivals)} message(s), first after {arrivals[0][0] * 1000:.0f}ms")
+        for _, text in arrivals:
+            print("   " + text.replace("\n", " | "))
+    print(f"submitting {burst} notifications blocked the caller for {submitted * 1000:.2f}ms")
+    dispatcher.stop()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure notification latency and ordering against a fake Prowl/Telegram.")
+    parser.add_argument("--burst", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.3, help="Seconds each fake api call takes")
+    args = parser.parse_args()
+    main(args.burst, args.latency)
@@ -0,0 +1,115 @@
+""" local stand-in for the few redis commands the dedup backend uses """
+
+import argparse
+import fnmatch
+import socketserver
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+
+class FakeRedisState:
+    """Keys with optional expiry times."""
+
+    def __init__(self):
+        self.data: Dict[str, Tuple[str, Optional[float]]] = {}
+        self.lock = threading.Lock()
+
+    def _live(self, key: str) -> bool:
+        entry = self.data.get(key)
+        if entry is None:
+            return False
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            return False
+        return True
+
+    def execute(self, args):
+        """Run one command, returning the reply value."""
+        name = args[0].upper()
+        with self.lock:
+            if name in ("PING",):
+                return "+PONG"
+            if name in ("AUTH", "SELECT"):
+                return "+OK"
+            if name == "SET":
+                key, value, options = args[1], args[2], [a.upper() for a in args[3:]]
+                expires = None
+                if "EX" in options:
+                    expires = time.monotonic() + float(args[3 + options.index("EX") + 1])
+                if "NX" in options and self._live(key):
+                    return None
+                self.data[key] = (value, expires)
+                return "+OK"
+            if name == "GET":
+                return self.data[args[1]][0] if self._live(args[1]) else None
+            if name == "EXISTS":
+                return sum(1 for key in args[1:] if self._live(key))
+            if name == "DEL":
+                removed = [key for key in args[1:] if self._live(key)]
+                for key in removed:
+                    del self.data[key]
+                return len(removed)
+            if name == "SCAN":
+                pattern = args[args.index("MATCH") + 1] if "MATCH" in args else "*"
+                return ["0", [key for key in list(self.data) if self._live(key) and fnmatch.fnmatchcase(key, pattern)]]
+        return ValueError(f"ERR unknown command '{name}'")
+
+
+def encode(value) -> bytes:
+    """RESP encoding of a reply."""
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, ValueError):
+        return f"-{value}\r\n".encode()
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(encode(item) for item in value)
+    if value.startswith("+"):
+        return value.encode() + b"\r\n"
+    data = value.encode()
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    """Reads RESP command arrays and answers from the server's FakeRedisState."""
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            count = int(line[1:-2])
+            args = []
+            for _ in range(count):
+                length = int(self.rfile.readline()[1:-2])
+                args.append(self.rfile.read(length + 2)[:-2].decode())
+            self.wfile.write(encode(self.server.state.execute(args)))
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0, state: Optional[FakeRedisState] = None):
+    """Start the fake redis on a background thread, returning the server and thread."""
+    server = FakeRedisServer((host, port), FakeRedisHandler)
+    server.state = state or FakeRedisState()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local fake Redis for the dedup backend.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    fake_server, _ = start_server(args.host, args.port)
+    print(f"Fake Redis listening on redis://{args.host}:{fake_server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        fake_server.shutdown()
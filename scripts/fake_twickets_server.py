@@ -0,0 +1,372 @@
+""" local stand-in for the twickets login and inventory endpoints, for offline testing """
+
+import argparse
+import gzip
+import hashlib
+import http.client
+import json
+import random
+import re
+import socket
+import threading
+import time
+import zlib
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+LABELS = [
+    "Adult Weekend Ticket",
+    "Weekend Campervan Pass",
+    "Adult Day Ticket",
+    "Child Weekend Ticket",
+    "Car Parking Pass",
+]
+
+LISTINGS_PATH = re.compile(r"^/services/g2/inventory/listings/(?P<event_id>[^/?]+)")
+LOGIN_PATH = "/services/auth/login"
+CLOUDFLARE_BLOCK_PAGE = b"<!DOCTYPE html><html><head><title>Attention Required! | Cloudflare</title></head><body>Sorry, you have been blocked</body></html>"
+
+
+def make_listing(event_id: str, index: int, label: str, quantity: int = 1, price: int = 15000) -> dict:
+    """Build one listing in the shape returned by the inventory endpoint."""
+    return {
+        "type": "LISTING",
+        "area": f"Area {index % 4}",
+        "section": f"Section {index % 7}",
+        "row": "",
+        "id": f"{event_id}@{1000000 + index}",
+        "pricing": {
+            "options": "STANDARD",
+            "prices": [
+                {
+                    "id": None,
+                    "currencyCode": "GBP",
+                    "label": label,
+                    "faceValue": price,
+                    "originalFee": 1500,
+                    "netFee": 1200,
+                    "netSellingPrice": price + 1200,
+                }
+                for _ in range(quantity)
+            ],
+        },
+        "commonAttributes": [1, 4],
+        "individualAttributes": [[2] for _ in range(quantity)],
+        "splits": [quantity],
+        "deliveryMethodTypes": ["ETICKET"],
+        "sellerWillConsiderOffers": False,
+        "segmentId": f"segment-{index % 3}",
+    }
+
+
+def make_listings(event_id: str, count: int, seed: Optional[int] = None) -> List[dict]:
+    """Build a random but reproducible set of listings for an event."""
+    rng = random.Random(seed)
+    return [
+        make_listing(event_id, index, rng.choice(LABELS), rng.choice([1, 1, 1, 2, 4]), rng.randrange(5000, 30000, 500))
+        for index in range(count)
+    ]
+
+
+def make_inventory_response(listings: List[dict]) -> dict:
+    """Wrap listings in the inventory response envelope."""
+    return {
+        "responseData": listings,
+        "responseCode": 100,
+        "description": "Success",
+        "clock": datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z",
+    }
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """body in a Content-Encoding, raw-deflate being deflate without the zlib wrapper some servers send."""
+    if encoding == "gzip":
+        return gzip.compress(body)
+    if encoding == "deflate":
+        return zlib.compress(body)
+    if encoding == "raw-deflate":
+        compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        return compressor.compress(body) + compressor.flush()
+    if encoding == "br":
+        import brotli  # pylint: disable=import-outside-toplevel
+        return brotli.compress(body)
+    raise ValueError(f"Unknown encoding {encoding}")
+
+
+class FakeTwicketsState:
+    """
+    Listings served per event plus a log of the requests received, and the faults to
+    inject: every churn_interval seconds each polled event gains a listing (and half
+    the time loses one), responses are delayed by latency seconds, each request starts
+    a run of burst_length Cloudflare 403s with burst_probability, connections are
+    dropped without a reply with drop_probability (or for the next drop_requests), and
+    SimulatedConnection fails name resolution for the next dns_failures connects.
+    """
+
+    def __init__(self, listings_per_event: int = 10, seed: Optional[int] = None):
+        self.listings_per_event = listings_per_event
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.listings: Dict[str, List[dict]] = {}
+        self.appeared: Dict[str, tuple] = {}  # url id -> (monotonic time added, label)
+        self.churn_interval: Optional[float] = None
+        self.latency = 0.0
+        self.burst_probability = 0.0
+        self.burst_length = 5
+        self.drop_probability = 0.0
+        self.drop_requests = 0
+        self.dropped = 0
+        self.dns_failures = 0
+        self._next_index = 10_000_000
+        self._last_churn: Dict[str, float] = {}
+        self.requests: Dict[str, int] = {}
+        self.request_log: List[tuple] = []
+        self.logins = 0
+        self.blocked_requests = 0
+        self.idle_timeout: Optional[float] = None
+        self.send_etag = False
+        self.require_token = False
+        self.token: Optional[str] = None
+        self.tokens_seen: List[Optional[str]] = []
+        self.token_logins: Dict[str, str] = {}  # token -> the login it was issued to
+        self.blocked_logins: set = set()  # logins whose inventory requests all get a 403, like a rate limited account
+        self.connections = 0
+        self.compression: Optional[str] = None  # gzip, deflate, raw-deflate or br, when the client accepts it
+        self.chunked = False  # stream bodies with Transfer-Encoding: chunked instead of a Content-Length
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+
+    def take_blocked(self) -> bool:
+        """Consume one of the queued 403 responses, or start a new burst of them."""
+        with self.lock:
+            if self.blocked_requests == 0 and self.burst_probability and self.rng.random() < self.burst_probability:
+                self.blocked_requests = self.burst_length
+            if self.blocked_requests > 0:
+                self.blocked_requests -= 1
+                return True
+            return False
+
+    def take_drop(self) -> bool:
+        """True if this request's connection should be dropped without a reply."""
+        with self.lock:
+            drop = self.drop_requests > 0 or bool(self.drop_probability and self.rng.random() < self.drop_probability)
+            if drop:
+                self.drop_requests = max(0, self.drop_requests - 1)
+                self.dropped += 1
+            return drop
+
+    def take_dns_failure(self) -> bool:
+        """Consume one of the queued name resolution failures, if any are left."""
+        with self.lock:
+            if self.dns_failures > 0:
+                self.dns_failures -= 1
+                return True
+            return False
+
+    def _event_listings(self, event_id: str) -> List[dict]:
+        if event_id not in self.listings:
+            self.listings[event_id] = make_listings(event_id, self.listings_per_event, self.seed)
+            self._last_churn[event_id] = time.monotonic()
+        return self.listings[event_id]
+
+    def _add_listing(self, event_id: str, label: str, quantity: int = 1, price: int = 15000,
+                     appeared_at: Optional[float] = None) -> dict:
+        listing = make_listing(event_id, self._next_index, label, quantity, price)
+        self._next_index += 1
+        self._event_listings(event_id).append(listing)
+        self.appeared[listing["id"].split("@")[1]] = (appeared_at or time.monotonic(), label)
+        return listing
+
+    def add_listing(self, event_id: str, label: str, quantity: int = 1, price: int = 15000) -> dict:
+        """List a new ticket now, remembering when it appeared."""
+        with self.lock:
+            return self._add_listing(event_id, label, quantity, price)
+
+    def _churn(self, event_id: str, now: float):
+        listings = self._event_listings(event_id)
+        while self.churn_interval and now - self._last_churn[event_id] >= self.churn_interval:
+            self._last_churn[event_id] += self.churn_interval
+            if listings and self.rng.random() < 0.5:
+                listings.pop(self.rng.randrange(len(listings)))
+            # churn is applied when the event is next polled, but dated to when it was due
+            self._add_listing(event_id, self.rng.choice(LABELS), appeared_at=self._last_churn[event_id])
+
+    def listings_for(self, event_id: str) -> List[dict]:
+        """Return the listings for an event, generating them on first use."""
+        with self.lock:
+            now = time.monotonic()
+            self._event_listings(event_id)
+            self._churn(event_id, now)
+            self.requests[event_id] = self.requests.get(event_id, 0) + 1
+            self.request_log.append((now, event_id))
+            return list(self.listings[event_id])
+
+
+class FakeTwicketsHandler(BaseHTTPRequestHandler):
+    """Serves login and inventory requests from the server's FakeTwicketsState."""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        # a timeout makes the server drop idle keep-alive connections, like a real load balancer
+        self.timeout = self.server.state.idle_timeout
+        with self.server.state.lock:
+            self.server.state.connections += 1
+        super().setup()
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: Optional[dict] = None):
+        state = self.server.state
+        body = json.dumps(payload).encode()
+        encoding = state.compression
+        accepted = [value.split(";")[0].strip() for value in (self.headers.get("Accept-Encoding") or "").split(",")]
+        if encoding and encoding.replace("raw-", "") in accepted:
+            body = compress(body, encoding)
+            encoding = encoding.replace("raw-", "")
+        else:
+            encoding = None
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        if state.chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        else:
+            self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        with state.lock:
+            state.bytes_sent += len(body)
+        if not state.chunked:
+            self.wfile.write(body)
+            return
+        for start in range(0, len(body), 4096):
+            chunk = body[start:start + 4096]
+            self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _send_blocked(self):
+        self.send_response(403)
+        self.send_header("Content-Type", "text/html; charset=UTF-8")
+        self.send_header("Content-Length", str(len(CLOUDFLARE_BLOCK_PAGE)))
+        self.send_header("Server", "cloudflare")
+        self.send_header("CF-RAY", f"{random.getrandbits(64):016x}-LHR")
+        self.end_headers()
+        self.wfile.write(CLOUDFLARE_BLOCK_PAGE)
+
+    def _send_not_modified(self, etag: str):
+        self.send_response(304)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Accept any login and hand back a fixed token."""
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        if self.path.startswith(LOGIN_PATH):
+            state = self.server.state
+            try:
+                login = str(json.loads(body).get("login"))
+            except (ValueError, AttributeError):
+                login = ""
+            with state.lock:
+                state.logins += 1
+                state.token = f"fake-session-token-{state.logins}"
+                state.token_logins[state.token] = login
+            self._send_json(200, make_inventory_response([]) | {"responseData": state.token})
+            return
+        self._send_json(404, {"responseCode": 404, "description": "Not found"})
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serve the listings for the requested event."""
+        match = LISTINGS_PATH.match(self.path)
+        if match is None:
+            self._send_json(404, {"responseCode": 404, "description": "Not found"})
+            return
+        state = self.server.state
+        if state.latency:
+            time.sleep(state.latency)
+        if state.take_drop():
+            # hang up without replying, the client sees the connection reset
+            self.close_connection = True
+            return
+        token = self.headers.get("Authorization")
+        with state.lock:
+            state.tokens_seen.append(token)
+        if state.require_token and token != state.token:
+            self._send_json(401, {"responseCode": 401, "description": "Unauthorized"})
+            return
+        if self.server.state.take_blocked() or state.token_logins.get(token) in state.blocked_logins:
+            self._send_blocked()
+            return
+        listings = self.server.state.listings_for(match.group("event_id"))
+        if not self.server.state.send_etag:
+            self._send_json(200, make_inventory_response(listings))
+            return
+        etag = '"' + hashlib.sha1(json.dumps(listings).encode()).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self._send_not_modified(etag)
+            return
+        self._send_json(200, make_inventory_response(listings), {"ETag": etag})
+
+
+class SimulatedConnection(http.client.HTTPConnection):
+    """Plain http connection to the fake server that fails name resolution while the state says so."""
+
+    def __init__(self, host: str, port: int, state: FakeTwicketsState, timeout: Optional[float] = None):
+        super().__init__(host, port, timeout=timeout)
+        self.state = state
+
+    def connect(self):
+        if self.state.take_dns_failure():
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        super().connect()
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0, state: Optional[FakeTwicketsState] = None):
+    """Start the fake server on a background thread, returning the server and thread."""
+    server = ThreadingHTTPServer((host, port), FakeTwicketsHandler)
+    server.daemon_threads = True
+    server.state = state or FakeTwicketsState()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local fake Twickets inventory server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--listings", type=int, default=10, help="Listings served per event")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--blocked", type=int, default=0, help="Answer the first N inventory requests with 403")
+    parser.add_argument("--churn", type=float, default=None, help="Seconds between new listings per event")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every inventory response")
+    parser.add_argument("--burst-probability", type=float, default=0.0, help="Chance a request starts a 403 burst")
+    parser.add_argument("--burst-length", type=int, default=5)
+    parser.add_argument("--drop-probability", type=float, default=0.0, help="Chance a connection is dropped unanswered")
+    parser.add_argument("--compression", choices=("gzip", "deflate", "raw-deflate", "br"),
+                        help="Compress bodies when the client accepts the encoding")
+    parser.add_argument("--chunked", action="store_true", help="Send bodies with chunked transfer encoding")
+    args = parser.parse_args()
+
+    fake_state = FakeTwicketsState(args.listings, args.seed)
+    fake_state.blocked_requests = args.blocked
+    fake_state.churn_interval = args.churn
+    fake_state.latency = args.latency
+    fake_state.burst_probability = args.burst_probability
+    fake_state.burst_length = args.burst_length
+    fake_state.drop_probability = args.drop_probability
+    fake_state.compression = args.compression
+    fake_state.chunked = args.chunked
+    fake_server, _ = start_server(args.host, args.port, fake_state)
+    print(f"Fake Twickets server listening, point the bot at it with TWICKETS_BASE_URL=http://{args.host}:{fake_server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        fake_server.shutdown()
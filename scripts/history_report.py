@@ -0,0 +1,86 @@
+""" answer questions about listing lifetimes, prices and timing from a TWICKETS_HISTORY_DB """
+
+import argparse
+import os
+import sys
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history import ListingHistory
+
+
+def durations(history: ListingHistory, label: Optional[str] = None) -> Dict[str, float]:
+    """How long listings stayed up, in minutes."""
+    times = np.array(history.listing_times(label).fetchall(), dtype=np.float64).reshape(-1, 2)
+    minutes = (times[:, 1] - times[:, 0]) / 60
+    if not len(minutes):
+        return {"listings": 0}
+    return {
+        "listings": len(minutes),
+        "median": float(np.median(minutes)),
+        "p90": float(np.percentile(minutes, 90)),
+        "mean": float(minutes.mean()),
+        "max": float(minutes.max()),
+    }
+
+
+def median_price_by_label(history: ListingHistory, field: str = "net_selling_price") -> Dict[str, Dict[str, float]]:
+    """Median and count of one price field per ticket label, in the listing's minor currency unit."""
+    rows = history.ticket_prices(field).fetchall()
+    if not rows:
+        return {}
+    labels, inverse = np.unique(np.array([row[0] for row in rows], dtype=object), return_inverse=True)
+    prices = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+    # sort by label then price, so each label's prices are one ascending run
+    order = np.lexsort((prices, inverse))
+    prices = prices[order]
+    counts = np.bincount(inverse, minlength=len(labels))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    medians = (prices[starts + (counts - 1) // 2] + prices[starts + counts // 2]) / 2
+    return {str(label): {"median": float(median), "tickets": int(count)}
+            for label, median, count in zip(labels, medians, counts)}
+
+
+def appearances_by_hour(history: ListingHistory, label: Optional[str] = None,
+                        utc_offset: Optional[float] = None) -> np.ndarray:
+    """Listings first seen in each hour of the day, local time unless utc_offset seconds is given."""
+    offset = time.localtime().tm_gmtoff if utc_offset is None else utc_offset
+    times = np.array(history.listing_times(label).fetchall(), dtype=np.float64).reshape(-1, 2)
+    hours = ((times[:, 0] + offset) // 3600 % 24).astype(np.int64)
+    return np.bincount(hours, minlength=24)
+
+
+def main(path: str, command: str, label: Optional[str], field: str, utc: bool):
+    history = ListingHistory(path)
+    try:
+        if command == "durations":
+            stats = durations(history, label)
+            print(f"{label or 'all listings'}: " + ", ".join(
+                f"{key} {value:.1f}" if isinstance(value, float) else f"{key} {value}" for key, value in stats.items())
+                + (" (minutes)" if stats["listings"] else ""))
+        elif command == "prices":
+            for name, stats in sorted(median_price_by_label(history, field).items()):
+                print(f"{name:>30}: median {field} {stats['median'] / 100:8.2f} over {stats['tickets']} tickets")
+        else:
+            counts = appearances_by_hour(history, label, 0 if utc else None)
+            peak = max(int(counts.max()), 1)
+            for hour, count in enumerate(counts):
+                print(f"{hour:02d}:00 {int(count):6d} {'#' * round(40 * count / peak)}")
+    finally:
+        history.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Listing lifetime, price and timing analytics.")
+    parser.add_argument("command", choices=("durations", "prices", "hours"),
+                        help="How long listings stay up, median price by label, or hour of day listings appear")
+    parser.add_argument("--db", default=os.getenv("TWICKETS_HISTORY_DB", "listing_history.sqlite"))
+    parser.add_argument("--label", help="Only listings with a ticket of this label, e.g. 'Weekend Campervan Pass'")
+    parser.add_argument("--field", choices=("net_selling_price", "face_value"), default="net_selling_price")
+    parser.add_argument("--utc", action="store_true", help="Bucket hours in UTC rather than local time")
+    args = parser.parse_args()
+    main(args.db, args.command, args.label, args.field, args.utc)
@@ -0,0 +1,135 @@
+""" run the poller against the fake twickets server with faults injected and measure detection latency """
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_twickets_server import FakeTwicketsState, SimulatedConnection, start_server
+from helpers import NotTwoHundredStatusError
+from accounts import account_token_file
+from main import TwicketsClient
+from matching import get_matcher
+from poller import EventState, MultiEventPoller
+
+
+class DetectionRecorder:
+    """Stands in for the NotificationDispatcher, noting when each listing was alerted on."""
+
+    def __init__(self):
+        self.alerted: Dict[str, float] = {}
+
+    def submit(self, notification):
+        self.alerted.setdefault(notification.key, time.monotonic())
+
+    def stop(self, timeout=None):
+        pass
+
+
+class SimulatedTwicketsClient(TwicketsClient):
+    """TwicketsClient reaching the simulator through TWICKETS_BASE_URL, with retry timings scaled down."""
+    BASE_DELAY = 0.05
+    BLOCKED_BASE_DELAY = 0.5
+    BLOCKED_MAX_DELAY = 2.0
+
+    def __init__(self, state: FakeTwicketsState, min_time: float, max_time: float):
+        self.state = state
+        super().__init__()
+        self.MIN_TIME = min_time
+        self.MAX_TIME = max_time
+        self.MAX_RETRIES = 1000
+        state_dir = tempfile.mkdtemp(prefix="twicketsbot-sim-")
+        self.NOTIFIED_IDS_FILE = os.path.join(state_dir, "notified_ids.json")
+        self.tokens.path = os.path.join(state_dir, "session_token.json")
+        for account in list(self.accounts)[1:]:
+            account.tokens.path = account_token_file(self.tokens.path, account.name)
+        self.notifier = DetectionRecorder()
+
+    def _new_connection(self):
+        return SimulatedConnection(self.base_url.hostname, self.base_url.port, self.state, self.REQUEST_TIMEOUT)
+
+
+def detection_report(state: FakeTwicketsState, alerted: Dict[str, float], since: float) -> Dict[str, Optional[float]]:
+    """Seconds from each matching listing appearing to its alert, for listings added after since."""
+    matcher = get_matcher()
+    latencies, missed = [], 0
+    for url_id, (appeared_at, label) in state.appeared.items():
+        if appeared_at < since or not matcher.accepts_label(label):
+            continue
+        if url_id in alerted:
+            latencies.append(alerted[url_id] - appeared_at)
+        else:
+            missed += 1
+    latencies.sort()
+    return {
+        "detected": len(latencies),
+        "missed": missed,
+        "p50": statistics.median(latencies) if latencies else None,
+        "p95": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] if latencies else None,
+        "max": latencies[-1] if latencies else None,
+    }
+
+
+def run(events: int, listings: int, duration: float, min_time: float, max_time: float, churn: float,
+        latency: float, burst_probability: float, burst_length: int, drop_probability: float,
+        dns_failures: int) -> dict:
+    state = FakeTwicketsState(listings, seed=1)
+    state.churn_interval = churn
+    state.latency = latency
+    state.burst_probability = burst_probability
+    state.burst_length = burst_length
+    state.drop_probability = drop_probability
+    state.dns_failures = dns_failures
+    server, _ = start_server(state=state)
+    os.environ["TWICKETS_BASE_URL"] = f"http://{server.server_address[0]}:{server.server_address[1]}"
+    client = SimulatedTwicketsClient(state, min_time, max_time)
+    poller = MultiEventPoller(client, [EventState(str(1884916606832742400 + i), f"Event {i}") for i in range(events)])
+    start = time.monotonic()
+    gave_up = False
+    try:
+        asyncio.run(poller.run(duration))
+    except NotTwoHundredStatusError:
+        gave_up = True
+    finally:
+        server.shutdown()
+        server.server_close()
+        del os.environ["TWICKETS_BASE_URL"]
+    report = detection_report(state, client.notifier.alerted, start)
+    report.update({
+        "polls": sum(event.polls for event in poller.events),
+        "errors": sum(event.errors for event in poller.events),
+        "dropped": state.dropped,
+        "dns_failed": dns_failures - state.dns_failures,
+        "logins": state.logins,
+        "gave_up": gave_up,
+        "transport": client.transport.metrics.summary(),
+    })
+    return report
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.ERROR)
+    parser = argparse.ArgumentParser(description="Measure time to detect new listings against a faulty fake Twickets.")
+    parser.add_argument("--events", type=int, default=3)
+    parser.add_argument("--listings", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--min-time", type=float, default=0.5)
+    parser.add_argument("--max-time", type=float, default=1.0)
+    parser.add_argument("--churn", type=float, default=1.0, help="Seconds between new listings per event")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--burst-probability", type=float, default=0.01)
+    parser.add_argument("--burst-length", type=int, default=3)
+    parser.add_argument("--drop-probability", type=float, default=0.02)
+    parser.add_argument("--dns-failures", type=int, default=2)
+    args = parser.parse_args()
+    result = run(args.events, args.listings, args.duration, args.min_time, args.max_time, args.churn, args.latency,
+                 args.burst_probability, args.burst_length, args.drop_probability, args.dns_failures)
+    for key, value in result.items():
+        print(f"{key:>10}: {value:.3f}" if isinstance(value, float) else f"{key:>10}: {value}")
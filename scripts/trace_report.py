@@ -0,0 +1,44 @@
+""" summarise time-to-alert from a TWICKETS_TRACE_FILE """
+
+import argparse
+import os
+import statistics
+import sys
+from collections import defaultdict
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracing import load_traces, percentile
+
+
+def summarise(traces: List[dict]) -> Dict[str, Dict[str, float]]:
+    """p50/p95/max seconds per channel's time to alert and per pipeline stage."""
+    series: Dict[str, List[float]] = defaultdict(list)
+    for trace in traces:
+        for channel, seconds in trace["time_to_alert"].items():
+            series[f"alert.{channel}"].append(seconds)
+        for channel, seconds in trace.get("max_time_to_alert", {}).items():
+            series[f"alert.{channel} (from previous poll)"].append(seconds)
+        for span in trace["spans"]:
+            series[f"stage.{span['name']}"].append(span["end"] - span["start"])
+    return {
+        name: {"count": len(values), "p50": statistics.median(values), "p95": percentile(values, 0.95), "max": max(values)}
+        for name, values in sorted(series.items())
+    }
+
+
+def main(path: str):
+    traces = load_traces(path)
+    failed = sum(1 for trace in traces if trace["failed"])
+    print(f"{len(traces)} alerts traced, {failed} with a failed channel")
+    print(f"{'series':<44} {'count':>6} {'p50 s':>9} {'p95 s':>9} {'max s':>9}")
+    for name, stats in summarise(traces).items():
+        print(f"{name:<44} {stats['count']:>6} {stats['p50']:9.3f} {stats['p95']:9.3f} {stats['max']:9.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report p50/p95 time-to-alert from an alert trace file.")
+    parser.add_argument("path", help="File written via TWICKETS_TRACE_FILE")
+    args = parser.parse_args()
+    main(args.path)
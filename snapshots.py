@@ -0,0 +1,116 @@
+""" module for keeping the last raw inventory responses in memory, compressed, for debugging alerts """
+
+import logging
+import os
+import signal
+import threading
+import time
+import zlib
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List, Optional
+
+from changedetection import listing_digest
+from replay import RECORDING_NAME
+
+
+@dataclass(slots=True)
+class Snapshot:
+    """One polled response, its body kept by digest in the ring's blob table."""
+    event_id: str
+    received_at: float
+    digest: bytes
+
+
+class SnapshotRing:
+    """
+    The last capacity inventory responses across all events. Bodies are zlib compressed
+    and stored once per listing digest, so a sold out event answering the same listings
+    poll after poll costs one small entry per poll. The oldest entries are evicted
+    once there are more than capacity of them or the compressed bodies pass max_bytes.
+    dump() writes the bodies out in the format replay.load_corpus and the check scripts read.
+    """
+
+    def __init__(self, capacity: int = 100, max_bytes: int = 8 * 1024 * 1024, level: int = 1,
+                 clock: Callable[[], float] = time.time):
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.level = level
+        self.clock = clock
+        self.compressed_bytes = 0
+        self.raw_bytes = 0
+        self._entries: Deque[Snapshot] = deque()
+        self._blobs: Dict[bytes, list] = {}  # digest -> [compressed body, raw size, references]
+        # reentrant, in case a signal handler ever dumps on the thread that holds it
+        self._lock = threading.RLock()
+
+    def add(self, event_id: str, body: bytes, digest: Optional[bytes] = None, received_at: Optional[float] = None):
+        """
+        Keep a response. digest is the body's listing_digest when the caller already has it.
+        An empty body, e.g. a 304, reuses the blob of digest if it is still held.
+        """
+        digest = digest or listing_digest(body)
+        received_at = self.clock() if received_at is None else received_at
+        with self._lock:
+            blob = self._blobs.get(digest)
+            if blob is None:
+                if not body:
+                    return
+                compressed = zlib.compress(body, self.level)
+                blob = self._blobs[digest] = [compressed, len(body), 0]
+                self.compressed_bytes += len(compressed)
+                self.raw_bytes += len(body)
+            blob[2] += 1
+            self._entries.append(Snapshot(event_id, received_at, digest))
+            while self._entries and (len(self._entries) > self.capacity or self.compressed_bytes > self.max_bytes):
+                self._evict()
+
+    def _evict(self):
+        entry = self._entries.popleft()
+        blob = self._blobs[entry.digest]
+        blob[2] -= 1
+        if blob[2] == 0:
+            del self._blobs[entry.digest]
+            self.compressed_bytes -= len(blob[0])
+            self.raw_bytes -= blob[1]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def distinct(self) -> int:
+        """Distinct bodies held."""
+        return len(self._blobs)
+
+    def dump(self, directory: str) -> List[str]:
+        """Write every held response to directory as <event_id>-<unix ms>-<n>.json, oldest first."""
+        with self._lock:
+            entries = [(entry, self._blobs[entry.digest][0]) for entry in self._entries]
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for index, (entry, compressed) in enumerate(entries):
+            name = RECORDING_NAME.sub("_", f"{entry.event_id}-{int(entry.received_at * 1000)}-{index:04d}") + ".json"
+            path = os.path.join(directory, name)
+            with open(path, "wb") as f:
+                f.write(zlib.decompress(compressed))
+            paths.append(path)
+        logging.info("Dumped %s snapshots to %s", len(paths), directory)
+        return paths
+
+
+def dump_in_background(dump: Callable[[], object]) -> threading.Thread:
+    """Run dump on its own thread, so whatever the signal interrupted can finish first."""
+    thread = threading.Thread(target=dump, name="snapshot-dump", daemon=True)
+    thread.start()
+    return thread
+
+
+def install_dump_handler(dump: Callable[[], object]) -> bool:
+    """
+    Dump on SIGUSR1, e.g. kubectl exec ... kill -USR1 1, where the platform has it. The
+    handler only starts a thread, it never takes the ring's lock in the interrupted thread.
+    """
+    if not hasattr(signal, "SIGUSR1"):
+        return False
+    signal.signal(signal.SIGUSR1, lambda signum, frame: dump_in_background(dump))
+    return True
@@ -1,22 +1,26 @@
-import requests
 import os
 
 class TelegramBotClient:
 
+    TIMEOUT = 10
+
     def __init__(self):
         self.TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
         self.TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+        self.TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
     
     
     def send_notification(self,title, message):
         """Send a notification via Telegram."""
+        import requests  # pylint: disable=import-outside-toplevel  # only once a notification is actually sent
         text = f"*{title}*\n{message}"
-        url = f"https://api.telegram.org/bot{self.TELEGRAM_BOT_TOKEN}/sendMessage"
+        url = f"{self.TELEGRAM_API_URL}/bot{self.TELEGRAM_BOT_TOKEN}/sendMessage"
         payload = {
             "chat_id": self.TELEGRAM_CHAT_ID,
             "text": text,
             "parse_mode": "Markdown"
         }
-        response = requests.post(url, json=payload)
+        response = requests.post(url, json=payload, timeout=self.TIMEOUT)
         if response.status_code != 200:
             print(f"Error sending message: {response.text}")
+        response.raise_for_status()
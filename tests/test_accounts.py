@@ -0,0 +1,157 @@
+""" tests for spreading polls over several twickets accounts """
+
+import asyncio
+import random
+
+import pytest
+
+import metrics
+from accounts import (LEAST_RECENTLY_BLOCKED, ROUND_ROBIN, Account, AccountPool, account_token_file,
+                      parse_accounts)
+from bench_poller import LocalTwicketsClient
+from fake_twickets_server import FakeTwicketsState, start_server
+from poller import EventState, MultiEventPoller
+from scheduler import PollScheduler
+from tokenmanager import TokenManager
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_pool(count, strategy=ROUND_ROBIN):
+    clock = Clock()
+    accounts = [Account(str(n), f"user{n}@example.com", TokenManager(lambda: None),
+                        PollScheduler(1, 2, base_backoff=10, max_backoff=100, clock=clock, rng=random.Random(n)))
+                for n in range(1, count + 1)]
+    return AccountPool(accounts, strategy, clock), clock
+
+
+def names(pool, picks):
+    return [pool.acquire().name for _ in range(picks)]
+
+
+def test_parse_accounts_stops_at_first_gap():
+    environ = {"TWICKETS_EMAIL": "a", "TWICKETS_PASSWORD": "pa", "TWICKETS_EMAIL_2": "b", "TWICKETS_PASSWORD_2": "pb",
+               "TWICKETS_EMAIL_3": "c", "TWICKETS_EMAIL_4": "d", "TWICKETS_PASSWORD_4": "pd"}
+    assert parse_accounts(environ) == [("1", "a", "pa"), ("2", "b", "pb")]
+    assert parse_accounts({}) == [("1", None, None)]
+    assert account_token_file("state/session_token.json", "2") == "state/session_token_2.json"
+
+
+def test_round_robin_skips_blocked_accounts():
+    pool, clock = make_pool(3)
+    assert names(pool, 4) == ["1", "2", "3", "1"]
+    delay = pool.record_blocked(pool.accounts[2], 403)
+    assert names(pool, 4) == ["2", "1", "2", "1"]
+    clock.now += delay
+    assert names(pool, 3) == ["2", "3", "1"]
+
+
+def test_least_recently_blocked():
+    pool, clock = make_pool(3, LEAST_RECENTLY_BLOCKED)
+    assert names(pool, 3) == ["1", "2", "3"]
+    pool.record_blocked(pool.accounts[0], 403)
+    clock.now += 1
+    pool.record_blocked(pool.accounts[1], 403)
+    clock.now += 1000
+    # both blocks are over, the never blocked account first, then the one blocked longest ago
+    assert names(pool, 2) == ["3", "3"]
+    pool.record_blocked(pool.accounts[2], 403)
+    clock.now += 1000
+    assert names(pool, 1) == ["1"]
+
+
+def test_every_account_blocked():
+    pool, clock = make_pool(2)
+    pool.record_blocked(pool.accounts[0], 403)
+    clock.now += 1
+    pool.record_blocked(pool.accounts[1], 403)
+    assert pool.available() == [] and pool.backoff_remaining() > 0
+    # the account whose pause ends first, its scheduler makes the caller wait
+    soonest = min(pool.accounts, key=Account.backoff_remaining)
+    account = pool.acquire()
+    assert account is soonest and account.scheduler.reserve() > 0
+    assert pool.exhausted(0) and not pool.exhausted(1)
+
+
+def test_account_without_scheduler_fails_clearly():
+    account = Account("2", None, TokenManager(lambda: None))
+    assert account.backoff_remaining() == 0
+    with pytest.raises(RuntimeError, match="new_scheduler"):
+        account.require_scheduler()
+
+
+def test_rejects_bad_pools():
+    with pytest.raises(ValueError):
+        AccountPool([])
+    with pytest.raises(ValueError):
+        make_pool(1, "random")
+
+
+@pytest.fixture
+def two_accounts(monkeypatch):
+    monkeypatch.setenv("TWICKETS_EMAIL", "first@example.com")
+    monkeypatch.setenv("TWICKETS_PASSWORD", "first")
+    monkeypatch.setenv("TWICKETS_EMAIL_2", "second@example.com")
+    monkeypatch.setenv("TWICKETS_PASSWORD_2", "second")
+    server, _ = start_server(state=FakeTwicketsState(listings_per_event=5, seed=1))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_poller(server, events=4):
+    client = LocalTwicketsClient(*server.server_address[:2], 0.05, 0.1)
+    poller = MultiEventPoller(client, [EventState(str(1000 + i), f"Event {i}") for i in range(events)])
+    poller.scheduler.base_backoff = 0.1
+    return poller
+
+
+def test_polls_spread_over_accounts(two_accounts):
+    poller = make_poller(two_accounts)
+    accounts = list(poller.client.accounts)
+    assert [account.tokens.path for account in accounts][1].endswith("session_token_2.json")
+    asyncio.run(poller.run(1.0))
+    state = two_accounts.state
+    assert state.logins == 2
+    assert sorted(state.token_logins.values()) == ["first@example.com", "second@example.com"]
+    polls = [account.polls for account in accounts]
+    assert min(polls) > 0 and abs(polls[0] - polls[1]) <= 1
+    assert len(set(state.tokens_seen)) == 2
+
+
+def test_blocked_account_backs_off_alone(two_accounts):
+    two_accounts.state.blocked_logins.add("second@example.com")
+    poller = make_poller(two_accounts)
+    poller.client.MAX_RETRIES = 0
+    asyncio.run(poller.run(1.0))
+    primary, second = poller.client.accounts
+    assert second.blocks == 1 and second.backoff_remaining() > 0
+    assert primary.blocks == 0 and primary.polls > 10
+    # the blocked account was not retried, and the poller did not give up
+    assert second.polls == 1
+
+
+def test_more_free_accounts_poll_faster(two_accounts):
+    poller = make_poller(two_accounts, events=1)
+    poller.scheduler.rng = random.Random(1)
+    both = poller.next_delay("1000")
+    poller.client.accounts.record_blocked(poller.client.accounts.accounts[1], 403)
+    poller.scheduler.rng = random.Random(1)
+    assert poller.next_delay("1000") == pytest.approx(2 * both)
+    poller.client.close()
+
+
+def test_every_account_has_labelled_gauges(two_accounts):
+    poller = make_poller(two_accounts)
+    text = metrics.REGISTRY.render()
+    for name in ("twickets_backoff_seconds", "twickets_request_rate", "twickets_burst_credit"):
+        assert f'{name}{{account="1"}}' in text and f'{name}{{account="2"}}' in text
+    poller.client.accounts.record_blocked(poller.client.accounts.accounts[1], 403)
+    assert 'twickets_backoff_seconds{account="1"} 0' in metrics.REGISTRY.render()
+    poller.client.close()
@@ -0,0 +1,63 @@
+""" tests for skipping the parse of unchanged inventory responses """
+
+import json
+
+import pytest
+
+from bench_poller import LocalTwicketsClient
+from changedetection import ListingChangeDetector, UnchangedListings, listing_digest
+from fake_twickets_server import FakeTwicketsState, make_inventory_response, make_listing, start_server
+from ticketalertresponse import TicketAlertResponse
+from transport import TransportResponse
+
+
+@pytest.fixture
+def fake_server():
+    server, _ = start_server(state=FakeTwicketsState(listings_per_event=3, seed=1))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(fake_server):
+    host, port = fake_server.server_address[:2]
+    return LocalTwicketsClient(host, port, 0.1, 0.2)
+
+
+def body_for(listings, clock):
+    return json.dumps(make_inventory_response(listings) | {"clock": clock}).encode()
+
+
+def test_digest_ignores_clock():
+    listings = [make_listing("1", 0, "Adult Weekend Ticket")]
+    assert listing_digest(body_for(listings, "2025-03-01T10:00:00Z")) == listing_digest(body_for(listings, "2025-03-01T10:00:15Z"))
+    assert listing_digest(body_for(listings, "x")) != listing_digest(body_for([], "x"))
+
+
+def test_detector_tracks_validators():
+    detector = ListingChangeDetector()
+    first = TransportResponse(200, {"etag": '"abc"', "last-modified": "Sat, 01 Mar 2025 10:00:00 GMT"}, body_for([], "a"))
+    assert not detector.is_unchanged(first)
+    assert detector.conditional_headers() == {"If-None-Match": '"abc"', "If-Modified-Since": "Sat, 01 Mar 2025 10:00:00 GMT"}
+    assert detector.is_unchanged(TransportResponse(304, {}, b""))
+    assert detector.is_unchanged(TransportResponse(200, {}, body_for([], "b")))
+    detector.reset()
+    assert not detector.is_unchanged(TransportResponse(200, {}, body_for([], "b")))
+
+
+def test_client_skips_parse_of_identical_listings(client, fake_server):
+    assert isinstance(client.check_event_availability("1"), TicketAlertResponse)
+    unchanged = client.check_event_availability("1")
+    assert unchanged == UnchangedListings("1", False)
+    fake_server.state.listings["1"].append(make_listing("1", 99, "Weekend Campervan Pass"))
+    changed = client.check_event_availability("1")
+    assert isinstance(changed, TicketAlertResponse)
+    assert len(changed.response_data) == 4
+
+
+def test_client_honours_etag(client, fake_server):
+    fake_server.state.send_etag = True
+    assert isinstance(client.check_event_availability("1"), TicketAlertResponse)
+    assert client.check_event_availability("1") == UnchangedListings("1", True)
+    assert client.change_detectors["1"].unchanged == 1
@@ -0,0 +1,57 @@
+""" tests for the pluggable inventory JSON decoders """
+
+import json
+
+import pytest
+
+from bench_decoding import installed_backends
+from decoding import DECODERS, decode_inventory, load_decoder
+from fake_twickets_server import make_inventory_response, make_listings
+from main import TwicketsClient
+
+BODY = json.dumps(make_inventory_response(make_listings("1", 20, seed=1))).encode()
+
+
+def missing():
+    raise ImportError("not installed")
+
+
+def test_auto_picks_first_installed(monkeypatch):
+    monkeypatch.setitem(DECODERS, "orjson", missing)
+    monkeypatch.setitem(DECODERS, "msgspec", missing)
+    assert load_decoder()[0] == "json"
+    assert load_decoder("auto")[0] == "json"
+
+
+def test_named_backend_falls_back_to_stdlib(monkeypatch):
+    monkeypatch.setitem(DECODERS, "msgspec", missing)
+    name, decode = load_decoder("msgspec")
+    assert name == "json"
+    assert decode is json.loads
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        load_decoder("simdjson")
+
+
+@pytest.mark.parametrize("backend", list(DECODERS))
+def test_backends_agree(backend):
+    try:
+        decode = DECODERS[backend]()
+    except ImportError:
+        pytest.skip(f"{backend} is not installed")
+    expected = decode_inventory(BODY, json.loads, lazy=False)
+    assert decode_inventory(BODY, decode, lazy=False) == expected
+    lazy = decode_inventory(BODY, decode)
+    assert [item.to_dict() for item in lazy.response_data] == [item.to_dict() for item in expected.response_data]
+
+
+def test_bench_backends_match_original():
+    results = {name: parse(BODY).to_dict() for name, parse in installed_backends().items()}
+    assert all(result == results["original"] for result in results.values())
+
+
+def test_client_uses_configured_decoder(monkeypatch):
+    monkeypatch.setenv("TWICKETS_JSON_DECODER", "json")
+    assert TwicketsClient().decoder_name == "json"
@@ -0,0 +1,145 @@
+""" tests for sharing notified ids between replicas """
+
+import threading
+import time
+
+import pytest
+
+from fake_redis_server import start_server
+from notifiedstore import (NotifiedIdStore, RedisNotifiedIdStore, SqliteNotifiedIdStore, claim_id, open_notified_store,
+                           release_id)
+
+
+@pytest.fixture
+def redis_url():
+    server, _ = start_server()
+    yield f"redis://127.0.0.1:{server.server_address[1]}/0"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(params=["file", "sqlite", "redis"])
+def store(request, tmp_path, redis_url):
+    store = open_notified_store(request.param, str(tmp_path / "ids"), ttl=3600, url=redis_url)
+    yield store
+    store.close()
+
+
+def test_claim_only_succeeds_once(store):
+    assert store.claim("1")
+    assert not store.claim("1")
+    assert "1" in store and "2" not in store
+    store.add("2")
+    assert set(store) == {"1", "2"}
+    assert len(store) == 2
+
+
+def test_released_ids_can_be_claimed_again(store):
+    assert store.claim("1") and store.claim("2")
+    release_id(store, "1")
+    assert "1" not in store and "2" in store
+    assert store.claim("1")
+
+
+def test_release_survives_a_restart(tmp_path):
+    path = str(tmp_path / "ids.jsonl")
+    store = NotifiedIdStore(path)
+    store.add("1")
+    store.add("2")
+    store.release("1")
+    store.close()
+    assert set(NotifiedIdStore(path)) == {"2"}
+
+
+def test_claim_id_works_with_a_plain_set():
+    ids = set()
+    assert claim_id(ids, "1")
+    assert not claim_id(ids, "1")
+    release_id(ids, "1")
+    assert claim_id(ids, "1")
+
+
+def claim_from_replicas(make_store, listing_ids, replicas=4):
+    """Have several stores race to claim the same ids, returning the winning claims."""
+    winners = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(replicas)
+
+    def replica():
+        store = make_store()
+        barrier.wait()
+        for listing_id in listing_ids:
+            if store.claim(listing_id):
+                with lock:
+                    winners.append(listing_id)
+        store.close()
+
+    threads = [threading.Thread(target=replica) for _ in range(replicas)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return winners
+
+
+def test_sqlite_replicas_never_both_claim(tmp_path):
+    path = str(tmp_path / "shared.sqlite")
+    SqliteNotifiedIdStore(path).close()
+    ids = [str(i) for i in range(50)]
+    assert sorted(claim_from_replicas(lambda: SqliteNotifiedIdStore(path), ids)) == sorted(ids)
+
+
+def test_redis_replicas_never_both_claim(redis_url):
+    ids = [str(i) for i in range(50)]
+    assert sorted(claim_from_replicas(lambda: RedisNotifiedIdStore(redis_url), ids)) == sorted(ids)
+
+
+def test_sqlite_expired_ids_can_be_claimed_again(tmp_path):
+    now = [1000.0]
+    store = SqliteNotifiedIdStore(str(tmp_path / "ids.sqlite"), ttl=10, clock=lambda: now[0])
+    assert store.claim("1")
+    now[0] += 20
+    assert "1" not in store
+    assert store.claim("1")
+    assert not store.claim("1")
+
+
+def test_redis_ids_expire(redis_url):
+    store = RedisNotifiedIdStore(redis_url, ttl=1)
+    assert store.claim("1")
+    time.sleep(1.1)
+    assert "1" not in store
+
+
+def test_redis_reconnects_after_drop(redis_url):
+    store = RedisNotifiedIdStore(redis_url)
+    assert store.claim("1")
+    store._sock.close()  # pylint: disable=protected-access
+    assert "1" in store
+
+
+def test_unknown_backend(tmp_path):
+    with pytest.raises(ValueError):
+        open_notified_store("memcached", str(tmp_path / "ids"), None)
+    with pytest.raises(ValueError):
+        open_notified_store("redis", str(tmp_path / "ids"), None)
+    assert isinstance(open_notified_store("file", str(tmp_path / "ids"), None), NotifiedIdStore)
+
+
+def test_redis_claim_survives_a_dropped_reply(redis_url):
+    store = RedisNotifiedIdStore(redis_url)
+    send = store._send  # pylint: disable=protected-access
+    dropped = []
+
+    def drop_first_set_reply(*args):
+        reply = send(*args)
+        if args[0] == "SET" and not dropped:
+            dropped.append(args)
+            raise ConnectionError("reply lost")
+        return reply
+
+    store._send = drop_first_set_reply  # pylint: disable=protected-access
+    # the resent SET finds the key our first SET wrote, which is still our claim
+    assert store.claim("1")
+    assert dropped and not store.claim("1")
+    store.close()
@@ -0,0 +1,86 @@
+""" tests for diffing successive inventory responses into listing events """
+
+import pytest
+
+import metrics
+from bench_poller import LocalTwicketsClient
+from diffing import DELISTED, LISTED, PRICE_DROPPED, QUANTITY_CHANGED, ListingDiffer
+from fake_twickets_server import FakeTwicketsState, make_inventory_response, make_listing, start_server
+from ticketalertresponse import TicketAlertResponse
+
+
+def response(*listings, lazy=True):
+    return TicketAlertResponse.from_dict(make_inventory_response(list(listings)), lazy=lazy)
+
+
+def kinds(events):
+    return sorted((event.kind, event.url_id) for event in events)
+
+
+def test_first_response_is_the_baseline():
+    differ = ListingDiffer()
+    assert differ.diff("1", response(make_listing("1", 1, "Adult Day Ticket"))) == []
+
+
+@pytest.mark.parametrize("lazy", [True, False])
+def test_listing_events(lazy):
+    differ = ListingDiffer()
+    differ.diff("1", response(make_listing("1", 1, "Adult Day Ticket", price=10000),
+                              make_listing("1", 2, "Adult Day Ticket", quantity=2),
+                              make_listing("1", 3, "Adult Day Ticket"), lazy=lazy))
+    events = differ.diff("1", response(make_listing("1", 1, "Adult Day Ticket", price=8000),
+                                       make_listing("1", 2, "Adult Day Ticket", quantity=1),
+                                       make_listing("1", 4, "Adult Day Ticket"), lazy=lazy))
+    assert kinds(events) == [(DELISTED, "1000003"), (LISTED, "1000004"),
+                             (PRICE_DROPPED, "1000001"), (QUANTITY_CHANGED, "1000002")]
+    drop = next(event for event in events if event.kind == PRICE_DROPPED)
+    assert (drop.previous_price, drop.price) == (11200, 9200)
+    delisted = next(event for event in events if event.kind == DELISTED)
+    assert delisted.listing is None and delisted.previous_quantity == 1
+
+
+def test_price_rise_and_other_events_are_separate():
+    differ = ListingDiffer()
+    differ.diff("1", response(make_listing("1", 1, "Adult Day Ticket", price=10000)))
+    differ.diff("2", response(make_listing("2", 1, "Adult Day Ticket")))
+    assert differ.diff("1", response(make_listing("1", 1, "Adult Day Ticket", price=12000))) == []
+    assert differ.diff("2", response(make_listing("2", 1, "Adult Day Ticket"))) == []
+
+
+def test_subscribers_by_kind():
+    differ = ListingDiffer()
+    seen, drops = [], []
+    differ.subscribe(seen.append)
+    differ.subscribe(drops.append, [PRICE_DROPPED])
+    differ.subscribe(lambda event: 1 / 0, [LISTED])
+    differ.diff("1", response(make_listing("1", 1, "Adult Day Ticket", price=10000)))
+    differ.diff("1", response(make_listing("1", 1, "Adult Day Ticket", price=9000), make_listing("1", 2, "Adult Day Ticket")))
+    assert kinds(seen) == [(LISTED, "1000002"), (PRICE_DROPPED, "1000001")]
+    assert kinds(drops) == [(PRICE_DROPPED, "1000001")]
+    with pytest.raises(ValueError):
+        differ.subscribe(seen.append, ["price_rose"])
+
+
+def test_client_alerts_on_price_drop(monkeypatch):
+    monkeypatch.setenv("TWICKETS_ALERT_PRICE_DROPS", "true")
+    server, _ = start_server(state=FakeTwicketsState(listings_per_event=0, seed=1))
+    state = server.state
+    state.listings["1"] = [make_listing("1", 1, "Weekend Campervan Pass", price=20000)]
+    client = LocalTwicketsClient(*server.server_address[:2], 0.1, 0.2)
+    submitted = []
+    client.notifier.submit = submitted.append
+    try:
+        client.check_event_availability("1")
+        state.listings["1"] = [make_listing("1", 1, "Weekend Campervan Pass", price=15000)]
+        client.check_event_availability("1")
+        client.check_event_availability("1")
+        state.listings["1"] = [make_listing("1", 1, "Weekend Campervan Pass", price=15000),
+                               make_listing("1", 2, "Adult Day Ticket", price=15000)]
+        client.check_event_availability("1")
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+    assert [(n.title, n.key) for n in submitted] == [("Price Drop", "1000001")]
+    assert "212.00 to 162.00" in submitted[0].message
+    assert metrics.LISTING_CHANGES.value(event="1", kind=PRICE_DROPPED) >= 1
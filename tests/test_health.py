@@ -0,0 +1,120 @@
+""" tests for the liveness and readiness probes and the stuck request watchdog """
+
+import asyncio
+import http.client
+import json
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from bench_poller import LocalTwicketsClient
+from fake_twickets_server import FakeTwicketsState, start_server
+from health import HealthState, Watchdog, start_health_server
+from poller import EventState, MultiEventPoller
+from simulate_load import SimulatedTwicketsClient
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_liveness_follows_last_success():
+    clock = FakeClock()
+    state = HealthState(max_age=60, startup_grace=30, clock=clock)
+    assert state.liveness()[0]
+    clock.now += 89
+    assert state.liveness()[0]  # still inside grace plus max age
+    clock.now += 2
+    assert not state.liveness()[0]
+    state.record_success()
+    ok, detail = state.liveness()
+    assert ok and detail["last_success_age"] == 0
+    clock.now += 61
+    assert not state.liveness()[0]
+
+
+def test_pause_keeps_liveness_but_drops_readiness():
+    clock = FakeClock()
+    state = HealthState(max_age=60, startup_grace=0, clock=clock)
+    assert not state.readiness()[0]
+    state.record_success()
+    assert state.readiness()[0]
+    state.pause(3600)
+    assert not state.readiness()[0]
+    clock.now += 3000
+    ok, detail = state.liveness()
+    assert ok and detail["paused_for"] == 600
+    clock.now += 600 + 61
+    assert not state.liveness()[0]
+
+
+def test_probe_endpoints():
+    clock = FakeClock()
+    state = HealthState(max_age=60, startup_grace=0, clock=clock)
+    server = start_health_server(state, 0, host="127.0.0.1")
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(base + "/readyz", timeout=5)
+        assert error.value.code == 503
+        state.record_success()
+        with urllib.request.urlopen(base + "/readyz", timeout=5) as response:
+            assert json.loads(response.read()) == {"ready": True, "ok": True}
+        with urllib.request.urlopen(base + "/healthz", timeout=5) as response:
+            assert response.status == 200
+        clock.now += 61
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(base + "/healthz", timeout=5)
+        assert error.value.code == 503
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def slow_server(monkeypatch):
+    server, _ = start_server(state=FakeTwicketsState(listings_per_event=3, seed=1))
+    monkeypatch.setenv("TWICKETS_BASE_URL", f"http://{server.server_address[0]}:{server.server_address[1]}")
+    yield server
+    server.state.latency = 0
+    server.shutdown()
+    server.server_close()
+
+
+def test_watchdog_aborts_stuck_request(slow_server):
+    client = SimulatedTwicketsClient(slow_server.state, 0.1, 0.2)
+    client.tokens.refresh()
+    slow_server.state.latency = 5
+    watchdog = Watchdog(client.transport, request_timeout=0.2, interval=0.05)
+    watchdog.start()
+    start = time.monotonic()
+    try:
+        with pytest.raises((http.client.HTTPException, OSError)):
+            client.check_event_availability("1884916606832742400")
+    finally:
+        watchdog.stop()
+        client.close()
+    assert time.monotonic() - start < 2
+    assert client.transport.metrics.aborted == 1
+
+
+def test_poller_pauses_health_while_blocked():
+    server, _ = start_server(state=FakeTwicketsState(listings_per_event=3, seed=1))
+    server.state.blocked_requests = 1
+    client = LocalTwicketsClient(server.server_address[0], server.server_address[1], 0.1, 0.2)
+    poller = MultiEventPoller(client, [EventState("1", "One")])
+    poller.scheduler.base_backoff = 0.1
+    try:
+        asyncio.run(poller.run(1.0))
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert client.health.paused_until > client.health.started
+    assert client.health.last_success > client.health.paused_until - 0.2
+    assert client.health.readiness()[0]
@@ -0,0 +1,99 @@
+""" tests for the listing history store and its analytics """
+
+import pytest
+
+from bench_poller import LocalTwicketsClient
+from fake_twickets_server import FakeTwicketsState, make_inventory_response, make_listing, start_server
+from history import ListingHistory
+from history_report import appearances_by_hour, durations, median_price_by_label
+from ticketalertresponse import TicketAlertResponse
+
+
+def response(*listings, lazy=True):
+    return TicketAlertResponse.from_dict(make_inventory_response(list(listings)), lazy=lazy)
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = ListingHistory(str(tmp_path / "history.sqlite"))
+    yield history
+    history.close()
+
+
+def test_listings_are_stored_once_and_extended(history):
+    a = make_listing("1", 1, "Weekend Campervan Pass", price=20000)
+    b = make_listing("1", 2, "Adult Weekend Ticket", quantity=2)
+    assert history.record("1", response(a, b), seen_at=0) == 2
+    assert history.record("1", response(a, b, lazy=False), seen_at=60) == 0
+    history.touch("1", 120)
+    assert history.record("1", response(a), seen_at=180) == 0
+    history.touch("1", 240)
+    assert len(history) == 2
+    times = dict(zip(["1@1000001", "1@1000002"], history._db.execute(
+        "SELECT last_seen - first_seen FROM listings ORDER BY id").fetchall()))
+    assert times == {"1@1000001": (240,), "1@1000002": (120,)}
+    assert history._db.execute("SELECT COUNT(*) FROM prices").fetchone()[0] == 3
+
+
+def test_touch_before_any_record_is_ignored(history):
+    history.touch("1", 10)
+    assert len(history) == 0
+
+
+def test_history_survives_restart(tmp_path):
+    path = str(tmp_path / "history.sqlite")
+    history = ListingHistory(path)
+    history.record("1", response(make_listing("1", 1, "Adult Day Ticket")), seen_at=0)
+    history.close()
+    history = ListingHistory(path)
+    assert history.record("1", response(make_listing("1", 1, "Adult Day Ticket")), seen_at=300) == 0
+    assert durations(history)["max"] == 5
+    history.close()
+
+
+def test_durations_by_label(history):
+    for index, minutes in enumerate((10, 20, 30)):
+        history.record("1", response(make_listing("1", index, "Weekend Campervan Pass")), seen_at=index * 3600)
+        history.touch("1", index * 3600 + minutes * 60)
+    history.record("1", response(make_listing("1", 9, "Adult Day Ticket")), seen_at=4 * 3600)
+    stats = durations(history, "Weekend Campervan Pass")
+    assert stats["listings"] == 3
+    assert stats["median"] == 20
+    assert stats["max"] == 30
+    assert durations(history, "Nothing")["listings"] == 0
+
+
+def test_median_price_by_label(history):
+    listings = [make_listing("1", index, "Adult Weekend Ticket", price=price)
+                for index, price in enumerate((10000, 30000, 20000, 40000))]
+    listings.append(make_listing("1", 10, "Weekend Campervan Pass", quantity=3, price=5000))
+    history.record("1", response(*listings), seen_at=0)
+    medians = median_price_by_label(history, "face_value")
+    assert medians == {"Adult Weekend Ticket": {"median": 25000, "tickets": 4},
+                       "Weekend Campervan Pass": {"median": 5000, "tickets": 3}}
+    assert median_price_by_label(history)["Weekend Campervan Pass"]["median"] == 6200
+
+
+def test_appearances_by_hour(history):
+    for index, hour in enumerate((9, 9, 17)):
+        history.record(str(index), response(make_listing(str(index), index, "Adult Day Ticket")), seen_at=hour * 3600 + 5)
+    counts = appearances_by_hour(history, utc_offset=0)
+    assert counts[9] == 2 and counts[17] == 1 and counts.sum() == 3
+    assert appearances_by_hour(history, utc_offset=3600)[10] == 2
+
+
+def test_client_records_history(tmp_path, monkeypatch):
+    monkeypatch.setenv("TWICKETS_HISTORY_DB", str(tmp_path / "history.sqlite"))
+    server, _ = start_server(state=FakeTwicketsState(listings_per_event=3, seed=1))
+    server.state.send_etag = True
+    client = LocalTwicketsClient(*server.server_address[:2], 0.1, 0.2)
+    try:
+        client.check_event_availability("1")
+        client.check_event_availability("1")
+        assert len(client.history) == 3
+        first, last = client.history._db.execute("SELECT MIN(first_seen), MAX(last_seen) FROM listings").fetchone()
+        assert last > first
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,94 @@
+""" tests for the configurable ticket matching rules """
+
+import json
+
+import pytest
+
+import matching
+from fake_twickets_server import make_inventory_response, make_listing, make_listings
+from matching import DEFAULT_RULE, TicketMatcher, TicketRule, load_matcher_from_env, set_matcher
+from ticketalertresponse import LazyResponseDatum, ResponseDatum, TicketAlertResponse
+
+
+@pytest.fixture(autouse=True)
+def restore_matcher():
+    yield
+    set_matcher(TicketMatcher([DEFAULT_RULE]))
+
+
+def listing(label="Weekend Campervan Pass", quantity=1, price=15000, index=0):
+    return make_listing("1", index, label, quantity, price)
+
+
+@pytest.mark.parametrize("parse", [ResponseDatum.from_dict, LazyResponseDatum])
+def test_default_rule_keeps_single_weekend_ticket_behaviour(parse):
+    assert parse(listing()).is_required_ticket
+    assert parse(listing("Adult Weekend Ticket")).is_required_ticket
+    assert not parse(listing(quantity=2)).is_required_ticket
+    assert not parse(listing("Adult Day Ticket")).is_required_ticket
+
+
+@pytest.mark.parametrize("parse", [ResponseDatum.from_dict, LazyResponseDatum])
+def test_configured_rule_filters(parse):
+    area = listing(index=1)["area"]
+    matcher = TicketMatcher.from_config({"rules": [{
+        "name": "cheap campervan",
+        "labels": ["Weekend Campervan Pass"],
+        "min_quantity": 1,
+        "max_quantity": 2,
+        "max_price": 16200,
+        "areas": [area],
+        "delivery_methods": ["ETICKET"],
+    }]})
+    assert matcher.matches(parse(listing(index=1)))
+    assert matcher.matches(parse(listing(quantity=2, index=1)))
+    assert not matcher.matches(parse(listing(quantity=3, index=1)))
+    assert not matcher.matches(parse(listing(price=15500, index=1)))
+    assert not matcher.matches(parse(listing(index=2)))
+    assert not matcher.matches(parse(listing("Adult Weekend Ticket", index=1)))
+
+
+def test_face_value_and_any_quantity():
+    matcher = TicketMatcher([TicketRule(max_quantity=None, max_price=15000, price_field="face_value")])
+    assert matcher.matches(ResponseDatum.from_dict(listing("Anything", quantity=4, price=15000)))
+    assert not matcher.matches(ResponseDatum.from_dict(listing("Anything", quantity=4, price=15500)))
+
+
+def test_any_rule_matching_is_enough():
+    matcher = TicketMatcher.from_config([{"labels": "Car Parking Pass"}, {"labels": "Adult Day Ticket", "max_quantity": 2}])
+    assert matcher.matches(ResponseDatum.from_dict(listing("Car Parking Pass")))
+    assert matcher.matches(ResponseDatum.from_dict(listing("Adult Day Ticket", quantity=2)))
+    assert not matcher.matches(ResponseDatum.from_dict(listing("Car Parking Pass", quantity=2)))
+    assert matcher.accepts_label("Car Parking Pass") and not matcher.accepts_label("Weekend Campervan Pass")
+
+
+def test_rejects_bad_config():
+    with pytest.raises(ValueError):
+        TicketRule.from_dict({"label": "typo"})
+    with pytest.raises(ValueError):
+        TicketRule.from_dict({"price_field": "net_fee"})
+    with pytest.raises(ValueError):
+        TicketMatcher([])
+
+
+def test_models_delegate_to_active_matcher():
+    response = make_inventory_response(make_listings("1", 200, seed=4))
+    set_matcher(TicketMatcher.from_config([{"labels": ["Car Parking Pass"], "max_quantity": None}]))
+    for lazy in (False, True):
+        parsed = TicketAlertResponse.from_dict(response, lazy=lazy)
+        required = list(parsed.required_tickets())
+        assert required and all(item.labels == ("Car Parking Pass",) * item.number_of_tickets for item in required)
+        assert parsed.has_valid_tickets
+
+
+def test_load_from_env(monkeypatch, tmp_path):
+    monkeypatch.delenv("TWICKETS_MATCH_RULES", raising=False)
+    monkeypatch.delenv("TWICKETS_MATCH_RULES_FILE", raising=False)
+    assert load_matcher_from_env().rules == [DEFAULT_RULE]
+    rules_file = tmp_path / "rules.json"
+    rules_file.write_text(json.dumps({"rules": [{"name": "from file", "labels": ["Adult Day Ticket"]}]}))
+    monkeypatch.setenv("TWICKETS_MATCH_RULES_FILE", str(rules_file))
+    assert load_matcher_from_env().rules[0].name == "from file"
+    monkeypatch.setenv("TWICKETS_MATCH_RULES", json.dumps([{"name": "from env"}]))
+    assert load_matcher_from_env().rules[0].name == "from env"
+    assert matching.get_matcher().rules == [DEFAULT_RULE]
@@ -0,0 +1,80 @@
+""" tests for the prometheus text metrics and the client instrumentation """
+
+import urllib.request
+
+import pytest
+
+import metrics
+from bench_poller import LocalTwicketsClient
+from fake_twickets_server import FakeTwicketsState, start_server
+from helpers import NotTwoHundredStatusError
+
+
+def test_render_counters_and_histograms():
+    registry = metrics.Registry()
+    polls = registry.register(metrics.Counter("polls_total", "Polls", ("event",)))
+    seconds = registry.register(metrics.Histogram("poll_seconds", "Poll time", (0.1, 1)))
+    registry.register(metrics.CallbackMetric("reuse_ratio", "Reuse", lambda: [({}, 0.5)]))
+    polls.inc(event='a "quoted" name')
+    polls.inc(2, event="b")
+    seconds.observe(0.05)
+    seconds.observe(0.5)
+    seconds.observe(5)
+    text = registry.render()
+    assert '# TYPE polls_total counter' in text
+    assert 'polls_total{event="a \\"quoted\\" name"} 1' in text
+    assert 'polls_total{event="b"} 2' in text
+    assert 'poll_seconds_bucket{le="0.1"} 1' in text
+    assert 'poll_seconds_bucket{le="1"} 2' in text
+    assert 'poll_seconds_bucket{le="+Inf"} 3' in text
+    assert 'poll_seconds_sum 5.55' in text
+    assert 'poll_seconds_count 3' in text
+    assert 'reuse_ratio 0.5' in text
+
+
+def test_labels_must_match():
+    counter = metrics.Counter("x_total", "X", ("event",))
+    with pytest.raises(ValueError):
+        counter.inc(status="403")
+
+
+def test_broken_callback_is_skipped():
+    registry = metrics.Registry()
+    registry.register(metrics.CallbackMetric("broken", "Broken", lambda: 1 / 0))
+    assert registry.render().endswith("# TYPE broken gauge\n")
+
+
+@pytest.fixture
+def fake_server():
+    server, _ = start_server(state=FakeTwicketsState(listings_per_event=3, seed=1))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_client_is_instrumented(fake_server):
+    client = LocalTwicketsClient(*fake_server.server_address[:2], 0.1, 0.2)
+    client.new_scheduler()
+    event = "metrics-test"
+    client.check_event_availability(event)
+    client.check_event_availability(event)
+    fake_server.state.blocked_requests = 1
+    with pytest.raises(NotTwoHundredStatusError):
+        client.check_event_availability(event)
+    assert metrics.POLLS.value(event=event, result="changed") == 1
+    assert metrics.POLLS.value(event=event, result="unchanged") == 1
+    assert metrics.POLLS.value(event=event, result="blocked") == 1
+
+    server = metrics.start_metrics_server(0, "127.0.0.1")
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+            text = response.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert f'twickets_polls_total{{event="{event}",result="changed"}} 1' in text
+    assert 'twickets_blocked_total{status="403"}' in text
+    assert "twickets_connection_reuse_ratio" in text
+    assert 'twickets_backoff_seconds{account="1"} 0' in text
+    assert "twickets_parse_seconds_count" in text
+    client.close()
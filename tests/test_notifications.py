@@ -0,0 +1,124 @@
+""" tests for the background notification dispatcher """
+
+import time
+
+import pytest
+
+from fake_notifier_server import FakeNotifierState, point_clients_at, start_server
+from fake_twickets_server import FakeTwicketsState
+from fake_twickets_server import start_server as start_twickets_server
+from helpers import ProwlNoticationsClient
+from main import TwicketsClient
+from notifications import Notification, NotificationDispatcher
+from telegram import TelegramBotClient
+
+
+@pytest.fixture
+def fake_notifier(monkeypatch):
+    for key in ("PROWL_API_URL", "TELEGRAM_API_URL", "TELEGRAM_BOT_TOKEN", "TELEGRAM_CHAT_ID"):
+        monkeypatch.delenv(key, raising=False)
+    server, _ = start_server(state=FakeNotifierState())
+    point_clients_at(server)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_dispatcher(**kwargs):
+    prowl, telegram = ProwlNoticationsClient(), TelegramBotClient()
+    return NotificationDispatcher({
+        "prowl": lambda title, message: prowl.send_notification(message),
+        "telegram": telegram.send_notification,
+    }, **kwargs)
+
+
+def test_burst_is_coalesced_in_order(fake_notifier):
+    dispatcher = make_dispatcher(linger=0.2)
+    for index in range(5):
+        dispatcher.submit(Notification("Ticket Alert", f"ticket {index}"))
+    assert dispatcher.flush(5)
+    assert fake_notifier.state.messages("prowl") == ["\n".join(f"ticket {i}" for i in range(5))]
+    assert fake_notifier.state.messages("telegram") == ["*Ticket Alert (5)*\n" + "\n".join(f"ticket {i}" for i in range(5))]
+    assert dispatcher.stats["prowl"].sent == dispatcher.stats["telegram"].sent == 1
+    dispatcher.stop()
+
+
+def test_submit_does_not_wait_for_slow_channels(fake_notifier):
+    fake_notifier.state.latency = 0.5
+    dispatcher = make_dispatcher(linger=0)
+    start = time.monotonic()
+    dispatcher.submit(Notification("Ticket Alert", "slow"))
+    assert time.monotonic() - start < 0.1
+    assert dispatcher.flush(5)
+    # both channels were sent to concurrently
+    assert time.monotonic() - start < 0.9
+    dispatcher.stop()
+
+
+def test_failed_sends_are_retried(fake_notifier):
+    fake_notifier.state.failures["telegram"] = 2
+    dispatcher = make_dispatcher(linger=0, base_delay=0.01)
+    dispatcher.submit(Notification("Ticket Alert", "retry me"))
+    assert dispatcher.flush(5)
+    assert fake_notifier.state.messages("telegram") == ["*Ticket Alert*\nretry me"]
+    assert dispatcher.stats["telegram"].retries == 2
+    assert dispatcher.stats["prowl"].retries == 0
+
+
+def test_gives_up_after_max_attempts(fake_notifier):
+    fake_notifier.state.failures["prowl"] = 10
+    dispatcher = make_dispatcher(linger=0, base_delay=0.01, max_attempts=3)
+    dispatcher.submit(Notification("Ticket Alert", "lost"))
+    assert dispatcher.flush(5)
+    assert dispatcher.stats["prowl"].failed == 1
+    assert fake_notifier.state.messages("telegram") == ["*Ticket Alert*\nlost"]
+
+
+def test_undeliverable_only_when_every_channel_fails(fake_notifier):
+    fake_notifier.state.failures["prowl"] = 10
+    dispatcher = make_dispatcher(linger=0, base_delay=0.01, max_attempts=2)
+    undeliverable = []
+    dispatcher.submit(Notification("Ticket Alert", "one channel", "1", undeliverable=lambda: undeliverable.append("1")))
+    assert dispatcher.flush(5)
+    fake_notifier.state.failures["telegram"] = 10
+    dispatcher.submit(Notification("Ticket Alert", "no channel", "2", undeliverable=lambda: undeliverable.append("2")))
+    assert dispatcher.flush(5)
+    assert undeliverable == ["2"]
+    dispatcher.stop()
+
+
+def test_stop_drains_queue(fake_notifier):
+    dispatcher = make_dispatcher(linger=1.0)
+    dispatcher.submit(Notification("Ticket Alert", "before stop"))
+    dispatcher.stop()
+    assert fake_notifier.state.messages("prowl") == ["before stop"]
+
+
+def test_next_poll_alerts_again_when_every_channel_failed(monkeypatch):
+    server, _ = start_twickets_server(state=FakeTwicketsState(listings_per_event=0, seed=1))
+    monkeypatch.setenv("TWICKETS_BASE_URL", f"http://{server.server_address[0]}:{server.server_address[1]}")
+    listing = server.state.add_listing("1", "Weekend Campervan Pass")
+    client = TwicketsClient()
+    client.tokens.path = None
+    delivered = []
+
+    def send(title, message):
+        if not delivered:
+            delivered.append(None)
+            raise ConnectionError("channel down")
+        delivered.append(message)
+
+    client.notifier = NotificationDispatcher({"prowl": send}, linger=0, max_attempts=1)
+    notified = set()
+    try:
+        assert client.process_ticket_alert(client.check_event_availability("1"), notified, "Main Event")
+        assert client.notifier.flush(5)
+        assert notified == set()
+        assert client.process_ticket_alert(client.check_event_availability("1"), notified, "Main Event")
+        assert client.notifier.flush(5)
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+    url_id = listing["id"].split("@")[1]
+    assert notified == {url_id} and len(delivered) == 2 and url_id in delivered[1]
@@ -0,0 +1,101 @@
+""" tests for the append-only notified ids store """
+
+import json
+import os
+import signal
+import time
+
+import pytest
+
+from helpers import TerminatedError, raise_on_sigterm
+from notifiedstore import NotifiedIdStore
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_add_and_reload(tmp_path):
+    path = str(tmp_path / "ids.jsonl")
+    store = NotifiedIdStore(path)
+    store.add("1")
+    store.add("2")
+    store.add("1")
+    assert "1" in store and "3" not in store
+    assert len(store) == 2
+    store.close()
+    assert len(open(path).readlines()) == 2
+    assert set(NotifiedIdStore(path)) == {"1", "2"}
+
+
+def test_fsyncs_are_batched(tmp_path):
+    store = NotifiedIdStore(str(tmp_path / "ids.jsonl"), fsync_every=3, fsync_interval=60, clock=FakeClock())
+    store.add("1")
+    store.add("2")
+    assert store._unsynced == 2  # pylint: disable=protected-access
+    # the lines are written out straight away, only the fsync waits
+    assert len(open(store.path).readlines()) == 2
+    store.add("3")
+    assert store._unsynced == 0  # pylint: disable=protected-access
+
+
+def test_ids_expire_after_ttl(tmp_path):
+    clock = FakeClock()
+    path = str(tmp_path / "ids.jsonl")
+    store = NotifiedIdStore(path, ttl=100, clock=clock)
+    store.add("old")
+    clock.now += 60
+    store.add("new")
+    clock.now += 50
+    assert "old" not in store and "new" in store
+    store.close()
+    assert set(NotifiedIdStore(path, ttl=100, clock=clock)) == {"new"}
+
+
+def test_compaction_drops_expired_lines(tmp_path):
+    clock = FakeClock()
+    path = str(tmp_path / "ids.jsonl")
+    store = NotifiedIdStore(path, ttl=10, clock=clock)
+    store.COMPACT_MIN_LINES = 5
+    for index in range(5):
+        store.add(f"old {index}")
+    clock.now += 20
+    for index in range(4):
+        store.add(f"new {index}")
+    store.flush()
+    assert len(open(path).readlines()) == 9
+    # the tenth line doubles the log since the last rewrite
+    store.add("new 4")
+    store.close()
+    assert [json.loads(line)["id"] for line in open(path)] == [f"new {index}" for index in range(5)]
+
+
+def test_skips_partial_last_line(tmp_path):
+    path = tmp_path / "ids.jsonl"
+    path.write_text('{"id": "1", "at": 1000000.0}\n{"id": "2", "a')
+    store = NotifiedIdStore(str(path), ttl=None)
+    assert set(store) == {"1"}
+
+
+def test_imports_legacy_json_list(tmp_path):
+    legacy = tmp_path / "notified_ids.json"
+    legacy.write_text(json.dumps(["a", "b"]))
+    store = NotifiedIdStore(str(tmp_path / "notified_ids.jsonl"))
+    store.import_legacy(str(legacy))
+    assert set(store) == {"a", "b"}
+    assert not legacy.exists()
+
+
+def test_sigterm_raises_terminated():
+    previous = signal.getsignal(signal.SIGTERM)
+    try:
+        assert raise_on_sigterm()
+        with pytest.raises(TerminatedError):
+            os.kill(os.getpid(), signal.SIGTERM)
+            time.sleep(1)
+    finally:
+        signal.signal(signal.SIGTERM, previous)
@@ -0,0 +1,124 @@
+""" tests for the multi-event poller against the local fake twickets server """
+
+import asyncio
+import os
+import signal
+import threading
+
+import pytest
+
+from bench_poller import LocalTwicketsClient, jain_index
+from fake_twickets_server import FakeTwicketsState, start_server
+from helpers import NotTwoHundredStatusError
+from poller import EventState, MultiEventPoller, parse_events, run_until_terminated
+
+
+@pytest.fixture
+def fake_server():
+    server, _ = start_server(state=FakeTwicketsState(listings_per_event=5, seed=1))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_poller(server, events=4, min_time=0.05, max_time=0.1):
+    host, port = server.server_address[:2]
+    client = LocalTwicketsClient(host, port, min_time, max_time)
+    states = [EventState(str(1000 + i), f"Event {i}") for i in range(events)]
+    poller = MultiEventPoller(client, states)
+    poller.scheduler.base_backoff = 0.1
+    return poller, states
+
+
+def test_polls_every_event_fairly(fake_server):
+    poller, states = make_poller(fake_server)
+    asyncio.run(poller.run(1.5))
+    polls = [state.polls for state in states]
+    assert min(polls) >= 8
+    assert jain_index(polls) > 0.95
+    # fetches still in flight when the run is cancelled reach the server uncounted
+    assert 0 <= sum(fake_server.state.requests.values()) - sum(polls) <= poller.client.MAX_CONNECTIONS
+    assert all(state.errors == 0 for state in states)
+    assert fake_server.state.logins == 1
+
+
+def test_shared_backoff_reauthenticates_once(fake_server):
+    fake_server.state.blocked_requests = 1
+    poller, states = make_poller(fake_server)
+    asyncio.run(poller.run(1.5))
+    assert sum(state.errors for state in states) == 1
+    assert fake_server.state.logins == 2
+    assert poller.attempts == 0
+    assert all(state.polls >= 3 for state in states)
+
+
+def test_gives_up_after_max_retries(fake_server):
+    fake_server.state.blocked_requests = 1000
+    poller, _ = make_poller(fake_server, events=2)
+    poller.client.MAX_RETRIES = 0
+    with pytest.raises(NotTwoHundredStatusError):
+        asyncio.run(poller.run(10))
+    assert poller.attempts == 1
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, []),
+    ("", []),
+    (" ; ;", []),
+    ("123=Main Event", [("123", "Main Event")]),
+    ("123", [("123", "123")]),
+    ("123=", [("123", "123")]),
+    (" 123 = Main Event ;456=Camping;; ", [("123", "Main Event"), ("456", "Camping")]),
+])
+def test_parse_events(value, expected):
+    assert [(e.event_id, e.event_name) for e in parse_events(value)] == expected
+
+
+def test_unexpected_error_does_not_stop_polling(fake_server):
+    poller, states = make_poller(fake_server, events=2)
+    check = poller.client.check_event_availability
+    failures = []
+
+    def flaky(event_id, account=None):
+        if event_id == states[0].event_id and not failures:
+            failures.append(event_id)
+            raise ValueError("bad payload")
+        return check(event_id, account)
+
+    poller.client.check_event_availability = flaky
+    asyncio.run(poller.run(1.0))
+    assert states[0].errors == 1 and states[0].polls >= 3
+    assert states[1].errors == 0 and states[1].polls >= 3
+
+
+def test_sigterm_stops_polling_and_saves_notified_ids(fake_server):
+    poller, _ = make_poller(fake_server, events=2)
+    saved = []
+    save = poller.client.save_notified_ids
+    poller.client.save_notified_ids = lambda notified_ids: saved.append(save(notified_ids))
+
+    async def terminate_soon():
+        asyncio.get_running_loop().call_later(0.5, os.kill, os.getpid(), signal.SIGTERM)
+        return await run_until_terminated(poller, 10)
+
+    assert asyncio.run(terminate_soon())
+    assert len(saved) == 1
+    assert signal.getsignal(signal.SIGTERM) == signal.SIG_DFL
+
+
+def test_sigusr1_dumps_snapshots(fake_server, tmp_path):
+    poller, _ = make_poller(fake_server, events=1)
+    poller.client.snapshot_dir = str(tmp_path)
+    dumped = threading.Event()
+    dump = poller.client.dump_snapshots
+    poller.client.dump_snapshots = lambda: (dump(), dumped.set())
+
+    async def signal_then_stop():
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.3, os.kill, os.getpid(), signal.SIGUSR1)
+        loop.call_later(0.6, os.kill, os.getpid(), signal.SIGTERM)
+        return await run_until_terminated(poller, 10)
+
+    assert asyncio.run(signal_then_stop())
+    assert dumped.wait(5)
+    assert os.listdir(tmp_path)
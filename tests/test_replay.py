@@ -0,0 +1,64 @@
+""" tests for recording inventory responses and the replay benchmark """
+
+import json
+
+import pytest
+
+from bench_pipeline import StubNotifier, bench_case, regressions, run_pipeline, synthetic_corpus
+from bench_poller import LocalTwicketsClient
+from fake_twickets_server import FakeTwicketsState, start_server
+from main import TwicketsClient
+from replay import ResponseRecorder, load_corpus, write_corpus
+
+
+@pytest.fixture
+def fake_server():
+    server, _ = start_server(state=FakeTwicketsState(listings_per_event=3, seed=1))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_client_records_changed_responses(fake_server, tmp_path, monkeypatch):
+    monkeypatch.setenv("TWICKETS_RECORD_DIR", str(tmp_path))
+    client = LocalTwicketsClient(*fake_server.server_address[:2], 0.1, 0.2)
+    client.check_event_availability("1")
+    client.check_event_availability("1")
+    client.check_event_availability("2")
+    corpus = load_corpus(str(tmp_path))
+    assert [name.split("-")[0] for name, _ in corpus] == ["1", "2"]
+    assert len(json.loads(corpus[0][1])["responseData"]) == 3
+    client.close()
+
+
+def test_recorder_stops_at_max_files(tmp_path):
+    recorder = ResponseRecorder(str(tmp_path), max_files=2)
+    assert recorder.record("1", b"{}")
+    assert recorder.record("1", b"{}")
+    assert recorder.record("1", b"{}") is None
+    assert len(load_corpus(str(tmp_path))) == 2
+
+
+def test_synthetic_corpus_round_trip(tmp_path):
+    write_corpus(str(tmp_path), synthetic_corpus())
+    corpus = dict(load_corpus(str(tmp_path)))
+    assert len(json.loads(corpus["1k.json"])["responseData"]) == 1000
+    assert json.loads(corpus["empty.json"])["responseData"] == []
+
+
+def test_pipeline_notifies_the_planted_matches():
+    client = TwicketsClient()
+    client.notifier = StubNotifier()
+    body = json.dumps(dict(synthetic_corpus())["1k.json"]).encode()
+    assert run_pipeline(client, body, lazy=True) == 1000
+    assert client.notifier.submitted >= 10
+    stats = bench_case(client, [body], iterations=2, lazy=True)
+    assert stats["p50_ms"] <= stats["p99_ms"]
+    assert stats["parses_per_sec"] > 0 and stats["peak_kib"] > 0
+
+
+def test_regressions_respect_tolerance():
+    baseline = {"1k": {"p50_ms": 10.0, "p99_ms": 20.0}}
+    assert regressions({"1k": {"p50_ms": 12.0, "p99_ms": 24.0}}, baseline, 0.25) == []
+    assert len(regressions({"1k": {"p50_ms": 13.0, "p99_ms": 20.0}}, baseline, 0.25)) == 1
+    assert regressions({"10k": {"p50_ms": 99.0, "p99_ms": 99.0}}, baseline, 0.25) == []
@@ -0,0 +1,212 @@
+""" tests for the adaptive poll scheduler, driven by a simulated clock """
+
+import random
+from datetime import datetime, timezone
+
+import pytest
+
+from bench_poller import LocalTwicketsClient
+from fake_twickets_server import FakeTwicketsState, make_listing, start_server
+from scheduler import PollScheduler, parse_burst_windows, parse_on_sale_at, parse_retry_after
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+def make_scheduler(clock, **kwargs):
+    kwargs.setdefault("base_backoff", 10)
+    kwargs.setdefault("max_backoff", 100)
+    return PollScheduler(15, 30, clock=clock, rng=random.Random(1), **kwargs)
+
+
+def test_bucket_does_not_slow_normal_polling():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    for _ in range(100):
+        assert scheduler.reserve() == 0
+        scheduler.record_success()
+        clock.advance(scheduler.next_interval())
+
+
+def test_block_cuts_rate_and_pauses():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    rate = scheduler.rate
+    delay = scheduler.record_blocked(403)
+    assert 7.5 <= delay <= 12.5
+    assert scheduler.rate == pytest.approx(rate / 2)
+    first = scheduler.reserve()
+    assert first == pytest.approx(delay)
+    # the bucket was emptied, so queued requests are spaced by the reduced rate
+    assert scheduler.reserve() == pytest.approx(max(delay, 2 / scheduler.rate))
+
+
+def test_backoff_doubles_up_to_the_cap():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    delays = [scheduler.record_blocked(403) for _ in range(6)]
+    assert delays[1] > delays[0] * 1.1
+    assert all(delay <= 125 for delay in delays)
+    assert scheduler.blocks == 6
+    assert scheduler.rate >= scheduler.min_rate
+
+
+def test_retry_after_is_respected():
+    scheduler = make_scheduler(FakeClock())
+    assert scheduler.record_blocked(429, retry_after=500) == 500
+
+
+def test_server_errors_do_not_cut_the_rate():
+    scheduler = make_scheduler(FakeClock())
+    rate = scheduler.rate
+    scheduler.record_blocked(502)
+    assert scheduler.rate == rate
+    assert scheduler.blocks == 1
+
+
+def test_rate_recovers_additively_and_learns_the_limit():
+    clock = FakeClock()
+    # a server that blocks whenever more than one request lands in a 10s window
+    scheduler = PollScheduler(1, 1, base_backoff=1, max_backoff=5, clock=clock, rng=random.Random(1))
+    sent = []
+    for _ in range(2000):
+        clock.advance(scheduler.reserve())
+        if sent and clock.now - sent[-1] < 10:
+            clock.advance(scheduler.record_blocked(403))
+        else:
+            sent.append(clock.now)
+            scheduler.record_success()
+        clock.advance(scheduler.next_interval())
+    late_start = sent[len(sent) // 2]
+    assert scheduler.rate < 1
+    # once the rate is learned most requests get through
+    gaps = [b - a for a, b in zip(sent, sent[1:]) if a >= late_start]
+    assert sum(gaps) / len(gaps) < 30
+
+
+def test_success_resets_consecutive_blocks():
+    scheduler = make_scheduler(FakeClock())
+    scheduler.record_blocked(403)
+    scheduler.record_success()
+    assert scheduler.blocks == 0
+
+
+def test_speeds_up_around_on_sale_time():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, on_sale_at=clock.now + 3600, on_sale_lead=600, on_sale_window=1800)
+    assert not scheduler.on_sale()
+    assert 15 <= scheduler.next_interval() <= 30
+    clock.advance(3600 - 300)
+    assert scheduler.on_sale()
+    assert scheduler.next_interval() <= 30 * scheduler.on_sale_factor
+    clock.advance(300 + 1800 + 1)
+    assert not scheduler.on_sale()
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv("TWICKETS_ON_SALE_AT", "2026-11-05T10:00:00+00:00")
+    monkeypatch.setenv("TWICKETS_ON_SALE_WINDOW_MINUTES", "90")
+    monkeypatch.setenv("TWICKETS_MAX_BACKOFF", "600")
+    scheduler = PollScheduler.from_env(15, 30, 2, max_backoff=1800)
+    assert scheduler.max_backoff == 600
+    assert scheduler.on_sale_at == datetime(2026, 11, 5, 10, tzinfo=timezone.utc).timestamp()
+    assert scheduler.on_sale_window == 5400
+    assert scheduler.capacity == 2
+    assert parse_on_sale_at(None) is None
+
+
+def test_new_listing_bursts_its_stream_then_decays():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, burst_factor=0.2, burst_duration=100)
+    scheduler.record_activity("a")
+    assert scheduler.burst_multiplier("a") == pytest.approx(0.2)
+    assert scheduler.burst_multiplier("b") == 1
+    assert scheduler.next_interval("a") <= 30 * 0.2
+    assert 15 <= scheduler.next_interval("b") <= 30
+    clock.advance(50)
+    assert scheduler.burst_multiplier("a") == pytest.approx(0.6)
+    clock.advance(50)
+    assert scheduler.burst_multiplier("a") == 1
+    assert 15 <= scheduler.next_interval("a") <= 30
+
+
+def test_burst_windows_apply_to_every_stream():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, burst_windows=[(clock.now + 60, clock.now + 120)])
+    assert scheduler.burst_multiplier("a") == 1
+    clock.advance(90)
+    assert scheduler.burst_multiplier("a") == scheduler.burst_multiplier(None) == scheduler.burst_factor
+    clock.advance(31)
+    assert scheduler.burst_multiplier("a") == 1
+
+
+def test_bursts_stay_within_the_request_budget():
+    clock = FakeClock()
+    budget = 30
+    scheduler = make_scheduler(clock, burst_factor=0.1, burst_duration=3600, burst_budget=budget)
+    polls = 0
+    while clock.now < 1_000_000 + 4 * 3600:
+        # a new listing on every poll keeps the stream bursting for the whole run
+        scheduler.record_activity()
+        clock.advance(scheduler.next_interval())
+        polls += 1
+    baseline = 4 * 3600 / 22.5
+    assert polls > baseline + budget  # it did burst
+    # but only by the initial credit plus what the budget refilled each hour
+    assert polls <= baseline * 1.03 + budget * 5
+    assert scheduler.burst_credit < 1
+
+
+def test_parse_burst_windows():
+    windows = parse_burst_windows("2026-11-05T10:00:00+00:00/60; 2026-11-12T18:00:00+00:00/30;")
+    start = datetime(2026, 11, 5, 10, tzinfo=timezone.utc).timestamp()
+    assert windows[0] == (start, start + 3600)
+    assert windows[1][1] - windows[1][0] == 1800
+    assert parse_burst_windows(None) == []
+    for value in ("60", "/60", " /60", "2026-11-05T10:00:00+00:00/"):
+        with pytest.raises(ValueError):
+            parse_burst_windows(value)
+
+
+def test_burst_from_env(monkeypatch):
+    monkeypatch.setenv("TWICKETS_BURST_FACTOR", "0.5")
+    monkeypatch.setenv("TWICKETS_BURST_SECONDS", "120")
+    monkeypatch.setenv("TWICKETS_BURST_BUDGET", "10")
+    monkeypatch.setenv("TWICKETS_BURST_WINDOWS", "2026-11-05T10:00:00+00:00/60")
+    scheduler = PollScheduler.from_env(15, 30)
+    assert (scheduler.burst_factor, scheduler.burst_duration, scheduler.burst_budget) == (0.5, 120, 10)
+    assert len(scheduler.burst_windows) == 1
+
+
+def test_client_bursts_after_a_new_listing():
+    server, _ = start_server(state=FakeTwicketsState(listings_per_event=2, seed=1))
+    client = LocalTwicketsClient(*server.server_address[:2], 15, 30)
+    scheduler = client.new_scheduler()
+    try:
+        client.check_event_availability("1")
+        assert scheduler.burst_multiplier("1") == 1
+        server.state.listings["1"].append(make_listing("1", 99, "Adult Day Ticket"))
+        client.check_event_availability("1")
+        assert scheduler.burst_multiplier("1") < 1
+        assert scheduler.burst_multiplier("2") == 1
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize("value, expected", [(None, None), ("", None), ("120", 120.0), ("soon", None)])
+def test_parse_retry_after(value, expected):
+    assert parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_http_date():
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
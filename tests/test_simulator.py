@@ -0,0 +1,87 @@
+""" tests for the fault injecting fake twickets server and pointing the client at it """
+
+import http.client
+
+import pytest
+
+from fake_twickets_server import FakeTwicketsState, start_server
+from helpers import NotTwoHundredStatusError
+from main import TwicketsClient
+from simulate_load import SimulatedTwicketsClient, run
+
+
+@pytest.fixture
+def fake_server(monkeypatch):
+    server, _ = start_server(state=FakeTwicketsState(listings_per_event=3, seed=1))
+    monkeypatch.setenv("TWICKETS_BASE_URL", f"http://{server.server_address[0]}:{server.server_address[1]}")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(fake_server):
+    client = SimulatedTwicketsClient(fake_server.state, 0.1, 0.2)
+    client.MAX_RETRIES = 3
+    yield client
+    client.close()
+
+
+def test_base_url_switch(monkeypatch):
+    monkeypatch.delenv("TWICKETS_BASE_URL", raising=False)
+    conn = TwicketsClient()._new_connection()
+    assert isinstance(conn, http.client.HTTPSConnection) and conn.host == "www.twickets.live"
+    monkeypatch.setenv("TWICKETS_BASE_URL", "http://127.0.0.1:8080")
+    conn = TwicketsClient()._new_connection()
+    assert not isinstance(conn, http.client.HTTPSConnection)
+    assert (conn.host, conn.port) == ("127.0.0.1", 8080)
+    monkeypatch.setenv("TWICKETS_BASE_URL", "ftp://example.com")
+    with pytest.raises(ValueError):
+        TwicketsClient()
+
+
+def test_churn_adds_dated_listings(fake_server, client):
+    state = fake_server.state
+    state.churn_interval = 10
+    first = client.check_event_availability("1")
+    assert not state.appeared
+    # two churn steps fall due before the next poll
+    state._last_churn["1"] -= 25  # pylint: disable=protected-access
+    second = client.check_event_availability("1")
+    assert len(state.appeared) == 2
+    steps = sorted(appeared_at for appeared_at, _ in state.appeared.values())
+    assert steps[1] - steps[0] == pytest.approx(10)
+    assert {item.id for item in second.response_data} != {item.id for item in first.response_data}
+
+
+def test_cloudflare_burst(fake_server, client):
+    fake_server.state.burst_probability = 1.0
+    fake_server.state.burst_length = 2
+    with pytest.raises(NotTwoHundredStatusError) as error:
+        client.check_event_availability("1")
+    assert error.value.status == 403
+
+
+def test_dropped_connection_is_retried(fake_server, client):
+    client.check_event_availability("1")
+    fake_server.state.drop_requests = 1
+    assert client.check_event_availability("1") is not None
+    assert fake_server.state.dropped == 1
+
+
+def test_dns_failures_are_retried(fake_server, client):
+    fake_server.state.dns_failures = 2
+    assert client._ensure_connection()
+    fake_server.state.dns_failures = 10
+    client.transport.close()
+    assert not client._ensure_connection()
+    assert fake_server.state.dns_failures == 7
+
+
+def test_simulation_detects_new_listings():
+    result = run(events=2, listings=5, duration=3, min_time=0.1, max_time=0.2, churn=0.2, latency=0.01,
+                 burst_probability=0.0, burst_length=1, drop_probability=0.05, dns_failures=1)
+    assert result["detected"] > 0
+    assert result["p95"] < 1.0
+    assert result["dns_failed"] == 1
+    assert not result["gave_up"]
@@ -0,0 +1,115 @@
+""" tests for the in-memory ring of recent raw responses """
+
+import json
+import os
+import signal
+import threading
+import time
+
+import pytest
+
+from bench_poller import LocalTwicketsClient
+from changedetection import listing_digest
+from fake_twickets_server import FakeTwicketsState, make_inventory_response, make_listing, start_server
+from replay import load_corpus
+from snapshots import SnapshotRing, install_dump_handler
+from ticketalertresponse import ticket_alert_response_from_dict
+
+
+def body(*listings, clock="2025-01-01T00:00:00Z"):
+    payload = make_inventory_response(list(listings))
+    payload["clock"] = clock
+    return json.dumps(payload).encode()
+
+
+def test_identical_listings_share_one_blob():
+    ring = SnapshotRing(capacity=10)
+    for second in range(5):
+        ring.add("1", body(clock=f"2025-01-01T00:00:0{second}Z"), received_at=second)
+    ring.add("2", body(make_listing("2", 1, "Adult Day Ticket")), received_at=5)
+    assert len(ring) == 6 and ring.distinct == 2
+    assert 0 < ring.compressed_bytes < ring.raw_bytes
+
+
+def test_not_modified_reuses_the_previous_body():
+    ring = SnapshotRing()
+    sold_out = body()
+    ring.add("1", b"", listing_digest(sold_out))
+    assert len(ring) == 0
+    ring.add("1", sold_out)
+    ring.add("1", b"", listing_digest(sold_out))
+    assert len(ring) == 2 and ring.distinct == 1
+
+
+def test_capacity_evicts_oldest_and_frees_bodies():
+    ring = SnapshotRing(capacity=3)
+    for index in range(5):
+        ring.add("1", body(make_listing("1", index, "Adult Day Ticket")), received_at=index)
+    assert len(ring) == 3 and ring.distinct == 3
+    ring.add("1", body(), received_at=5)
+    ring.add("1", body(), received_at=6)
+    ring.add("1", body(), received_at=7)
+    assert len(ring) == 3 and ring.distinct == 1
+
+
+def test_max_bytes_bounds_memory():
+    ring = SnapshotRing(capacity=1000, max_bytes=4096, level=9)
+    for index in range(200):
+        ring.add("1", body(*[make_listing("1", index * 10 + n, "Adult Day Ticket") for n in range(5)]))
+    assert ring.compressed_bytes <= 4096
+    assert 0 < len(ring) < 200
+
+
+def test_dump_in_replay_format(tmp_path):
+    ring = SnapshotRing()
+    first = body(make_listing("1", 1, "Adult Day Ticket"))
+    ring.add("1", first, received_at=1.5)
+    ring.add("1", body(make_listing("1", 1, "Adult Day Ticket"), clock="later"), received_at=2.5)
+    ring.add("2", body(), received_at=3.5)
+    paths = ring.dump(str(tmp_path))
+    assert [os.path.basename(path) for path in paths] == ["1-1500-0000.json", "1-2500-0001.json", "2-3500-0002.json"]
+    corpus = load_corpus(str(tmp_path))
+    assert corpus[0][1] == corpus[1][1] == first
+    response = ticket_alert_response_from_dict(json.loads(corpus[0][1]))
+    assert [item.url_id for item in response.response_data] == ["1000001"]
+
+
+def test_client_keeps_and_dumps_polled_responses(monkeypatch, tmp_path):
+    monkeypatch.setenv("TWICKETS_SNAPSHOT_DIR", str(tmp_path))
+    server, _ = start_server(state=FakeTwicketsState(listings_per_event=3, seed=1))
+    client = LocalTwicketsClient(*server.server_address[:2], 0.1, 0.2)
+    try:
+        for _ in range(3):
+            client.check_event_availability("1884916606832742400")
+        assert len(client.snapshots) == 3 and client.snapshots.distinct == 1
+        paths = client.dump_snapshots()
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+    assert len(paths) == 3 and all(path.startswith(str(tmp_path)) for path in paths)
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGUSR1"), reason="no SIGUSR1 on this platform")
+def test_signal_while_adding_does_not_deadlock(tmp_path):
+    ring = SnapshotRing()
+    ring.add("1", body(), received_at=1.0)
+    dumped = []
+    done = threading.Event()
+
+    def dump():
+        dumped.extend(ring.dump(str(tmp_path)))
+        done.set()
+
+    previous = signal.getsignal(signal.SIGUSR1)
+    try:
+        assert install_dump_handler(dump)
+        # the signal lands while this thread is inside the ring, as it would mid add()
+        with ring._lock:  # pylint: disable=protected-access
+            os.kill(os.getpid(), signal.SIGUSR1)
+            time.sleep(0.1)
+            assert not done.is_set()
+        assert done.wait(5)
+    finally:
+        signal.signal(signal.SIGUSR1, previous)
+    assert len(dumped) == 1
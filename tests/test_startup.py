@@ -0,0 +1,30 @@
+""" tests for the slim startup path and its benchmark """
+
+import subprocess
+import sys
+
+from bench_startup import ROOT, import_profile, time_to_first_poll
+
+DEFERRED = ("requests", "deepdiff", "numpy")
+
+
+def test_poller_import_defers_optional_modules():
+    code = ("import logging, sys, poller; "
+            f"print([name for name in {DEFERRED!r} if name in sys.modules]); "
+            "print(logging.getLogger().getEffectiveLevel())")
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    loaded, level = result.stdout.splitlines()
+    assert loaded == "[]"
+    # helpers no longer overrides main's WARNING logging with DEBUG
+    assert level == "30"
+
+
+def test_import_profile():
+    total, children = import_profile("main")
+    assert total > 0
+    names = [name for name, _ in children]
+    assert "helpers" in names and "requests" not in names
+
+
+def test_time_to_first_poll():
+    assert 0 < time_to_first_poll(timeout=20) < 10
@@ -0,0 +1,62 @@
+""" tests for the listing model and its lazy parsing mode """
+
+import pytest
+
+from fake_twickets_server import make_inventory_response, make_listing, make_listings
+import bench_listing_memory
+from ticketalertresponse import LazyResponseDatum, ResponseDatum, TicketAlertResponse, iter_required_tickets
+
+
+@pytest.fixture
+def raw_response():
+    listings = make_listings("1", 50, seed=3)
+    listings.append(make_listing("1", 100, "Weekend Campervan Pass", quantity=1))
+    listings.append(make_listing("1", 101, "Adult Weekend Ticket", quantity=2))
+    return make_inventory_response(listings)
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_round_trip(raw_response, lazy):
+    assert TicketAlertResponse.from_dict(raw_response, lazy=lazy).to_dict() == raw_response
+
+
+def test_lazy_matches_eager(raw_response):
+    eager = TicketAlertResponse.from_dict(raw_response)
+    lazy = TicketAlertResponse.from_dict(raw_response, lazy=True)
+    assert eager.has_valid_tickets == lazy.has_valid_tickets
+    for full, light in zip(eager.response_data, lazy.response_data):
+        assert (full.url_id, full.is_required_ticket, full.single_ticket, full.first_label) == \
+            (light.url_id, light.is_required_ticket, light.single_ticket, light.first_label)
+
+
+def test_lazy_defers_decoding_until_access(raw_response):
+    datum = LazyResponseDatum(raw_response["responseData"][0])
+    assert datum.is_required_ticket in (True, False)
+    assert datum._datum is None  # pylint: disable=protected-access
+    assert datum.area == raw_response["responseData"][0]["area"]
+    assert isinstance(datum.materialise(), ResponseDatum)
+    assert datum.pricing.prices[0].label == datum.first_label
+
+
+def test_iter_required_tickets_yields_only_matches(raw_response):
+    matches = list(iter_required_tickets(raw_response))
+    expected = [item.url_id for item in TicketAlertResponse.from_dict(raw_response).response_data if item.is_required_ticket]
+    assert [item.url_id for item in matches] == expected
+    assert "1000100" in expected and "1000101" not in expected
+
+
+def test_models_are_compact(raw_response):
+    response = TicketAlertResponse.from_dict(raw_response)
+    first, second = response.response_data[0], response.response_data[1]
+    assert not hasattr(first, "__dict__")
+    assert not hasattr(first.pricing.prices[0], "__dict__")
+    assert first.pricing.prices[0].currency_code is second.pricing.prices[0].currency_code
+    assert first.common_attributes is second.common_attributes
+    assert isinstance(first.individual_attributes, tuple)
+
+
+def test_memory_benchmark_reports_both_paths():
+    rows = {row["path"]: row for row in bench_listing_memory.main(500)}
+    # the compact eager models hold less than the raw dicts the lazy models keep
+    assert rows["eager models"]["bytes"] < rows["lazy models"]["bytes"]
+    assert all(row["parse_us"] > 0 for row in rows.values())
@@ -0,0 +1,142 @@
+""" tests for caching, refreshing and persisting the session token """
+
+import threading
+from datetime import datetime, timezone
+
+import pytest
+
+from bench_poller import LocalTwicketsClient
+from fake_twickets_server import FakeTwicketsState, start_server
+from helpers import NotTwoHundredStatusError
+from tokenmanager import TOKEN_HEADER, TokenManager, parse_clock
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_700_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeLogin:
+    def __init__(self, clock, server_offset: float = 0.0):
+        self.clock = clock
+        self.server_offset = server_offset
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        server_now = self.clock() + self.server_offset
+        stamp = datetime.fromtimestamp(server_now, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        return {"responseData": f"token-{self.calls}", "clock": stamp}
+
+
+def test_token_is_cached_until_close_to_expiry():
+    clock = FakeClock()
+    login = FakeLogin(clock)
+    tokens = TokenManager(login, ttl=3600, refresh_margin=300, clock=clock)
+    assert tokens.get() == "token-1"
+    clock.now += 3000
+    assert tokens.get() == "token-1"
+    assert tokens.seconds_until_refresh() == pytest.approx(300)
+    clock.now += 301
+    assert tokens.get() == "token-2"
+    assert login.calls == 2
+
+
+def test_expiry_follows_the_server_clock():
+    clock = FakeClock()
+    # the server runs 1000s ahead, so the token is nearer expiry than local time suggests
+    tokens = TokenManager(FakeLogin(clock, server_offset=1000), ttl=3600, refresh_margin=300, clock=clock)
+    tokens.get()
+    assert tokens.seconds_until_refresh() == pytest.approx(3300)
+    clock.now += 3301
+    assert tokens.get() == "token-2"
+
+
+def test_token_survives_a_restart(tmp_path):
+    clock = FakeClock()
+    path = str(tmp_path / "token.json")
+    first = FakeLogin(clock)
+    assert TokenManager(first, path, clock=clock).get() == "token-1"
+    second = FakeLogin(clock)
+    assert TokenManager(second, path, clock=clock).get() == "token-1"
+    assert second.calls == 0
+    clock.now += 3600
+    assert TokenManager(second, path, clock=clock).get() == "token-1" and second.calls == 1
+
+
+def test_failed_login_and_invalidate(tmp_path):
+    path = tmp_path / "token.json"
+    tokens = TokenManager(lambda: None, str(path))
+    assert tokens.get() is None
+    assert tokens.headers() == {}
+    tokens.login = FakeLogin(FakeClock())
+    assert tokens.headers() == {TOKEN_HEADER: "token-1"}
+    assert path.exists()
+    tokens.invalidate()
+    assert not path.exists()
+
+
+def test_background_refresh():
+    refreshed = threading.Event()
+    calls = []
+
+    def login():
+        calls.append(1)
+        if len(calls) == 2:
+            refreshed.set()
+        return {"responseData": f"token-{len(calls)}"}
+
+    tokens = TokenManager(login, ttl=0.2, refresh_margin=0.1)
+    tokens.get()
+    tokens.start()
+    try:
+        assert refreshed.wait(2)
+    finally:
+        tokens.stop()
+
+
+def test_parse_clock():
+    assert parse_clock("1970-01-01T00:01:00.000Z") == 60
+    assert parse_clock("not a time") is None
+    assert parse_clock(None) is None
+
+
+@pytest.fixture
+def fake_server():
+    server, _ = start_server(state=FakeTwicketsState(listings_per_event=3, seed=1))
+    server.state.require_token = True
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_inventory_requests_carry_the_token(fake_server):
+    client = LocalTwicketsClient(*fake_server.server_address[:2], 0.1, 0.2)
+    assert client.check_event_availability("1") is not None
+    assert fake_server.state.tokens_seen == ["fake-session-token-1"]
+    assert fake_server.state.logins == 1
+    client.close()
+
+
+def test_rejected_token_is_replaced(fake_server):
+    client = LocalTwicketsClient(*fake_server.server_address[:2], 0.1, 0.2)
+    client.tokens.get()
+    fake_server.state.token = "revoked"
+    # logs in again and retries the poll, without a blocked backoff
+    assert client.check_event_availability("1") is not None
+    assert fake_server.state.logins == 2
+    assert fake_server.state.tokens_seen == ["fake-session-token-1", "fake-session-token-2"]
+    client.close()
+
+
+def test_rejected_retry_raises(fake_server):
+    client = LocalTwicketsClient(*fake_server.server_address[:2], 0.1, 0.2)
+    client.tokens.login = lambda: {"responseData": "not-the-server-token"}
+    with pytest.raises(NotTwoHundredStatusError) as error:
+        client.check_event_availability("1")
+    assert error.value.status == 401
+    assert len(fake_server.state.tokens_seen) == 2
+    client.close()
@@ -0,0 +1,87 @@
+""" tests for time-to-alert tracing """
+
+import pytest
+
+from fake_twickets_server import FakeTwicketsState, start_server
+from main import TwicketsClient
+from notifications import NotificationDispatcher
+from trace_report import summarise
+from tracing import AlertTracer, PollTimings, load_traces, percentile
+
+
+class FakeClock:
+    def __init__(self, now: float = 100.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_trace_is_exported_once_every_channel_reports(tmp_path):
+    clock = FakeClock()
+    exported = []
+    tracer = AlertTracer(["prowl", "telegram"], str(tmp_path / "traces.jsonl"), exported.append, clock)
+    tracer.matched("42", "Main Event", PollTimings(90.0, 91.0, 91.5, previous_poll=70.0))
+    clock.now = 100.5
+    tracer.enqueued("42")
+    clock.now = 102.0
+    tracer.delivered("42", "prowl", True)
+    assert not exported
+    clock.now = 103.0
+    tracer.delivered("42", "telegram", False)
+    tracer.delivered("42", "telegram", True)  # late reports for a finished trace are ignored
+    assert len(exported) == 1
+    record = exported[0]
+    assert record["time_to_alert"] == {"prowl": 12.0}
+    assert record["max_time_to_alert"] == {"prowl": 32.0}
+    assert record["failed"] == ["telegram"]
+    assert [span["name"] for span in record["spans"]] == ["fetch", "parse", "match", "enqueue", "deliver.prowl"]
+    assert load_traces(str(tmp_path / "traces.jsonl")) == exported
+
+
+def test_unknown_keys_are_ignored():
+    tracer = AlertTracer(["prowl"])
+    tracer.delivered(None, "prowl", True)
+    tracer.delivered("missing", "prowl", True)
+    assert tracer.completed == 0
+
+
+@pytest.fixture
+def fake_server(monkeypatch, tmp_path):
+    server, _ = start_server(state=FakeTwicketsState(listings_per_event=3, seed=1))
+    monkeypatch.setenv("TWICKETS_BASE_URL", f"http://{server.server_address[0]}:{server.server_address[1]}")
+    monkeypatch.setenv("TWICKETS_TRACE_FILE", str(tmp_path / "traces.jsonl"))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_client_traces_alerts_end_to_end(fake_server, tmp_path):
+    client = TwicketsClient()
+    client.tokens.path = None
+    client.notifier = NotificationDispatcher({"prowl": lambda title, message: None}, linger=0)
+    client.tracer = AlertTracer(client.notifier.channels, str(tmp_path / "traces.jsonl"))
+    client.notifier.on_delivery = client.tracer.delivered
+    notified = set()
+    client.process_ticket_alert(client.check_event_availability("1"), notified, "Main Event")
+    client.notifier.flush(5)
+    already = len(load_traces(str(tmp_path / "traces.jsonl")))
+    listing = fake_server.state.add_listing("1", "Weekend Campervan Pass")
+    client.process_ticket_alert(client.check_event_availability("1"), notified, "Main Event")
+    client.notifier.flush(5)
+    client.close()
+    traces = load_traces(str(tmp_path / "traces.jsonl"))
+    assert len(traces) == already + 1
+    trace = traces[-1]
+    assert trace["url_id"] == listing["id"].split("@")[1]
+    assert trace["previous_poll"] is not None
+    assert 0 <= trace["time_to_alert"]["prowl"] < 5
+    assert all(span["end"] >= span["start"] for span in trace["spans"])
+    assert summarise(traces)["alert.prowl"]["count"] == len(traces)
+
+
+def test_percentile_is_nearest_rank():
+    values = [5.0, 1.0, 4.0, 2.0, 3.0]
+    assert percentile(values, 0.5) == 3.0
+    assert percentile(values, 0.99) == 5.0
+    assert percentile(values, 0.0) == 1.0
@@ -0,0 +1,145 @@
+""" tests for the pooled keep-alive transport """
+
+import gzip
+import http.client
+import json
+import time
+import zlib
+
+import pytest
+
+import transport
+from bench_poller import LocalTwicketsClient
+from fake_twickets_server import FakeTwicketsState, compress, start_server
+from transport import ACCEPT_ENCODING, BodyDecoder, ConnectionPool, ContentDecodingError, LatencyHistogram, brotli
+
+
+@pytest.fixture
+def fake_server():
+    server, _ = start_server(state=FakeTwicketsState(listings_per_event=3, seed=1))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_pool(server, max_connections=2):
+    host, port = server.server_address[:2]
+    return ConnectionPool(lambda: http.client.HTTPConnection(host, port), max_connections)
+
+
+def test_reuses_one_socket_across_polls(fake_server):
+    pool = make_pool(fake_server)
+    for _ in range(5):
+        response = pool.request("GET", "/services/g2/inventory/listings/1?api_key=x")
+        assert response.status == 200
+        assert len(json.loads(response.body)["responseData"]) == 3
+    assert pool.metrics.handshakes == 1
+    assert pool.metrics.reuses == 4
+    assert pool.metrics.requests == 5
+    assert pool.metrics.latency.count == 5
+    assert fake_server.state.connections == 1
+
+
+def test_ensure_connection_only_handshakes_once(fake_server):
+    pool = make_pool(fake_server)
+    pool.ensure_connection()
+    pool.ensure_connection()
+    pool.request("POST", "/services/auth/login?api_key=x", body="{}")
+    assert pool.metrics.handshakes == 1
+
+
+def test_replaces_connection_closed_by_server(fake_server):
+    fake_server.state.idle_timeout = 0.1
+    pool = make_pool(fake_server)
+    pool.request("GET", "/services/g2/inventory/listings/1")
+    time.sleep(0.3)
+    response = pool.request("GET", "/services/g2/inventory/listings/1")
+    assert response.status == 200
+    assert pool.metrics.stale_discards == 1
+    assert pool.metrics.handshakes == 2
+    assert pool.metrics.failures == 0
+
+
+def test_latency_histogram_quantiles():
+    histogram = LatencyHistogram(buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.05, 0.5, 5.0):
+        histogram.observe(seconds)
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.75) == 1.0
+    assert histogram.quantile(1.0) == float("inf")
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "deflate", "raw-deflate", "br"])
+@pytest.mark.parametrize("chunked", [False, True])
+def test_decompresses_streamed_bodies(fake_server, encoding, chunked):
+    if encoding == "br" and brotli is None:
+        pytest.skip("brotli is not installed")
+    fake_server.state = FakeTwicketsState(listings_per_event=200, seed=1)
+    fake_server.state.compression = encoding
+    fake_server.state.chunked = chunked
+    pool = make_pool(fake_server)
+    for _ in range(2):
+        response = pool.request("GET", "/services/g2/inventory/listings/1?api_key=x",
+                                headers={"Accept-Encoding": "gzip, deflate, br"})
+        assert response.status == 200
+        assert len(json.loads(response.body)["responseData"]) == 200
+    assert pool.metrics.reuses == 1
+    assert pool.metrics.wire_bytes == fake_server.state.bytes_sent
+    assert pool.metrics.compression_ratio > 3
+
+
+def test_uncompressed_when_not_accepted(fake_server):
+    fake_server.state.compression = "gzip"
+    pool = make_pool(fake_server)
+    response = pool.request("GET", "/services/g2/inventory/listings/1?api_key=x", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert pool.metrics.compression_ratio == 1
+
+
+def test_body_decoder_fed_byte_by_byte():
+    body = json.dumps({"responseData": ["x" * 10] * 100}).encode()
+    for encoding, data in (("gzip", gzip.compress(body)), ("deflate", zlib.compress(body)),
+                           ("deflate", compress(body, "raw-deflate"))):
+        decoder = BodyDecoder(encoding)
+        assert b"".join(decoder.feed(data[i:i + 1]) for i in range(len(data))) + decoder.finish() == body
+
+
+def test_body_decoder_limits():
+    with pytest.raises(ContentDecodingError):
+        BodyDecoder("gzip", max_size=1000).feed(gzip.compress(b"0" * 100_000))
+    with pytest.raises(ContentDecodingError):
+        BodyDecoder("gzip").feed(b"not gzip at all")
+    with pytest.raises(ContentDecodingError):
+        BodyDecoder("compress")
+
+
+@pytest.mark.parametrize("output_limit", [True, False])
+def test_brotli_decoder_limits_and_truncation(monkeypatch, output_limit):
+    if brotli is None:
+        pytest.skip("brotli is not installed")
+    if output_limit and not transport.BROTLI_OUTPUT_LIMIT:
+        pytest.skip("brotli is too old to cap its output")
+    monkeypatch.setattr(transport, "BROTLI_OUTPUT_LIMIT", output_limit)
+    body = b"0" * 100_000
+    data = brotli.compress(body)
+    decoder = BodyDecoder("br")
+    assert decoder.feed(data) + decoder.finish() == body
+    with pytest.raises(ContentDecodingError):
+        BodyDecoder("br", max_size=1000).feed(data)
+    decoder = BodyDecoder("br")
+    decoder.feed(data[:len(data) // 2])
+    with pytest.raises(ContentDecodingError):
+        decoder.finish()
+
+
+def test_client_parses_compressed_inventory(fake_server):
+    fake_server.state.compression = "gzip"
+    client = LocalTwicketsClient(*fake_server.server_address[:2], 0.1, 0.2)
+    assert client.headers["Accept-Encoding"] == ACCEPT_ENCODING
+    try:
+        response = client.check_event_availability("1")
+        assert len(response.response_data) == 3
+        assert client.transport.metrics.body_bytes > client.transport.metrics.wire_bytes
+    finally:
+        client.close()
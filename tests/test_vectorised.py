@@ -0,0 +1,85 @@
+""" tests for matching whole responses over numpy columns """
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from bench_matching import RULE_SETS
+from bench_matching import main as bench_main
+from bench_poller import LocalTwicketsClient
+from fake_twickets_server import FakeTwicketsState, make_inventory_response, make_listing, make_listings, start_server
+from main import TwicketsClient
+from matching import TicketMatcher
+from ticketalertresponse import TicketAlertResponse
+from vectorised import ListingColumns, match_indices, required_listings
+
+RULES = [
+    [{"labels": ["Adult Day Ticket"], "max_quantity": None}],
+    [{"min_quantity": 2, "max_quantity": 4, "areas": ["Area 1"], "sections": ["Section 2", "Section 5"]}],
+    [{"max_price": 15000, "price_field": "face_value"}, {"labels": ["Car Parking Pass"], "max_price": 20000}],
+    [{"delivery_methods": ["ETICKET"], "max_quantity": 2}, {"delivery_methods": ["POST"]}],
+    [{"labels": ["No Such Label"]}, {"areas": ["Nowhere"]}],
+    *RULE_SETS.values(),
+]
+
+
+def expected(response, matcher):
+    return [index for index, item in enumerate(response.response_data) if matcher.matches(item)]
+
+
+@pytest.mark.parametrize("rules", RULES)
+@pytest.mark.parametrize("lazy", [True, False])
+def test_same_matches_as_per_listing_rules(rules, lazy):
+    listings = make_listings("1", 500, seed=3)
+    # mixed labels in one listing, and listings without tickets
+    listings[0]["pricing"]["prices"][0]["label"] = "Car Parking Pass"
+    listings[1] = make_listing("1", 1, "Adult Day Ticket", quantity=0)
+    listings[2]["deliveryMethodTypes"] = ["POST", "ETICKET"]
+    response = TicketAlertResponse.from_dict(make_inventory_response(listings), lazy=lazy)
+    matcher = TicketMatcher.from_config(rules)
+    assert match_indices(response, matcher).tolist() == expected(response, matcher)
+
+
+def test_empty_response():
+    response = TicketAlertResponse.from_dict(make_inventory_response([]), lazy=True)
+    assert required_listings(response) == []
+
+
+def test_columns_only_build_what_the_rules_read():
+    response = TicketAlertResponse.from_dict(make_inventory_response(make_listings("1", 50, seed=1)), lazy=True)
+    columns = ListingColumns.from_response(response, ["labels"])
+    assert columns.size == 50 and len(columns.label_codes) == columns.ticket_counts.sum()
+    assert len(columns.area_codes) == 0 and columns.prices == {}
+
+
+def test_matches_drive_has_valid_tickets_and_required_tickets():
+    response = TicketAlertResponse.from_dict(make_inventory_response(make_listings("1", 100, seed=1)), lazy=True)
+    response.matches = required_listings(response)
+    assert response.has_valid_tickets
+    assert list(response.required_tickets()) == response.matches
+    response.matches = []
+    assert not response.has_valid_tickets and list(response.required_tickets()) == []
+
+
+def test_client_alerts_through_vectorised_path(monkeypatch):
+    monkeypatch.setenv("TWICKETS_VECTORISED_MATCHING", "true")
+    server, _ = start_server(state=FakeTwicketsState(listings_per_event=0, seed=1))
+    server.state.listings["1"] = [make_listing("1", 1, "Adult Day Ticket"), make_listing("1", 2, "Weekend Campervan Pass")]
+    client = LocalTwicketsClient(*server.server_address[:2], 0.1, 0.2)
+    submitted = []
+    client.notifier.submit = submitted.append
+    try:
+        response = client.check_event_availability("1")
+        assert [item.url_id for item in response.matches] == ["1000002"]
+        TwicketsClient.process_ticket_alert(client, response, set(), "Main Event")
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+    assert [notification.key for notification in submitted] == ["1000002"]
+
+
+def test_benchmark_runs():
+    rows = bench_main(iterations=1)
+    assert {row["size"] for row in rows} == {"1k", "10k"}
+    assert all(row["vectorised_ms"] > 0 for row in rows)
@@ -1,9 +1,15 @@
-from dataclasses import dataclass
-from typing import Any, List, TypeVar, Callable, Type, cast
+import sys
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Iterator, List, Optional, Tuple, TypeVar, Callable, Type, Union, cast
+
+from matching import get_matcher
 
 
 T = TypeVar("T")
 
+PRICE_KEYS = {"net_selling_price": "netSellingPrice", "face_value": "faceValue"}
+
 def from_bool(x: Any) -> bool | None:
     if isinstance(x, bool):
         return x
@@ -23,6 +29,11 @@ def from_str(x: Any) -> str:
     return ''
 
 
+def from_interned_str(x: Any) -> str:
+    """For fields like currency codes and labels that repeat across thousands of listings."""
+    return sys.intern(from_str(x))
+
+
 def from_int(x: Any) -> int:
     assert isinstance(x, int) and not isinstance(x, bool)
     return x
@@ -33,12 +44,28 @@ def from_list(f: Callable[[Any], T], x: Any) -> List[T]:
     return [f(y) for y in x]
 
 
-def to_class(c: Type[T], x: Any) -> dict:
+@lru_cache(maxsize=4096)
+def _shared_tuple(x: tuple) -> tuple:
+    # attribute lists take few distinct values, so equal tuples share one object
+    return x
+
+
+def from_tuple(f: Callable[[Any], T], x: Any) -> Tuple[T, ...]:
+    assert isinstance(x, list)
+    return _shared_tuple(tuple(f(y) for y in x))
+
+
+def to_list(f: Callable[[Any], T], x: Any) -> List[T]:
+    assert isinstance(x, (list, tuple))
+    return [f(y) for y in x]
+
+
+def to_class(c: Union[Type[Any], Tuple[Type[Any], ...]], x: Any) -> dict:
     assert isinstance(x, c)
     return cast(Any, x).to_dict()
 
 
-@dataclass
+@dataclass(slots=True)
 class Price:
     id: str | None  # Allow id to be either a string or None
     currency_code: str
@@ -52,8 +79,8 @@ class Price:
     def from_dict(obj: Any) -> 'Price':
         assert isinstance(obj, dict)
         id = obj.get("id")  # Accept whatever is in JSON
-        currency_code = from_str(obj.get("currencyCode"))
-        label = from_str(obj.get("label"))
+        currency_code = from_interned_str(obj.get("currencyCode"))
+        label = from_interned_str(obj.get("label"))
         face_value = from_int(obj.get("faceValue"))
         original_fee = from_int(obj.get("originalFee"))
         net_fee = from_int(obj.get("netFee"))
@@ -72,10 +99,10 @@ class Price:
         return result
 
 
-@dataclass
+@dataclass(slots=True)
 class Pricing:
     options: str
-    prices: List[Price]
+    prices: Tuple[Price, ...]
 
     @property
     def number_of_tickets(self) -> int:
@@ -85,29 +112,29 @@ class Pricing:
     @property
     def required_single_ticket(self) -> bool:
         """
-        Checks if the first ticket has a label of 'Adult Weekend Ticket' or 
-        'Weekend Campervan Pass' and if there is exactly one ticket.
+        Checks if there is exactly one ticket and its label is allowed by one of the
+        configured match rules. Area, price and delivery filters need the whole
+        listing, see ResponseDatum.is_required_ticket.
         """
         if self.number_of_tickets == 1 and self.prices:
-            first_label = self.prices[0].label
-            return first_label in {"Adult Weekend Ticket", "Weekend Campervan Pass"}
+            return get_matcher().accepts_label(self.prices[0].label)
         return False
 
     @staticmethod
     def from_dict(obj: Any) -> 'Pricing':
         assert isinstance(obj, dict)
-        options = from_str(obj.get("options"))
-        prices = from_list(Price.from_dict, obj.get("prices"))
+        options = from_interned_str(obj.get("options"))
+        prices = tuple(from_list(Price.from_dict, obj.get("prices")))
         return Pricing(options, prices)
 
     def to_dict(self) -> dict:
         result: dict = {}
         result["options"] = from_str(self.options)
-        result["prices"] = from_list(lambda x: to_class(Price, x), self.prices)
+        result["prices"] = to_list(lambda x: to_class(Price, x), self.prices)
         return result
 
 
-@dataclass
+@dataclass(slots=True)
 class ResponseDatum:
     type: str
     area: str
@@ -115,10 +142,10 @@ class ResponseDatum:
     row: str
     id: str
     pricing: Pricing
-    common_attributes: List[int]
-    individual_attributes: List[List[int]]
-    splits: List[int]
-    delivery_method_types: List[str]
+    common_attributes: Tuple[int, ...]
+    individual_attributes: Tuple[Tuple[int, ...], ...]
+    splits: Tuple[int, ...]
+    delivery_method_types: Tuple[str, ...]
     seller_will_consider_offers: bool
     segment_id: str
 
@@ -127,26 +154,45 @@ class ResponseDatum:
         """Returns True if only a single ticket is available, otherwise False."""
         return self.pricing.number_of_tickets == 1
 
+    @property
+    def number_of_tickets(self) -> int:
+        """Returns the total number of tickets in the listing."""
+        return self.pricing.number_of_tickets
+
     @property
     def is_required_ticket(self) -> bool:
-        """Returns True if this is a single ticket and has a special label."""
-        return self.pricing.required_single_ticket
+        """Returns True if the listing matches one of the configured match rules."""
+        return get_matcher().matches(self)
+
+    @property
+    def first_label(self) -> str:
+        """Label of the first ticket in the listing, empty if there are none."""
+        return self.pricing.prices[0].label if self.pricing.prices else ''
+
+    @property
+    def labels(self) -> Tuple[str, ...]:
+        """Label of every ticket in the listing."""
+        return tuple(price.label for price in self.pricing.prices)
+
+    def ticket_prices(self, field: str) -> Tuple[int, ...]:
+        """Per ticket net_selling_price or face_value."""
+        return tuple(getattr(price, field) for price in self.pricing.prices)
 
     @staticmethod
     def from_dict(obj: Any) -> 'ResponseDatum':
         assert isinstance(obj, dict)
-        type = from_str(obj.get("type"))
-        area = from_str(obj.get("area"))
-        section = from_str(obj.get("section"))
-        row = from_str(obj.get("row"))
+        type = from_interned_str(obj.get("type"))
+        area = from_interned_str(obj.get("area"))
+        section = from_interned_str(obj.get("section"))
+        row = from_interned_str(obj.get("row"))
         id = from_str(obj.get("id"))
         pricing = Pricing.from_dict(obj.get("pricing"))
-        common_attributes = from_list(from_int, obj.get("commonAttributes"))
-        individual_attributes = from_list(lambda x: from_list(from_int, x), obj.get("individualAttributes"))
-        splits = from_list(from_int, obj.get("splits"))
-        delivery_method_types = from_list(from_str, obj.get("deliveryMethodTypes"))
+        common_attributes = from_tuple(from_int, obj.get("commonAttributes"))
+        individual_attributes = from_tuple(lambda x: from_tuple(from_int, x), obj.get("individualAttributes"))
+        splits = from_tuple(from_int, obj.get("splits"))
+        delivery_method_types = from_tuple(from_interned_str, obj.get("deliveryMethodTypes"))
         seller_will_consider_offers = from_bool(obj.get("sellerWillConsiderOffers")) or False
-        segment_id = from_str(obj.get("segmentId"))
+        segment_id = from_interned_str(obj.get("segmentId"))
         return ResponseDatum(type, area, section, row, id, pricing, common_attributes, individual_attributes, splits, delivery_method_types, seller_will_consider_offers, segment_id)
 
     def to_dict(self) -> dict:
@@ -157,10 +203,10 @@ class ResponseDatum:
         result["row"] = from_str(self.row)
         result["id"] = from_str(self.id)
         result["pricing"] = to_class(Pricing, self.pricing)
-        result["commonAttributes"] = from_list(from_int, self.common_attributes)
-        result["individualAttributes"] = from_list(lambda x: from_list(from_int, x), self.individual_attributes)
-        result["splits"] = from_list(from_int, self.splits)
-        result["deliveryMethodTypes"] = from_list(from_str, self.delivery_method_types)
+        result["commonAttributes"] = to_list(from_int, self.common_attributes)
+        result["individualAttributes"] = to_list(lambda x: to_list(from_int, x), self.individual_attributes)
+        result["splits"] = to_list(from_int, self.splits)
+        result["deliveryMethodTypes"] = to_list(from_str, self.delivery_method_types)
         result["sellerWillConsiderOffers"] = from_bool(self.seller_will_consider_offers)
         result["segmentId"] = from_str(self.segment_id)
         return result
@@ -170,22 +216,129 @@ class ResponseDatum:
         """Extracts the part after '@' in the id field if present."""
         return self.id.split('@')[1] if '@' in self.id else ''
 
-@dataclass
+
+class LazyResponseDatum:
+    """
+    A listing that only decodes its id and price labels up front. The other fields the
+    match rules use are read straight from the raw dict, and every remaining
+    ResponseDatum field is built from it the first time it is accessed.
+    """
+    __slots__ = ("_raw", "_datum", "id", "labels")
+
+    def __init__(self, obj: Any):
+        assert isinstance(obj, dict)
+        self._raw = obj
+        self._datum: Optional[ResponseDatum] = None
+        self.id = from_str(obj.get("id"))
+        pricing = obj.get("pricing")
+        prices = pricing.get("prices") if isinstance(pricing, dict) else None
+        self.labels = tuple(from_interned_str(price.get("label")) for price in prices or ())
+
+    @property
+    def raw(self) -> dict:
+        """The listing as decoded from the response body."""
+        return self._raw
+
+    def materialise(self) -> ResponseDatum:
+        """Decode the full ResponseDatum, once."""
+        if self._datum is None:
+            self._datum = ResponseDatum.from_dict(self._raw)
+        return self._datum
+
+    def __getattr__(self, name: str) -> Any:
+        # only called for fields not decoded up front
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.materialise(), name)
+
+    @property
+    def number_of_tickets(self) -> int:
+        """Returns the total number of tickets in the listing."""
+        return len(self.labels)
+
+    @property
+    def single_ticket(self) -> bool:
+        """Returns True if only a single ticket is available, otherwise False."""
+        return len(self.labels) == 1
+
+    @property
+    def is_required_ticket(self) -> bool:
+        """Returns True if the listing matches one of the configured match rules."""
+        return get_matcher().matches(self)
+
+    @property
+    def area(self) -> str:
+        return from_interned_str(self._raw.get("area"))
+
+    @property
+    def section(self) -> str:
+        return from_interned_str(self._raw.get("section"))
+
+    @property
+    def delivery_method_types(self) -> Tuple[str, ...]:
+        return tuple(from_interned_str(x) for x in self._raw.get("deliveryMethodTypes") or ())
+
+    def ticket_prices(self, field: str) -> Tuple[int, ...]:
+        """Per ticket net_selling_price or face_value, without decoding the rest of the pricing."""
+        key = PRICE_KEYS[field]
+        return tuple(from_int(price.get(key)) for price in self._raw["pricing"]["prices"])
+
+    @property
+    def first_label(self) -> str:
+        """Label of the first ticket in the listing, empty if there are none."""
+        return self.labels[0] if self.labels else ''
+
+    @property
+    def url_id(self) -> str:
+        """Extracts the part after '@' in the id field if present."""
+        return self.id.split('@')[1] if '@' in self.id else ''
+
+    def to_dict(self) -> dict:
+        return self.materialise().to_dict()
+
+
+AnyResponseDatum = Union[ResponseDatum, LazyResponseDatum]
+
+
+def iter_required_tickets(obj: Any) -> Iterator[LazyResponseDatum]:
+    """Walk a raw inventory response, yielding only the listings that match as they are found."""
+    assert isinstance(obj, dict)
+    for item in from_list(lambda x: x, obj.get("responseData")):
+        datum = LazyResponseDatum(item)
+        if datum.is_required_ticket:
+            yield datum
+
+
+@dataclass(slots=True)
 class TicketAlertResponse:
-    response_data: List[ResponseDatum]
+    response_data: List[AnyResponseDatum]
     response_code: int
     description: str
     clock: str
+    timings: Any = field(default=None, compare=False, repr=False)  # tracing.PollTimings of the poll
+    matches: Optional[List[AnyResponseDatum]] = field(default=None, compare=False, repr=False)  # set by vectorised.py
 
     @property
     def has_valid_tickets(self) -> bool:
-        """Returns True if at least one ResponseDatum has is_required_ticket == True."""
-        return any(item.is_required_ticket for item in self.response_data)
+        """Returns True if at least one ResponseDatum matches the configured match rules."""
+        if self.matches is not None:
+            return bool(self.matches)
+        matches = get_matcher().matches
+        return any(matches(item) for item in self.response_data)
+
+    def required_tickets(self) -> Iterator[AnyResponseDatum]:
+        """Yields the listings with is_required_ticket == True, matched in bulk if matches is set."""
+        if self.matches is not None:
+            return iter(self.matches)
+        matches = get_matcher().matches
+        return (item for item in self.response_data if matches(item))
 
     @staticmethod
-    def from_dict(obj: Any) -> 'TicketAlertResponse':
+    def from_dict(obj: Any, lazy: bool = False) -> 'TicketAlertResponse':
+        """Build the response, with lazy=True only the fields needed for matching are decoded."""
         assert isinstance(obj, dict)
-        response_data = from_list(ResponseDatum.from_dict, obj.get("responseData"))
+        datum_from_dict: Callable[[Any], AnyResponseDatum] = LazyResponseDatum if lazy else ResponseDatum.from_dict
+        response_data = from_list(datum_from_dict, obj.get("responseData"))
         response_code = from_int(obj.get("responseCode"))
         description = from_str(obj.get("description"))
         clock = from_str(obj.get("clock"))
@@ -193,7 +346,7 @@ class TicketAlertResponse:
 
     def to_dict(self) -> dict:
         result: dict = {}
-        result["responseData"] = from_list(lambda x: to_class(ResponseDatum, x), self.response_data)
+        result["responseData"] = from_list(lambda x: to_class((ResponseDatum, LazyResponseDatum), x), self.response_data)
         result["responseCode"] = from_int(self.response_code)
         result["description"] = from_str(self.description)
         result["clock"] = from_str(self.clock)
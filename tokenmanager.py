@@ -0,0 +1,173 @@
+""" module for keeping the twickets session token valid across polls and restarts """
+
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Callable, Optional, TypeGuard
+
+TOKEN_HEADER = "Authorization"  # header the session token is sent in on inventory requests
+
+
+def parse_clock(value: Optional[str]) -> Optional[float]:
+    """Epoch seconds for a response clock such as 2025-02-10T12:34:56.789Z."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+@dataclass
+class SessionToken:
+    """A login token with its lifetime in server time, and the server's offset from local time."""
+    value: str
+    issued_at: float
+    expires_at: float
+    skew: float = 0.0
+
+    def server_time(self, local_time: float) -> float:
+        return local_time + self.skew
+
+
+class TokenManager:
+    """
+    Caches the session token from login(), a callable returning the validated login
+    response (responseData and clock) or None. The token's expiry is its issue time,
+    taken from the response clock, plus ttl seconds. A background timer logs in again
+    refresh_margin seconds before it lapses, and the token is written to path so a
+    restarted pod can carry on with it instead of logging in again.
+    """
+    RETRY_DELAY = 60
+
+    def __init__(self, login: Callable[[], Optional[dict]], path: Optional[str] = None, ttl: float = 3600,
+                 refresh_margin: float = 300, clock: Callable[[], float] = time.time):
+        self.login = login
+        self.path = path
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.clock = clock
+        self.logins = 0
+        self._token: Optional[SessionToken] = None
+        self._lock = threading.RLock()
+        self._timer: Optional[threading.Timer] = None
+        self._running = False
+
+    def _fresh(self, token: Optional[SessionToken]) -> TypeGuard[SessionToken]:
+        if token is None:
+            return False
+        return token.server_time(self.clock()) < token.expires_at - self.refresh_margin
+
+    def _load(self) -> Optional[SessionToken]:
+        if not self.path or not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return SessionToken(**json.load(f))
+        except (ValueError, TypeError):
+            logging.warning("Ignoring unreadable token file %s", self.path)
+            return None
+
+    def _save(self, token: Optional[SessionToken]):
+        if not self.path:
+            return
+        if token is None:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        tmp_path = self.path + ".tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(asdict(token), f)
+        os.replace(tmp_path, self.path)
+
+    def get(self) -> Optional[str]:
+        """A valid token, from memory, then the token file, then a fresh login."""
+        with self._lock:
+            if self._fresh(self._token):
+                return self._token.value
+            stored = self._load()
+            if self._fresh(stored):
+                logging.debug("Reusing the stored session token")
+                self._token = stored
+                return stored.value
+            return self.refresh()
+
+    def refresh(self) -> Optional[str]:
+        """Log in again and store the new token. Returns None if the login failed."""
+        with self._lock:
+            local_time = self.clock()
+            response = self.login()
+            self.logins += 1
+            if not response or not response.get("responseData"):
+                self.invalidate()
+                return None
+            issued_at = parse_clock(response.get("clock")) or local_time
+            self._token = SessionToken(str(response["responseData"]), issued_at, issued_at + self.ttl,
+                                       issued_at - local_time)
+            self._save(self._token)
+            self._schedule()
+            return self._token.value
+
+    def invalidate(self):
+        """Forget the token, e.g. after the server rejected it."""
+        with self._lock:
+            self._token = None
+            self._save(None)
+
+    def headers(self) -> dict:
+        """Headers that attach the current token to a request."""
+        token = self.get()
+        return {TOKEN_HEADER: token} if token else {}
+
+    def seconds_until_refresh(self) -> Optional[float]:
+        """How long the background timer should wait before logging in again."""
+        token = self._token
+        if token is None:
+            return None
+        return max(0.0, token.expires_at - self.refresh_margin - token.server_time(self.clock()))
+
+    def start(self):
+        """Keep the token refreshed in the background until stop()."""
+        with self._lock:
+            self._running = True
+            self._schedule()
+
+    def _schedule(self, delay: Optional[float] = None):
+        if not self._running:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        delay = self.seconds_until_refresh() if delay is None else delay
+        if delay is None:
+            return
+        self._timer = threading.Timer(delay, self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self):
+        try:
+            if self.refresh() is not None:
+                logging.debug("Refreshed the session token in the background")
+                return
+            error = "login returned no token"
+        except Exception as e:
+            error = str(e)
+        logging.warning("Background token refresh failed (%s), retrying in %ss", error, self.RETRY_DELAY)
+        with self._lock:
+            self._schedule(self.RETRY_DELAY)
+
+    def stop(self):
+        """Cancel the background refresh."""
+        with self._lock:
+            self._running = False
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
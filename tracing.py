@@ -0,0 +1,127 @@
+""" module for tracing each alert from the poll that first saw the listing to its delivery """
+
+import json
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+
+Exporter = Callable[[dict], None]
+
+
+@dataclass
+class PollTimings:
+    """Wall clock times of one inventory poll, attached to the TicketAlertResponse it produced."""
+    requested: float
+    received: float = 0.0
+    parsed: float = 0.0
+    previous_poll: Optional[float] = None  # the last poll of the event, which did not have the new listings
+
+
+@dataclass
+class AlertTrace:
+    """The timeline of one alerted listing."""
+    url_id: str
+    event_name: str
+    poll: PollTimings
+    matched: float
+    enqueued: float = 0.0
+    delivered: Dict[str, float] = field(default_factory=dict)
+    failed: List[str] = field(default_factory=list)
+
+    def spans(self) -> List[dict]:
+        """Named start/end pairs, one per pipeline stage and channel."""
+        spans = [
+            {"name": "fetch", "start": self.poll.requested, "end": self.poll.received},
+            {"name": "parse", "start": self.poll.received, "end": self.poll.parsed},
+            {"name": "match", "start": self.poll.parsed, "end": self.matched},
+            {"name": "enqueue", "start": self.matched, "end": self.enqueued},
+        ]
+        for channel, acked in self.delivered.items():
+            spans.append({"name": f"deliver.{channel}", "start": self.enqueued, "end": acked})
+        return spans
+
+    def to_dict(self) -> dict:
+        return {
+            "url_id": self.url_id,
+            "event_name": self.event_name,
+            "previous_poll": self.poll.previous_poll,
+            "spans": self.spans(),
+            # from the poll that found the listing, and the worst case from the poll before it
+            "time_to_alert": {channel: acked - self.poll.requested for channel, acked in self.delivered.items()},
+            "max_time_to_alert": {channel: acked - self.poll.previous_poll for channel, acked in self.delivered.items()}
+            if self.poll.previous_poll else {},
+            "failed": self.failed,
+        }
+
+
+class AlertTracer:
+    """
+    Follows each new alert through match, enqueue and delivery. Once every channel
+    has acknowledged or given up, the trace is appended to path as one JSON line
+    and handed to exporter, if either is set.
+    """
+
+    def __init__(self, channels: Iterable[str], path: Optional[str] = None, exporter: Optional[Exporter] = None,
+                 clock: Callable[[], float] = time.time):
+        self.channels = frozenset(channels)
+        self.path = path
+        self.exporter = exporter
+        self.clock = clock
+        self.completed = 0
+        self._pending: Dict[str, AlertTrace] = {}
+        self._lock = threading.Lock()
+
+    def matched(self, url_id: str, event_name: str, poll: Optional[PollTimings]):
+        """A listing matched and was claimed for an alert."""
+        now = self.clock()
+        with self._lock:
+            self._pending[url_id] = AlertTrace(url_id, event_name, poll or PollTimings(now, now, now), now)
+
+    def enqueued(self, url_id: str):
+        """The alert was handed to the notification dispatcher."""
+        with self._lock:
+            trace = self._pending.get(url_id)
+            if trace is not None:
+                trace.enqueued = self.clock()
+
+    def delivered(self, url_id: Optional[str], channel: str, ok: bool):
+        """A channel acknowledged the alert, or gave up on it."""
+        now = self.clock()
+        with self._lock:
+            trace = self._pending.get(url_id or "")
+            if trace is None:
+                return
+            if ok:
+                trace.delivered[channel] = now
+            else:
+                trace.failed.append(channel)
+            if len(trace.delivered) + len(trace.failed) < len(self.channels):
+                return
+            del self._pending[trace.url_id]
+        self._export(trace.to_dict())
+
+    def _export(self, record: dict):
+        self.completed += 1
+        if self.path:
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+            except OSError as e:
+                logging.warning("Could not write alert trace to %s: %s", self.path, e)
+        if self.exporter is not None:
+            self.exporter(record)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest rank percentile, shared by the trace report and the pipeline benchmark."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def load_traces(path: str) -> List[dict]:
+    """Every trace in a TWICKETS_TRACE_FILE."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
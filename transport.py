@@ -0,0 +1,345 @@
+""" module providing a pooled keep-alive http transport for twickets calls """
+
+import bisect
+import http.client
+import select
+import socket
+import threading
+import time
+import weakref
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# brotli.error when it is installed, so a corrupt br body raises ContentDecodingError like gzip does
+BROTLI_ERROR: Tuple[Type[Exception], ...] = (brotli.error,) if brotli is not None else ()
+DECODE_ERRORS: Tuple[Type[Exception], ...] = (zlib.error,) + BROTLI_ERROR
+# brotli 1.2 can cap each call's output, older versions are fed small slices of input instead
+BROTLI_OUTPUT_LIMIT = brotli is not None and hasattr(brotli.Decompressor, "can_accept_more_data")
+BROTLI_INPUT_SLICE = 1024
+
+# what the client can decode, br only when the optional brotli package is installed
+ACCEPT_ENCODING = "gzip, deflate, br" if brotli is not None else "gzip, deflate"
+CHUNK_SIZE = 64 * 1024
+MAX_BODY_SIZE = 64 * 1024 * 1024  # refuse to inflate a response past this
+
+
+class ContentDecodingError(http.client.HTTPException):
+    """A compressed body that was corrupt, or inflated past MAX_BODY_SIZE."""
+
+
+class BodyDecoder:
+    """
+    Incrementally decompresses a body sent with Content-Encoding gzip, deflate or br,
+    so a large listing payload is inflated chunk by chunk as it is read off the socket.
+    deflate is meant to be zlib wrapped but some servers send raw deflate, which is
+    detected from the first bytes.
+    """
+
+    def __init__(self, encoding: str, max_size: int = MAX_BODY_SIZE):
+        self.encoding = encoding
+        self.max_size = max_size
+        self.size = 0
+        self._head = b""  # deflate bytes held back until the zlib header can be checked
+        self._decompressor: Any = None
+        if encoding in ("gzip", "x-gzip"):
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == "br":
+            if brotli is None:
+                raise ContentDecodingError("br encoded response but brotli is not installed")
+            self._decompressor = brotli.Decompressor()
+        elif encoding != "deflate":
+            raise ContentDecodingError(f"Unsupported Content-Encoding {encoding}")
+
+    def _check(self, data: bytes) -> bytes:
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise ContentDecodingError(f"Decompressed body larger than {self.max_size} bytes")
+        return data
+
+    def feed(self, chunk: bytes) -> bytes:
+        """Decompress the next chunk read off the wire."""
+        if not chunk:
+            return b""
+        if self._decompressor is None:
+            chunk = self._head + chunk
+            if len(chunk) < 2:
+                self._head = chunk
+                return b""
+            # a zlib header is a deflate method nibble, with the first two bytes a multiple of 31
+            wrapped = chunk[0] & 0x0f == 8 and (chunk[0] << 8 | chunk[1]) % 31 == 0
+            self._decompressor = zlib.decompressobj(zlib.MAX_WBITS if wrapped else -zlib.MAX_WBITS)
+        try:
+            if self.encoding == "br":
+                return self._feed_brotli(chunk)
+            # capped one byte past the limit, so a compression bomb stops as soon as it overflows
+            return self._check(self._decompressor.decompress(chunk, self.max_size - self.size + 1))
+        except DECODE_ERRORS as e:
+            raise ContentDecodingError(f"Could not decode {self.encoding} body: {e}") from e
+
+    def _feed_brotli(self, chunk: bytes) -> bytes:
+        """Brotli has no max_length, so its output is capped per call or its input fed a slice at a time."""
+        decompressor = self._decompressor
+        parts = []
+        if BROTLI_OUTPUT_LIMIT:
+            parts.append(self._check(decompressor.process(chunk, output_buffer_limit=self.max_size - self.size + 1)))
+            while not decompressor.can_accept_more_data():
+                parts.append(self._check(decompressor.process(b"", output_buffer_limit=self.max_size - self.size + 1)))
+        else:
+            for start in range(0, len(chunk), BROTLI_INPUT_SLICE):
+                parts.append(self._check(decompressor.process(chunk[start:start + BROTLI_INPUT_SLICE])))
+        return b"".join(parts)
+
+    def finish(self) -> bytes:
+        """Whatever the decompressor still buffers once the body has been read."""
+        if self._decompressor is None:
+            if self._head:
+                raise ContentDecodingError(f"Truncated {self.encoding} body")
+            return b""
+        if self.encoding == "br":
+            if not self._decompressor.is_finished():
+                raise ContentDecodingError(f"Truncated {self.encoding} body")
+            return b""
+        return self._check(self._decompressor.flush())
+
+
+class LatencyHistogram:
+    """Fixed bucket latency histogram, in seconds."""
+    BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float):
+        """Record one observation."""
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile, inf if past the last bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+@dataclass
+class TransportMetrics:
+    """Counters showing how often a poll paid for a fresh TCP+TLS handshake."""
+    requests: int = 0
+    handshakes: int = 0
+    reuses: int = 0
+    stale_discards: int = 0
+    failures: int = 0
+    aborted: int = 0
+    wire_bytes: int = 0  # body bytes as received, compressed or not
+    body_bytes: int = 0  # body bytes after decompression
+    handshake_seconds: float = 0.0
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+    @property
+    def reuse_rate(self) -> float:
+        """Fraction of requests sent over an already open connection."""
+        return self.reuses / self.requests if self.requests else 0.0
+
+    @property
+    def compression_ratio(self) -> float:
+        """Decompressed over received body bytes, 1 when nothing was compressed."""
+        return self.body_bytes / self.wire_bytes if self.wire_bytes else 1.0
+
+    def summary(self) -> str:
+        """One line summary for logging."""
+        return (f"requests={self.requests} handshakes={self.handshakes} reuses={self.reuses} "
+                f"stale={self.stale_discards} failures={self.failures} aborted={self.aborted} reuse_rate={self.reuse_rate:.2f} "
+                f"p50<={self.latency.quantile(0.5)}s p99<={self.latency.quantile(0.99)}s")
+
+
+@dataclass
+class TransportResponse:
+    """A fully read response, so the connection can go straight back to the pool."""
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+
+
+class ConnectionPool:
+    """
+    Keeps up to max_connections keep-alive connections open between polls. Idle
+    connections are checked for a server side close with a zero timeout select before
+    reuse, and a request that fails on a reused socket is retried once on a new one.
+    Requests run on several worker threads, so metrics are only updated under the lock.
+    """
+    RETRYABLE_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
+
+    def __init__(self, connection_factory: Callable[[], http.client.HTTPConnection], max_connections: int = 2):
+        self.connection_factory = connection_factory
+        self.max_connections = max_connections
+        self.metrics = TransportMetrics()
+        self._idle: List[http.client.HTTPConnection] = []
+        self._busy: Dict[http.client.HTTPConnection, float] = {}  # connections in use, with when the request started
+        # requests answered on each connection since its handshake, forgotten with the connection
+        self._served: "weakref.WeakKeyDictionary[http.client.HTTPConnection, int]" = weakref.WeakKeyDictionary()
+        # connections whose socket abort_stuck shut down, so their failure is not retried
+        self._aborted: "weakref.WeakSet[http.client.HTTPConnection]" = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+    @staticmethod
+    def _is_stale(conn: http.client.HTTPConnection) -> bool:
+        """An idle keep-alive socket should never be readable, if it is the server closed it."""
+        if conn.sock is None:
+            return True
+        try:
+            readable, _, _ = select.select([conn.sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def _checkout(self) -> http.client.HTTPConnection:
+        with self._lock:
+            while self._idle:
+                conn = self._idle.pop()
+                if not self._is_stale(conn):
+                    return conn
+                self.metrics.stale_discards += 1
+                conn.close()
+        return self.connection_factory()
+
+    def _checkin(self, conn: http.client.HTTPConnection):
+        with self._lock:
+            self._idle.append(conn)
+
+    def _connect(self, conn: http.client.HTTPConnection):
+        start = time.perf_counter()
+        conn.connect()
+        with self._lock:
+            self._served[conn] = 0
+            self._aborted.discard(conn)
+            self.metrics.handshakes += 1
+            self.metrics.handshake_seconds += time.perf_counter() - start
+
+    def ensure_connection(self):
+        """Make sure a live connection is ready, only handshaking if none is idle."""
+        with self._slots:
+            conn = self._checkout()
+            if conn.sock is None:
+                self._connect(conn)
+            self._checkin(conn)
+
+    def _read_body(self, response: http.client.HTTPResponse) -> bytes:
+        """Read the body in chunks, decompressing as it arrives if it has a Content-Encoding."""
+        encoding = (response.getheader("Content-Encoding") or "identity").strip().lower()
+        decoder = None if encoding == "identity" else BodyDecoder(encoding)
+        parts = []
+        wire_bytes = 0
+        while True:
+            chunk = response.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            wire_bytes += len(chunk)
+            parts.append(decoder.feed(chunk) if decoder else chunk)
+        if decoder:
+            parts.append(decoder.finish())
+        data = b"".join(parts)
+        with self._lock:
+            self.metrics.wire_bytes += wire_bytes
+            self.metrics.body_bytes += len(data)
+        return data
+
+    def _send(self, conn, method: str, url: str, body, headers) -> Tuple[http.client.HTTPResponse, bytes]:
+        conn.request(method, url, body=body, headers=headers or {})
+        response = conn.getresponse()
+        data = self._read_body(response)
+        with self._lock:
+            self._served[conn] = self._served.get(conn, 0) + 1
+        return response, data
+
+    def request(self, method: str, url: str, body=None, headers: Optional[dict] = None) -> TransportResponse:
+        """Send a request over a pooled connection and read the whole response."""
+        with self._slots:
+            conn = self._checkout()
+            with self._lock:
+                self._busy[conn] = time.monotonic()
+            start = time.perf_counter()
+            try:
+                response, data = self._send_with_retry(conn, method, url, body, headers)
+            except Exception:
+                with self._lock:
+                    self.metrics.failures += 1
+                    self._busy.pop(conn, None)
+                conn.close()
+                raise
+            with self._lock:
+                self.metrics.requests += 1
+                self.metrics.latency.observe(time.perf_counter() - start)
+                self._busy.pop(conn, None)
+            if response.will_close:
+                conn.close()
+            else:
+                self._checkin(conn)
+            headers_dict = {key.lower(): value for key, value in response.getheaders()}
+            return TransportResponse(response.status, headers_dict, data)
+
+    def _send_with_retry(self, conn, method: str, url: str, body, headers) -> Tuple[http.client.HTTPResponse, bytes]:
+        if conn.sock is None:
+            self._connect(conn)
+            return self._send(conn, method, url, body, headers)
+        with self._lock:
+            reused = self._served.get(conn, 0) > 0
+        try:
+            response, data = self._send(conn, method, url, body, headers)
+        except self.RETRYABLE_ERRORS:
+            with self._lock:
+                aborted = conn in self._aborted
+            if aborted:
+                raise
+            # the server dropped the idle socket between the select and the send
+            with self._lock:
+                self.metrics.stale_discards += 1
+            conn.close()
+            self._connect(conn)
+            return self._send(conn, method, url, body, headers)
+        if reused:
+            with self._lock:
+                self.metrics.reuses += 1
+        return response, data
+
+    def abort_stuck(self, older_than: float) -> int:
+        """
+        Shut down the sockets of requests running for longer than older_than seconds,
+        so a reply that trickles in under the socket timeout cannot hang a poll forever.
+        """
+        now = time.monotonic()
+        with self._lock:
+            stuck = [conn for conn, started in self._busy.items() if now - started > older_than and conn.sock]
+            for conn in stuck:
+                del self._busy[conn]
+                self._aborted.add(conn)
+            self.metrics.aborted += len(stuck)
+        for conn in stuck:
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+            except (AttributeError, OSError):
+                pass
+        return len(stuck)
+
+    def close(self):
+        """Close every idle connection, the next request will handshake again."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
@@ -0,0 +1,153 @@
+""" module for matching every listing of a large response at once, over numpy columns instead of per listing properties """
+
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Iterable, List, Optional, cast
+
+import numpy as np
+
+from matching import TicketMatcher, TicketRule, get_matcher
+from ticketalertresponse import PRICE_KEYS, AnyResponseDatum, LazyResponseDatum, TicketAlertResponse
+
+
+def _needed_columns(rules: Iterable[TicketRule]) -> FrozenSet[str]:
+    """Columns the rules read, beyond the ticket counts every rule checks."""
+    needed = set()
+    for rule in rules:
+        if rule.labels:
+            needed.add("labels")
+        if rule.areas:
+            needed.add("areas")
+        if rule.sections:
+            needed.add("sections")
+        if rule.delivery_methods:
+            needed.add("delivery_methods")
+        if rule.max_price is not None:
+            needed.add(rule.price_field)
+    return frozenset(needed)
+
+
+@dataclass(slots=True)
+class ListingColumns:
+    """
+    One response as flat arrays. Per listing columns have one row per listing, per ticket
+    and per delivery method columns carry the index of their listing alongside. Strings
+    are replaced by codes into the vocabularies, which are local to the response.
+    """
+    size: int
+    ticket_counts: np.ndarray
+    ticket_listing: np.ndarray
+    label_codes: np.ndarray
+    area_codes: np.ndarray
+    section_codes: np.ndarray
+    delivery_listing: np.ndarray
+    delivery_codes: np.ndarray
+    prices: Dict[str, np.ndarray] = field(default_factory=dict)
+    vocabularies: Dict[str, Dict[str, int]] = field(default_factory=dict)
+
+    @staticmethod
+    def from_response(response: TicketAlertResponse, needed: Iterable[str] = ("labels", "areas", "sections",
+                      "delivery_methods", "net_selling_price", "face_value")) -> 'ListingColumns':
+        """Build the columns in one pass over the listings, skipping those not in needed."""
+        needed = frozenset(needed)
+        vocabularies: Dict[str, Dict[str, int]] = {"labels": {}, "areas": {}, "sections": {}, "delivery_methods": {}}
+        labels, areas, sections = vocabularies["labels"], vocabularies["areas"], vocabularies["sections"]
+        delivery_methods = vocabularies["delivery_methods"]
+        price_fields = [name for name in ("net_selling_price", "face_value") if name in needed]
+        counts: List[int] = []
+        label_codes: List[int] = []
+        area_codes: List[int] = []
+        section_codes: List[int] = []
+        delivery_listing: List[int] = []
+        delivery_codes: List[int] = []
+        prices: Dict[str, List[int]] = {name: [] for name in price_fields}
+        want_labels, want_areas, want_sections = "labels" in needed, "areas" in needed, "sections" in needed
+        want_delivery = "delivery_methods" in needed
+        for index, item in enumerate(response.response_data):
+            item_labels = item.labels
+            counts.append(len(item_labels))
+            if want_labels:
+                label_codes.extend([labels.setdefault(label, len(labels)) for label in item_labels])
+            # lazy listings are read from their raw dict rather than through the decoding properties
+            raw = item.raw if isinstance(item, LazyResponseDatum) else None
+            if want_areas:
+                # missing values read as "" like the listing properties, no rule names an empty area
+                area = (raw.get("area") if raw is not None else item.area) or ""
+                area_codes.append(areas.setdefault(area, len(areas)))
+            if want_sections:
+                section = (raw.get("section") if raw is not None else item.section) or ""
+                section_codes.append(sections.setdefault(section, len(sections)))
+            if want_delivery:
+                methods = (raw.get("deliveryMethodTypes") or ()) if raw is not None else item.delivery_method_types
+                delivery_listing.extend([index] * len(methods))
+                delivery_codes.extend([delivery_methods.setdefault(method, len(delivery_methods)) for method in methods])
+            for name in price_fields:
+                if raw is not None:
+                    key = PRICE_KEYS[name]
+                    prices[name].extend([price.get(key) for price in raw["pricing"]["prices"]])
+                else:
+                    prices[name].extend([getattr(price, name) for price in item.pricing.prices])
+        ticket_counts = np.array(counts, dtype=np.int32)
+        return ListingColumns(
+            size=len(counts),
+            ticket_counts=ticket_counts,
+            ticket_listing=np.repeat(np.arange(len(counts), dtype=np.int32), ticket_counts),
+            label_codes=np.array(label_codes, dtype=np.int32),
+            area_codes=np.array(area_codes, dtype=np.int32),
+            section_codes=np.array(section_codes, dtype=np.int32),
+            delivery_listing=np.array(delivery_listing, dtype=np.int32),
+            delivery_codes=np.array(delivery_codes, dtype=np.int32),
+            prices={name: np.array(values, dtype=np.int64) for name, values in prices.items()},
+            vocabularies=vocabularies,
+        )
+
+    def codes(self, column: str, values: Iterable[str]) -> np.ndarray:
+        """Codes of the values that occur in the response, values that do not cannot match anyway."""
+        vocabulary = self.vocabularies[column]
+        return np.array([vocabulary[value] for value in values if value in vocabulary], dtype=np.int32)
+
+    def per_listing(self, listing: np.ndarray, flags: np.ndarray) -> np.ndarray:
+        """How many flagged per ticket or per delivery method rows each listing has."""
+        return np.bincount(listing[flags], minlength=self.size)
+
+
+def rule_mask(rule: TicketRule, columns: ListingColumns) -> np.ndarray:
+    """Boolean mask of the listings rule matches, the same checks as TicketRule.compile."""
+    counts = columns.ticket_counts
+    if rule.max_quantity is not None and rule.min_quantity == rule.max_quantity:
+        mask = counts == rule.min_quantity
+    else:
+        mask = counts >= rule.min_quantity
+        if rule.max_quantity is not None:
+            mask &= counts <= rule.max_quantity
+    if rule.labels and mask.any():
+        # every ticket in the listing needs an allowed label
+        other_labels = ~np.isin(columns.label_codes, columns.codes("labels", rule.labels))
+        mask &= columns.per_listing(columns.ticket_listing, other_labels) == 0
+    if rule.areas and mask.any():
+        mask &= np.isin(columns.area_codes, columns.codes("areas", rule.areas))
+    if rule.sections and mask.any():
+        mask &= np.isin(columns.section_codes, columns.codes("sections", rule.sections))
+    if rule.delivery_methods and mask.any():
+        allowed = np.isin(columns.delivery_codes, columns.codes("delivery_methods", rule.delivery_methods))
+        mask &= columns.per_listing(columns.delivery_listing, allowed) > 0
+    if rule.max_price is not None and mask.any():
+        too_dear = columns.prices[rule.price_field] > rule.max_price
+        mask &= columns.per_listing(columns.ticket_listing, too_dear) == 0
+    return mask
+
+
+def match_indices(response: TicketAlertResponse, matcher: Optional[TicketMatcher] = None) -> np.ndarray:
+    """Indices into response.response_data of the listings at least one rule matches, in order."""
+    matcher = matcher or get_matcher()
+    columns = ListingColumns.from_response(response, _needed_columns(matcher.rules))
+    mask = np.zeros(columns.size, dtype=bool)
+    for rule in matcher.rules:
+        mask |= rule_mask(rule, columns)
+    return np.flatnonzero(mask)
+
+
+def required_listings(response: TicketAlertResponse, matcher: Optional[TicketMatcher] = None) -> List[AnyResponseDatum]:
+    """The listings TicketAlertResponse.required_tickets would yield, matched in bulk."""
+    data = response.response_data
+    indices = cast(List[int], match_indices(response, matcher).tolist())
+    return [data[index] for index in indices]